@@ -40,4 +40,85 @@ JWP_DURATION = 60000
 
 LINE_ITEMS_LIMIT = 450
 
-DEFAULT_APDOD_CACHE_URL = 'https://ow.pubmatic.com'
\ No newline at end of file
+DEFAULT_APDOD_CACHE_URL = 'https://ow.pubmatic.com'
+
+# Max number of objects sent in a single create call to DFP
+TARGETING_VALUES_PER_REQUEST = 500
+
+# Max number of concurrent requests issued to DFP by a batch operation
+MAX_CONCURRENT_REQUESTS = 4
+
+# Max number of line items sent in a single createLineItems call
+LINE_ITEMS_PER_REQUEST = 200
+
+# Results read per page of a get*ByStatement call (the API max is 500)
+STATEMENT_PAGE_SIZE = 500
+
+# Max number of creative names bound in a single creative lookup statement
+CREATIVE_NAMES_PER_STATEMENT = 500
+
+# Retries of a failed batch request, and the base delay (in seconds) of the
+# exponential backoff between attempts
+BATCH_MAX_RETRIES = 3
+BATCH_RETRY_BACKOFF_SECONDS = 1
+
+# API errors worth retrying. Anything else (validation, uniqueness, limits)
+# fails the same way every time.
+TRANSIENT_DFP_ERRORS = (
+  'QuotaError.EXCEEDED_QUOTA',
+  'ServerError.SERVER_ERROR',
+  'ServerError.SERVER_BUSY',
+  'InternalApiError.UNEXPECTED_INTERNAL_API_ERROR',
+  'CommonError.CONCURRENT_MODIFICATION',
+)
+
+# Max number of line item <> creative associations sent in a single
+# createLineItemCreativeAssociations call
+LICAS_PER_REQUEST = 500
+
+# Dry-run planning: estimated latency of a DFP call, as a fixed cost per
+# request plus a cost per object sent in it (seconds)
+PLAN_REQUEST_LATENCY_SECONDS = 0.5
+PLAN_OBJECT_LATENCY_SECONDS = {
+  'default': 0.01,
+  'createCustomTargetingValues': 0.004,
+  'createCreatives': 0.05,
+  'createLineItems': 0.04,
+  'createLineItemCreativeAssociations': 0.004,
+}
+
+# Per-request limits enforced by the fake DFP backend (settings.DFP_BACKEND):
+# objects per create/update call, concurrent requests before QuotaError, and
+# max results per page of a statement
+FAKE_DFP_MAX_OBJECTS_PER_REQUEST = 1000
+FAKE_DFP_MAX_CONCURRENT_REQUESTS = 8
+FAKE_DFP_PAGE_LIMIT = 500
+
+# Number of recent jobs whose traced spans are kept in memory
+TRACING_MAX_JOBS = 50
+
+# Estimated request size of a traced DFP call per object sent (bytes), so
+# payloads aren't serialized a second time just to be measured. Statements
+# count as one object.
+TRACING_OBJECT_BYTES = {
+  'default': 250,
+  'createCustomTargetingValues': 90,
+  'createCreatives': 450,
+  'createLineItems': 950,
+  'updateLineItems': 950,
+  'createLineItemCreativeAssociations': 80,
+}
+
+# Lookup cache (settings.LOOKUP_CACHE_FILE): seconds a found entity is
+# trusted per entity type, seconds a missing one is, and max cached entries
+LOOKUP_CACHE_TTL_SECONDS = {
+  'order': 3600,
+  'advertiser': 86400,
+  'placement': 86400,
+  'ad_unit': 86400,
+  'root_ad_unit': 7 * 86400,
+  'creative_template': 86400,
+  'user': 86400,
+}
+LOOKUP_CACHE_NEGATIVE_TTL_SECONDS = 300
+LOOKUP_CACHE_MAX_ENTRIES = 10000
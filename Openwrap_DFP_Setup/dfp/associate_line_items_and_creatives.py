@@ -1,8 +1,24 @@
 
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 from googleads import ad_manager
 
+from Openwrap_DFP_Setup import constant
+from Openwrap_DFP_Setup.dfp.batch_utils import (
+  call_with_retry,
+  chunk_list,
+  submit_in_context
+)
 from Openwrap_DFP_Setup.dfp.client import get_client
+from Openwrap_DFP_Setup.dfp.create_line_items import (
+  collect_line_item_ids,
+  iter_line_item_chunks
+)
+from Openwrap_DFP_Setup.dfp.exceptions import DFPBatchException
+from Openwrap_DFP_Setup.dfp.journal import get_lica_key, get_line_item_key
+from Openwrap_DFP_Setup.dfp.paginate import paginate
 
 
 logger = logging.getLogger(__name__)
@@ -70,3 +86,269 @@ def make_licas(line_item_ids, creative_ids, size_overrides=[], setup_type= None,
       u'Created {0} line item <> creative associations.'.format(len(licas)))
   else:
     logger.info(u'No line item <> creative associations created.')
+
+
+def iter_lica_batches(line_item_ids, creative_ids, size_overrides=[],
+  setup_type=None, slot=None, durations=None, batch_size=None, skip=None):
+  """
+  Lazily builds line item <> creative associations in batches.
+
+  Args:
+    line_item_ids (iterable): line item IDs, may be a generator
+    creative_ids (arr): an array of creative IDs
+    slot(string): slot name in case of setup_type = ADPOD
+    durations(int array): creative durations for ADPOD.
+    batch_size (int): LICAs per batch, defaults to constant.LICAS_PER_REQUEST
+    skip (set): (line item ID, creative ID) pairs already associated
+  Yields:
+    arrays of LICA configs, each at most `batch_size` long
+  """
+  if batch_size is None:
+    batch_size = constant.LICAS_PER_REQUEST
+
+  sizes = list(size_overrides)
+
+  batch = []
+  for line_item_id in line_item_ids:
+    for i, creative_id in enumerate(creative_ids):
+      # set creativeSetId for video line items
+      if setup_type in ('JWPLAYER', 'VIDEO', 'IN_APP_VIDEO'):
+        lica = {
+          'creativeSetId': creative_id,
+          'lineItemId': line_item_id,
+          'sizes': sizes
+        }
+      elif setup_type == 'ADPOD':
+        lica = {
+          'creativeSetId': creative_id,
+          'lineItemId': line_item_id,
+          'sizes': sizes,
+          'targetingName': "{}_{}second_ad".format(slot, durations[i])
+        }
+      else:
+        lica = {
+          'creativeId': creative_id,
+          'lineItemId': line_item_id,
+          'sizes': sizes
+        }
+      if skip and get_lica_key(lica) in skip:
+        continue
+      batch.append(lica)
+      if len(batch) >= batch_size:
+        yield batch
+        batch = []
+  if batch:
+    yield batch
+
+def find_licas(line_item_ids):
+  """
+  Gets the creative associations of line items.
+
+  Args:
+    line_item_ids (arr): the IDs of the line items
+  Returns:
+    an array of DFP LICAs
+  """
+  line_item_ids = sorted(set(int(line_item_id) for line_item_id in line_item_ids))
+  if not line_item_ids:
+    return []
+  lica_service = get_client().GetService(
+    'LineItemCreativeAssociationService', version='v202502')
+  licas = []
+  for chunk in chunk_list(line_item_ids, constant.STATEMENT_PAGE_SIZE):
+    bind_names = ['lineItemId{0}'.format(i) for i in range(len(chunk))]
+    query = 'WHERE lineItemId IN ({0})'.format(
+      ', '.join(':' + bind_name for bind_name in bind_names))
+    values = [{
+      'key': bind_name,
+      'value': {
+        'xsi_type': 'NumberValue',
+        'value': line_item_id
+      }
+    } for bind_name, line_item_id in zip(bind_names, chunk)]
+    licas.extend(paginate(
+      lica_service.getLineItemCreativeAssociationsByStatement, query, values,
+      label='LICAs'))
+  return licas
+
+def _find_lica_batch(batch):
+  # The associations of a batch that seemed to fail may have been made
+  found = {}
+  for lica in find_licas([lica['lineItemId'] for lica in batch]):
+    found.setdefault(get_lica_key(lica), lica)
+  licas = [found.get(get_lica_key(lica)) for lica in batch]
+  return licas if all(lica is not None for lica in licas) else None
+
+def make_licas_streaming(line_item_ids, creative_ids, size_overrides=[],
+  setup_type=None, slot=None, durations=None, batch_size=None,
+  max_workers=None, retries=None, checkpoint=None, skip=None):
+  """
+  Attaches creatives to line items in DFP, sending LICA batches concurrently
+  as soon as they are built. `line_item_ids` may be a generator, so batches
+  start while line items are still being created.
+
+  A batch that fails every retry is counted and skipped; the others go on,
+  and the failure is raised once they are done.
+
+  Args:
+    line_item_ids (iterable): line item IDs, may be a generator
+    creative_ids (arr): an array of creative IDs
+    slot(string): slot name in case of setup_type = ADPOD
+    durations(int array): creative durations for ADPOD.
+    batch_size (int): LICAs per request, defaults to constant.LICAS_PER_REQUEST
+    max_workers (int): max number of concurrent requests, defaults to
+      constant.MAX_CONCURRENT_REQUESTS
+    retries (int): retries per batch, defaults to constant.BATCH_MAX_RETRIES
+    checkpoint: a JobJournal; associations it recorded are skipped and the
+      ones made are recorded in it
+    skip (set): get_lica_key() of other associations that already exist
+  Returns:
+    a dict: counts of created and failed LICAs and batches
+  Raises:
+    DFPBatchException: if some batches failed, carrying the counts and the
+      (batch index, exception) of each failure
+  """
+  if max_workers is None:
+    max_workers = constant.MAX_CONCURRENT_REQUESTS
+  if retries is None:
+    retries = constant.BATCH_MAX_RETRIES
+
+  skip = set(skip or ())
+  if checkpoint is not None:
+    skip.update(checkpoint.licas)
+  counts = {'created': 0, 'failed': 0, 'batches': 0, 'failed_batches': 0}
+  errors = []
+  counts_lock = threading.Lock()
+  # Bounds the batches waiting in the pool, so the cross product is never
+  # fully materialized in memory.
+  in_flight = threading.BoundedSemaphore(max_workers * 2)
+
+  def create_batch(batch):
+    lica_service = get_client().GetService(
+      'LineItemCreativeAssociationService', version='v202502')
+    return lica_service.createLineItemCreativeAssociations(batch)
+
+  def send(index, batch):
+    try:
+      created = call_with_retry(create_batch, batch, index=index,
+        retries=retries, label='LICA creation', lookup=_find_lica_batch)
+      if checkpoint is not None:
+        checkpoint.record_licas(batch)
+      with counts_lock:
+        counts['created'] += len(created or [])
+    except Exception as e:
+      with counts_lock:
+        counts['failed'] += len(batch)
+        counts['failed_batches'] += 1
+        errors.append((index, e))
+    finally:
+      in_flight.release()
+
+  with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    for index, batch in enumerate(iter_lica_batches(line_item_ids,
+        creative_ids, size_overrides, setup_type, slot, durations,
+        batch_size, skip)):
+      in_flight.acquire()
+      counts['batches'] += 1
+      submit_in_context(executor, send, index, batch)
+
+  logger.info(
+    u'Created {created} line item <> creative associations in {batches} '
+    'batches ({failed} in {failed_batches} failed batches).'.format(**counts))
+  if counts['failed']:
+    errors.sort(key=lambda error: error[0])
+    raise DFPBatchException(
+      'Failed to create {failed} of {total} line item <> creative associations '
+      'in {failed_batches} of {batches} batches: {error}'.format(
+        total=counts['created'] + counts['failed'], error=errors[0][1], **counts),
+      errors=errors, counts=counts)
+  return counts
+
+def create_line_items_and_licas(line_items, creative_ids, size_overrides=[],
+  setup_type=None, slot=None, durations=None, chunk_size=None,
+  batch_size=None, max_workers=None, checkpoint=None,
+  existing_line_item_ids=None):
+  """
+  Creates line items and attaches creatives to them, overlapping the two:
+  LICAs for a chunk of line items are sent as soon as that chunk is created.
+
+  Line items that already exist, e.g. those reconcile_line_items() kept or
+  updated, get the associations they miss: their LICAs are fetched first and
+  only the missing pairs are created.
+
+  With a checkpoint (a JobJournal), line items and LICAs recorded by an
+  earlier attempt of the job are not created again, and the ones created
+  are recorded as each request succeeds.
+
+  Args:
+    line_items (arr): an array of line item configs
+    creative_ids (arr): an array of creative IDs
+    slot(string): slot name in case of setup_type = ADPOD
+    durations(int array): creative durations for ADPOD.
+    chunk_size (int): line items per request
+    batch_size (int): LICAs per request
+    max_workers (int): max number of concurrent requests per stage
+    checkpoint: a JobJournal, to resume from and record progress in
+    existing_line_item_ids (arr): IDs of line items already in DFP to attach
+      the creatives to as well
+  Returns:
+    a tuple: (line item IDs of `line_items` in input order, LICA counts)
+  Raises:
+    DFPBatchException: if line item chunks or LICA batches failed, after the
+      LICAs of the created line items have been made. Line item failures are
+      raised first; a LICA failure carries the line item IDs as created_ids.
+  """
+  if chunk_size is None:
+    chunk_size = constant.LINE_ITEMS_PER_REQUEST
+  created = checkpoint.line_items if checkpoint is not None else {}
+  pending = [line_item for line_item in line_items
+             if get_line_item_key(line_item) not in created]
+  if len(pending) < len(line_items):
+    logger.info(u'Resuming: {0} of {1} line items were created before.'.format(
+      len(line_items) - len(pending), len(line_items)))
+  # Known IDs by position in line_items, filled as chunks are created
+  line_item_ids = [created.get(get_line_item_key(line_item))
+                   for line_item in line_items]
+  chunks = chunk_list(pending, chunk_size)
+  chunk_results = {}
+  existing_line_item_ids = list(existing_line_item_ids or [])
+  existing_licas = set(get_lica_key(lica)
+                       for lica in find_licas(existing_line_item_ids))
+
+  def created_line_item_ids():
+    # Existing line items and those created before may still miss some of
+    # their LICAs
+    for line_item_id in existing_line_item_ids:
+      yield line_item_id
+    for line_item_id in line_item_ids:
+      if line_item_id is not None:
+        yield line_item_id
+    for index, result in iter_line_item_chunks(pending,
+        chunk_size=chunk_size, max_workers=max_workers):
+      chunk_results[index] = result
+      if not isinstance(result, Exception):
+        if checkpoint is not None:
+          checkpoint.record_line_items(chunks[index], result)
+        for line_item_id in result:
+          yield line_item_id
+
+  lica_error = None
+  try:
+    lica_counts = make_licas_streaming(created_line_item_ids(), creative_ids,
+      size_overrides=size_overrides, setup_type=setup_type, slot=slot,
+      durations=durations, batch_size=batch_size, max_workers=max_workers,
+      checkpoint=checkpoint, skip=existing_licas)
+  except DFPBatchException as e:
+    lica_error = e
+    lica_counts = e.counts
+
+  if len(pending) == len(line_items):
+    line_item_ids = collect_line_item_ids(chunk_results)
+  else:
+    new_ids = iter(collect_line_item_ids(chunk_results))
+    line_item_ids = [line_item_id if line_item_id is not None else next(new_ids)
+                     for line_item_id in line_item_ids]
+  if lica_error is not None:
+    lica_error.created_ids = line_item_ids
+    raise lica_error
+  return line_item_ids, lica_counts
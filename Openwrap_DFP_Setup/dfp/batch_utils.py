@@ -0,0 +1,206 @@
+
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from Openwrap_DFP_Setup import constant
+
+try:
+  from requests.exceptions import ConnectionError as RequestsConnectionError
+  from requests.exceptions import Timeout as RequestsTimeout
+  _TRANSIENT_EXCEPTIONS = (TimeoutError, ConnectionError,
+    RequestsConnectionError, RequestsTimeout)
+except ImportError:
+  _TRANSIENT_EXCEPTIONS = (TimeoutError, ConnectionError)
+
+
+logger = logging.getLogger(__name__)
+
+def chunk_list(items, chunk_size):
+  """
+  Splits a list into consecutive chunks.
+
+  Args:
+    items (arr): the items to split
+    chunk_size (int): the max number of items per chunk
+  Returns:
+    an array of arrays: the chunks, in input order
+  """
+  if chunk_size < 1:
+    raise ValueError('chunk_size must be at least 1')
+  return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+def submit_in_context(executor, func, *args):
+  """
+  Submits `func` to an executor so it runs in a copy of the caller's
+  context, e.g. with the client set by client.use_client().
+
+  Returns:
+    a Future
+  """
+  return executor.submit(contextvars.copy_context().run, func, *args)
+
+def get_error_reasons(error):
+  """
+  Returns the API error reasons of an exception, e.g.
+  ['QuotaError.EXCEEDED_QUOTA'], or an empty array for other exceptions.
+  """
+  reason = getattr(error, 'reason', None)
+  if reason:
+    return [str(reason)]
+  reasons = []
+  for api_error in getattr(error, 'errors', None) or []:
+    try:
+      reasons.append(str(api_error['errorString']))
+    except (KeyError, TypeError):
+      reasons.append(str(getattr(api_error, 'errorString', api_error)))
+  return reasons
+
+def is_transient_error(error):
+  """
+  Whether a failed call may succeed if sent again: quota and server errors
+  of the API, timeouts and connection errors.
+  """
+  if isinstance(error, _TRANSIENT_EXCEPTIONS):
+    return True
+  reasons = get_error_reasons(error)
+  return bool(reasons) and all(
+    reason in constant.TRANSIENT_DFP_ERRORS for reason in reasons)
+
+def call_with_retry(func, chunk, index=0, total=None, retries=0,
+  backoff_seconds=None, label='Batch', lookup=None):
+  """
+  Calls `func` on a chunk, retrying transient failures with exponential
+  backoff and logging the latency of the call. Other failures are raised at
+  once, as they would fail again.
+
+  A create call that timed out may still have gone through. With `lookup`,
+  the objects of the chunk are looked up before it is sent again, and if
+  they all exist their lookup result is returned instead.
+
+  Args:
+    func (function): called with the chunk
+    chunk (arr): the chunk to process
+    index (int): position of the chunk, used for logging
+    total (int): total number of chunks if known, used for logging
+    retries (int): how many times a failed call is retried
+    backoff_seconds (float): base delay of the exponential backoff, defaults
+      to constant.BATCH_RETRY_BACKOFF_SECONDS
+    label (str): name of the operation, used for logging
+    lookup (function): called with the chunk before a retry, returns what
+      `func` would have returned if the chunk was already processed, else
+      None
+  Returns:
+    the result of `func`
+  """
+  if backoff_seconds is None:
+    backoff_seconds = constant.BATCH_RETRY_BACKOFF_SECONDS
+
+  position = '{0}/{1}'.format(index + 1, total) if total else str(index + 1)
+  attempt = 0
+  while True:
+    attempt += 1
+    start = time.time()
+    try:
+      result = func(chunk)
+    except Exception as e:
+      elapsed = time.time() - start
+      if attempt > retries or not is_transient_error(e):
+        logger.error(u'{label} chunk {position} failed after {attempts} '
+          'attempt(s) ({elapsed:.2f}s): {error}'.format(label=label,
+            position=position, attempts=attempt, elapsed=elapsed, error=e))
+        raise
+      delay = backoff_seconds * (2 ** (attempt - 1))
+      logger.warning(u'{label} chunk {position} failed on attempt '
+        '{attempt} ({elapsed:.2f}s), retrying in {delay}s: {error}'.format(
+          label=label, position=position, attempt=attempt, elapsed=elapsed,
+          delay=delay, error=e))
+      time.sleep(delay)
+      if lookup is not None:
+        found = lookup(chunk)
+        if found is not None:
+          logger.info(u'{label} chunk {position} was processed despite the '
+            'error, not sending it again.'.format(label=label, position=position))
+          return found
+      continue
+
+    logger.info(u'{label} chunk {position} ({size} items) done in '
+      '{elapsed:.2f}s.'.format(label=label, position=position,
+        size=len(chunk), elapsed=time.time() - start))
+    return result
+
+def iter_chunks(func, chunks, max_workers=None, retries=0,
+  backoff_seconds=None, label='Batch', lookup=None):
+  """
+  Calls `func` on every chunk using a bounded pool of worker threads and
+  yields the results as soon as each chunk is done.
+
+  Args:
+    func (function): called with a single chunk
+    chunks (arr): the chunks to process
+    max_workers (int): max number of concurrent calls, defaults to
+      constant.MAX_CONCURRENT_REQUESTS
+    retries (int): how many times a failed chunk is retried
+    backoff_seconds (float): base delay of the exponential backoff between
+      retries
+    label (str): name of the operation, used when logging chunk latencies
+    lookup (function): see call_with_retry()
+  Yields:
+    (index, result) tuples in completion order. If a chunk failed every
+      attempt, result is the exception it raised.
+  """
+  if max_workers is None:
+    max_workers = constant.MAX_CONCURRENT_REQUESTS
+  max_workers = max(1, min(max_workers, len(chunks)))
+  total = len(chunks)
+
+  def run(index, chunk):
+    try:
+      return call_with_retry(func, chunk, index, total, retries,
+        backoff_seconds, label, lookup)
+    except Exception as e:
+      return e
+
+  if max_workers == 1:
+    for index, chunk in enumerate(chunks):
+      yield index, run(index, chunk)
+    return
+
+  with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    futures = {submit_in_context(executor, run, index, chunk): index
+               for index, chunk in enumerate(chunks)}
+    for future in as_completed(futures):
+      yield futures[future], future.result()
+
+def run_chunks(func, chunks, max_workers=None, retries=0,
+  backoff_seconds=None, label='Batch', return_exceptions=False, lookup=None):
+  """
+  Calls `func` on every chunk using a bounded pool of worker threads.
+
+  Args:
+    func (function): called with a single chunk
+    chunks (arr): the chunks to process
+    max_workers (int): max number of concurrent calls, defaults to
+      constant.MAX_CONCURRENT_REQUESTS
+    retries (int): how many times a failed chunk is retried
+    backoff_seconds (float): base delay of the exponential backoff between
+      retries, defaults to constant.BATCH_RETRY_BACKOFF_SECONDS
+    label (str): name of the operation, used when logging chunk latencies
+    return_exceptions (bool): if True, the exception of a chunk that failed
+      every attempt is returned in its slot instead of being raised
+    lookup (function): see call_with_retry()
+  Returns:
+    an array: the result of `func` for every chunk, in input order
+  """
+  results = [None] * len(chunks)
+  for index, result in iter_chunks(func, chunks, max_workers=max_workers,
+      retries=retries, backoff_seconds=backoff_seconds, label=label,
+      lookup=lookup):
+    results[index] = result
+
+  if not return_exceptions:
+    for result in results:
+      if isinstance(result, Exception):
+        raise result
+  return results
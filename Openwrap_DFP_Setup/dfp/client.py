@@ -1,10 +1,182 @@
 # In: Openwrap_DFP_Setup/dfp/client.py
 import sys
 import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
 
 from Openwrap_DFP_Setup import settings
+from Openwrap_DFP_Setup.dfp.tracing import TracedClient, TracedService
 from googleads import ad_manager
 
-def get_client():
-    return ad_manager.AdManagerClient.LoadFromStorage(settings.GOOGLEADS_YAML_FILE)
+# Loaded clients keyed by (yaml path, network code). Loading a client parses
+# the YAML and reads the service account key, so we only want to do it once
+# per credentials file and network.
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Client used instead of the configured one by the current context, e.g. the
+# stand-in of a dry run. Batch workers inherit it from the caller's context.
+_client_override = ContextVar('dfp_client_override', default=None)
+
+# Network the current context works on, set by use_network(). Concurrent
+# setups for different networks each get their own client this way, instead
+# of rewriting the network code of the shared credentials file.
+_network_code = ContextVar('dfp_network_code', default=None)
+
+_cache_stats = {
+    'client_hits': 0,
+    'client_misses': 0,
+    'service_hits': 0,
+    'service_misses': 0,
+}
+
+
+class CachedAdManagerClient(object):
+    """
+    Wraps an AdManagerClient and reuses the service stubs built by GetService.
+
+    Stubs are pooled per thread, so concurrent workers never share a SOAP
+    stub while a thread keeps reusing its own, and their calls are traced.
+    Any other attribute is delegated to the wrapped client.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._local = threading.local()
+
+    def GetService(self, service_name, version=None, server=None):
+        services = getattr(self._local, 'services', None)
+        if services is None:
+            services = self._local.services = {}
+
+        key = (service_name, version, server)
+        service = services.get(key)
+        with _clients_lock:
+            if service is None:
+                _cache_stats['service_misses'] += 1
+            else:
+                _cache_stats['service_hits'] += 1
+
+        if service is None:
+            kwargs = {}
+            if version is not None:
+                kwargs['version'] = version
+            if server is not None:
+                kwargs['server'] = server
+            service = TracedService(
+                self._client.GetService(service_name, **kwargs), service_name)
+            services[key] = service
+        return service
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def get_client(network_code=None):
+    """
+    Returns a cached Ad Manager client for the configured googleads.yaml,
+    one per network code.
+
+    Args:
+      network_code (str): network code overriding the one in the YAML,
+        defaults to the one set by use_network()
+    Returns:
+      a CachedAdManagerClient, the client set by use_client(), or the fake
+        client when settings.DFP_BACKEND is 'fake'
+    """
+    override = _client_override.get()
+    if override is not None:
+        return override
+    if getattr(settings, 'DFP_BACKEND', 'live') == 'fake':
+        from Openwrap_DFP_Setup.dfp.fake_client import get_fake_client
+        return TracedClient(get_fake_client())
+
+    if not network_code:
+        network_code = _network_code.get()
+    key = (settings.GOOGLEADS_YAML_FILE, str(network_code) if network_code else None)
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is not None:
+            _cache_stats['client_hits'] += 1
+            return client
+        _cache_stats['client_misses'] += 1
+
+    ad_manager_client = ad_manager.AdManagerClient.LoadFromStorage(
+        settings.GOOGLEADS_YAML_FILE)
+    if network_code:
+        ad_manager_client.network_code = str(network_code)
+    client = CachedAdManagerClient(ad_manager_client)
+
+    with _clients_lock:
+        # Another thread may have loaded the same client meanwhile; keep the
+        # first one so every caller shares its stub pool.
+        client = _clients.setdefault(key, client)
+    return client
+
+
+@contextmanager
+def use_client(client):
+    """
+    Makes get_client() return `client` within the block, in this thread and
+    in the batch workers it starts. Other requests keep the real client.
+
+    Args:
+      client: an object with a GetService(service_name, version=None) method
+    """
+    token = _client_override.set(client)
+    try:
+        yield client
+    finally:
+        _client_override.reset(token)
+
+
+@contextmanager
+def use_network(network_code):
+    """
+    Makes get_client() return the client of `network_code` within the block,
+    in this thread and in the batch workers it starts.
+
+    Args:
+      network_code (str): the network code, or None for the one in the YAML
+    """
+    token = _network_code.set(str(network_code) if network_code else None)
+    try:
+        yield network_code
+    finally:
+        _network_code.reset(token)
+
+
+def invalidate_client_cache(yaml_file=None):
+    """
+    Drops cached clients and their service stubs.
+
+    Call this whenever the credentials file is rewritten.
+
+    Args:
+      yaml_file (str): only drop clients loaded from this file; all if None
+    Returns:
+      an integer: the number of clients dropped
+    """
+    with _clients_lock:
+        keys = [key for key in _clients
+                if yaml_file is None or key[0] == yaml_file]
+        for key in keys:
+            del _clients[key]
+    return len(keys)
+
+
+def get_client_cache_stats():
+    """
+    Returns client and service-stub cache hit/miss counters.
+
+    Returns:
+      a dict with client_hits, client_misses, service_hits, service_misses
+        and the number of cached clients
+    """
+    with _clients_lock:
+        stats = dict(_cache_stats)
+        stats['cached_clients'] = len(_clients)
+    return stats
@@ -1,15 +1,55 @@
 
+import glob
+import hashlib
 import logging
 import os
 import pprint
+import threading
 
-from googleads import ad_manager
-
+from Openwrap_DFP_Setup import constant
+from Openwrap_DFP_Setup.dfp.batch_utils import chunk_list
 from Openwrap_DFP_Setup.dfp.client import get_client
+from Openwrap_DFP_Setup.dfp.paginate import paginate
 
 
 logger = logging.getLogger(__name__)
 
+SNIPPET_DIR = os.path.dirname(__file__)
+
+# Creative snippets by file name, as (mtime, snippet). Loaded once and
+# shared by every creative config built from them.
+_snippets = {}
+_snippets_lock = threading.Lock()
+
+def get_snippet(creative_file):
+  """
+  Returns the content of a creative snippet file in this directory. All
+  creative_snippet_*.html files are loaded on first use, and a file is read
+  again only when its modification time changed.
+
+  Args:
+    creative_file (str): the file name, e.g. 'creative_snippet_openwrap.html'
+  Returns:
+    a string
+  """
+  with _snippets_lock:
+    if not _snippets:
+      for path in glob.glob(os.path.join(SNIPPET_DIR, 'creative_snippet*.html')):
+        _load_snippet(os.path.basename(path))
+    path = os.path.join(SNIPPET_DIR, creative_file)
+    cached = _snippets.get(creative_file)
+    if cached is None or cached[0] != os.path.getmtime(path):
+      return _load_snippet(creative_file)
+    return cached[1]
+
+def _load_snippet(creative_file):
+  path = os.path.join(SNIPPET_DIR, creative_file)
+  mtime = os.path.getmtime(path)
+  with open(path, 'r') as snippet_file:
+    snippet = snippet_file.read()
+  _snippets[creative_file] = (mtime, snippet)
+  return snippet
+
 def create_creatives(creatives):
   """
   Creates creatives in DFP.
@@ -31,7 +71,108 @@ def create_creatives(creatives):
     logger.info(u'Created creative with name "{name}".'.format(name=creative['name']))
   return created_creative_ids
 
-def create_creative_config(name, advertiser_id, size=None, creative_file=None, safe_frame=False):
+def get_creatives_by_names(advertiser_id, names):
+  """
+  Gets the creatives of an advertiser with the given names, in chunks of
+  constant.CREATIVE_NAMES_PER_STATEMENT names per query.
+
+  Args:
+    advertiser_id (int): the ID of the advertiser in DFP
+    names (arr): the creative names
+  Returns:
+    an array of DFP creatives
+  """
+  dfp_client = get_client()
+  creative_service = dfp_client.GetService('CreativeService',
+    version='v202502')
+
+  creatives = []
+  for chunk in chunk_list(list(dict.fromkeys(names)),
+      constant.CREATIVE_NAMES_PER_STATEMENT):
+    bind_names = ['name{0}'.format(i) for i in range(len(chunk))]
+    query = 'WHERE advertiserId = :advertiserId AND name IN ({0})'.format(
+      ', '.join(':' + bind_name for bind_name in bind_names))
+    values = [{
+      'key': 'advertiserId',
+      'value': {
+        'xsi_type': 'NumberValue',
+        'value': advertiser_id
+      }
+    }] + [{
+      'key': bind_name,
+      'value': {
+        'xsi_type': 'TextValue',
+        'value': name
+      }
+    } for bind_name, name in zip(bind_names, chunk)]
+    creatives.extend(paginate(creative_service.getCreativesByStatement, query,
+      values, label='Creatives'))
+  return creatives
+
+def resolve_creatives(creative_configs):
+  """
+  Returns creative IDs for creative configs, reusing the advertiser's
+  existing creatives with the same name, size, snippet and SafeFrame flag
+  and creating only the missing ones, in a single request.
+
+  Existing creatives are looked up by exact name, with one query per
+  advertiser and chunk of names.
+
+  Args:
+    creative_configs (arr): ThirdPartyCreative configs, e.g. from
+      create_duplicate_creative_configs
+  Returns:
+    an array: the creative IDs, in the order of `creative_configs`
+  """
+  available = {}
+  by_advertiser = {}
+  for config in creative_configs:
+    by_advertiser.setdefault(config['advertiserId'], []).append(config['name'])
+  for advertiser_id, names in by_advertiser.items():
+    for creative in get_creatives_by_names(advertiser_id, names):
+      available.setdefault(_get_creative_key(creative), []).append(
+        _get_field(creative, 'id'))
+
+  creative_ids = []
+  missing = []
+  for index, config in enumerate(creative_configs):
+    # Each existing creative is reused once, as configs may share a name
+    matches = available.get(_get_creative_key(config))
+    if matches:
+      creative_ids.append(matches.pop(0))
+    else:
+      creative_ids.append(None)
+      missing.append(index)
+
+  logger.info(u'Reusing {0} existing creatives, creating {1}.'.format(
+    len(creative_configs) - len(missing), len(missing)))
+  if missing:
+    created_ids = create_creatives([creative_configs[index] for index in missing])
+    for index, creative_id in zip(missing, created_ids):
+      creative_ids[index] = creative_id
+  return creative_ids
+
+def _get_creative_key(creative):
+  # What makes an existing creative interchangeable with a config
+  size = _get_field(creative, 'size') or {}
+  snippet = _get_field(creative, 'snippet') or ''
+  return (
+    _get_field(creative, 'name'),
+    str(_get_field(size, 'width')),
+    str(_get_field(size, 'height')),
+    bool(_get_field(creative, 'isSafeFrameCompatible')),
+    hashlib.sha256(snippet.encode('utf-8')).hexdigest(),
+  )
+
+def _get_field(obj, name):
+  # Configs are dicts, SOAP objects have attributes
+  try:
+    return obj[name]
+  except (KeyError, TypeError):
+    return getattr(obj, name, None)
+
+def create_creative_config(name, advertiser_id, size=None, creative_file=None, safe_frame=False,
+  snippet=None):
   """
   Creates a creative config object.
 
@@ -41,19 +182,17 @@ def create_creative_config(name, advertiser_id, size=None, creative_file=None, s
     sizes (string array): size for the creative
     creative_file (string): the name of the file containing creative
     safe_frame (bool): Flag to indicate Whether the Creative is compatible for SafeFrame rendering.
+    snippet (string): the creative content, instead of reading creative_file
 
 
   Returns:
     an object: the line item config
   """
 
-  if creative_file == None:
+  if snippet == None:
+    if creative_file == None:
       creative_file = 'creative_snippet.html'
-
-  snippet_file_path = os.path.join(os.path.dirname(__file__),
-    creative_file)
-  with open(snippet_file_path, 'r') as snippet_file:
-      snippet = snippet_file.read()
+    snippet = get_snippet(creative_file)
 
   # https://developers.google.com/doubleclick-publishers/docs/reference/v201802/CreativeService.Creative
   
@@ -119,6 +258,8 @@ def create_duplicate_creative_configs(bidder_code, order_name, advertiser_id, si
     an array: an array of length `num_creatives`, each item a line item config
   """
   creative_configs = []
+  # Every config shares one snippet string
+  snippet = get_snippet(creative_file or 'creative_snippet.html')
   #this flow is for prebid where sizes are not passed and for openwrap with 1x1 option set
   if sizes == None:
     for creative_num in range(1, num_creatives + 1):
@@ -126,7 +267,8 @@ def create_duplicate_creative_configs(bidder_code, order_name, advertiser_id, si
         name=build_creative_name(bidder_code, order_name, creative_num, prefix=prefix),
         advertiser_id=advertiser_id,
         creative_file=creative_file,
-        safe_frame=safe_frame
+        safe_frame=safe_frame,
+        snippet=snippet
       )
       creative_configs.append(config)
   # this flow is for openwrap, where sizes are considered for creative creation
@@ -138,7 +280,8 @@ def create_duplicate_creative_configs(bidder_code, order_name, advertiser_id, si
           advertiser_id=advertiser_id,
           size=size,
           creative_file=creative_file,
-          safe_frame=safe_frame
+          safe_frame=safe_frame,
+          snippet=snippet
         )
         creative_configs.append(config)
   return creative_configs
@@ -4,6 +4,8 @@ import logging
 
 from googleads import ad_manager
 
+from Openwrap_DFP_Setup import constant
+from Openwrap_DFP_Setup.dfp.batch_utils import chunk_list, run_chunks
 from Openwrap_DFP_Setup.dfp.client import get_client
 
 
@@ -85,3 +87,60 @@ def create_targeting_value(name, key_id, match_type='EXACT'):
       display_name=created_value['displayName']))
 
   return created_value['id']
+
+def create_targeting_values(names, key_id, match_type='EXACT', chunk_size=None,
+  max_workers=None):
+  """
+  Creates custom targeting values for a specific key in DFP in bulk.
+
+  The values are sent in chunks of at most `chunk_size` values per request,
+  and the chunks run concurrently.
+
+  Args:
+    names (arr): the names of the values
+    key_id (int): the ID of the associated DFP key
+    match_type (str): the match type of the values, e.g. 'EXACT' or 'PREFIX'
+    chunk_size (int): values per request, defaults to
+      constant.TARGETING_VALUES_PER_REQUEST
+    max_workers (int): max number of concurrent requests
+  Returns:
+    a dict: the ID of each created value keyed by value name
+  """
+  if not names:
+    return {}
+
+  if chunk_size is None:
+    chunk_size = constant.TARGETING_VALUES_PER_REQUEST
+
+  def create_chunk(chunk):
+    dfp_client = get_client()
+    custom_targeting_service = dfp_client.GetService('CustomTargetingService',
+      version='v202502')
+
+    values_config = [
+      {
+        'customTargetingKeyId': key_id,
+        'displayName': str(name),
+        'name': str(name),
+        'matchType': match_type
+      }
+      for name in chunk
+    ]
+
+    # Add custom targeting values.
+    return custom_targeting_service.createCustomTargetingValues(values_config)
+
+  chunks = chunk_list([str(name) for name in names], chunk_size)
+  results = run_chunks(create_chunk, chunks, max_workers=max_workers,
+    label='Targeting value creation')
+
+  created_ids = {}
+  for values in results:
+    for value in values or []:
+      created_ids[value['name']] = value['id']
+
+  logger.info(u'Created {num} custom targeting values for key ID {key_id} '
+    'in {requests} request(s).'.format(num=len(created_ids), key_id=key_id,
+      requests=len(chunks)))
+
+  return created_ids
@@ -1,15 +1,116 @@
 import logging
 from googleads import ad_manager
+from Openwrap_DFP_Setup import constant
+from Openwrap_DFP_Setup.dfp.batch_utils import chunk_list, iter_chunks
 from Openwrap_DFP_Setup.dfp.client import get_client
+from Openwrap_DFP_Setup.dfp.exceptions import DFPBatchException
+from Openwrap_DFP_Setup.dfp.paginate import paginate
 
 logger = logging.getLogger(__name__)
 
-def create_line_items(line_items):
+def _create_line_item_chunk(chunk):
     dfp_client = get_client()
     line_item_service = dfp_client.GetService('LineItemService', version='v202502')
-    created_items = line_item_service.createLineItems(line_items)
+    created_items = line_item_service.createLineItems(chunk)
     return [item['id'] for item in created_items]
 
+def _find_line_item_chunk(chunk):
+    # Line item names are unique within an order: if every line item of the
+    # chunk exists, a create that seemed to fail went through
+    bind_names = ['name{0}'.format(i) for i in range(len(chunk))]
+    order_ids = sorted(set(str(line_item['orderId']) for line_item in chunk))
+    bind_orders = ['order{0}'.format(i) for i in range(len(order_ids))]
+    query = 'WHERE orderId IN ({0}) AND name IN ({1})'.format(
+        ', '.join(':' + bind for bind in bind_orders),
+        ', '.join(':' + bind for bind in bind_names))
+    values = [{'key': bind, 'value': {'xsi_type': 'NumberValue', 'value': order_id}}
+              for bind, order_id in zip(bind_orders, order_ids)]
+    values += [{'key': bind, 'value': {'xsi_type': 'TextValue', 'value': line_item['name']}}
+               for bind, line_item in zip(bind_names, chunk)]
+    line_item_service = get_client().GetService('LineItemService', version='v202502')
+    found = {(str(item['orderId']), item['name']): item['id'] for item in
+             paginate(line_item_service.getLineItemsByStatement, query, values)}
+    ids = [found.get((str(line_item['orderId']), line_item['name'])) for line_item in chunk]
+    return ids if all(line_item_id is not None for line_item_id in ids) else None
+
+def iter_line_item_chunks(line_items, chunk_size=None, max_workers=None, retries=None):
+    """
+    Creates line items in DFP in chunks sent concurrently, yielding the IDs of
+    each chunk as soon as it is created. A chunk that failed transiently is
+    looked up by name before it is sent again.
+
+    Args:
+      line_items (arr): an array of line item configs
+      chunk_size (int): line items per request, defaults to
+        constant.LINE_ITEMS_PER_REQUEST
+      max_workers (int): max number of concurrent requests
+      retries (int): retries per chunk, defaults to constant.BATCH_MAX_RETRIES
+    Yields:
+      (chunk_index, result) tuples in completion order, where result is the
+        array of created IDs, or the exception if the chunk failed
+    """
+    if chunk_size is None:
+        chunk_size = constant.LINE_ITEMS_PER_REQUEST
+    if retries is None:
+        retries = constant.BATCH_MAX_RETRIES
+
+    chunks = chunk_list(line_items, chunk_size)
+    return iter_chunks(_create_line_item_chunk, chunks, max_workers=max_workers,
+                       retries=retries, label='Line item creation',
+                       lookup=_find_line_item_chunk)
+
+def create_line_items(line_items, chunk_size=None, max_workers=None, retries=None):
+    """
+    Creates line items in DFP, in chunks sent concurrently.
+
+    Failed chunks are retried with exponential backoff. If a chunk still
+    fails, a DFPBatchException is raised carrying the IDs of the line items
+    that were created.
+
+    Args:
+      line_items (arr): an array of line item configs
+      chunk_size (int): line items per request, defaults to
+        constant.LINE_ITEMS_PER_REQUEST
+      max_workers (int): max number of concurrent requests
+      retries (int): retries per chunk, defaults to constant.BATCH_MAX_RETRIES
+    Returns:
+      an array: the IDs of the created line items, in input order
+    """
+    results = {}
+    for index, result in iter_line_item_chunks(line_items, chunk_size=chunk_size,
+                                               max_workers=max_workers, retries=retries):
+        results[index] = result
+    return collect_line_item_ids(results)
+
+def collect_line_item_ids(chunk_results):
+    """
+    Flattens per-chunk creation results into line item IDs in input order.
+
+    Args:
+      chunk_results (dict): created IDs, or the exception, keyed by chunk index
+    Returns:
+      an array: the IDs of the created line items
+    Raises:
+      DFPBatchException: if any chunk failed, carrying the created IDs
+    """
+    created_ids = []
+    errors = []
+    for index in sorted(chunk_results):
+        result = chunk_results[index]
+        if isinstance(result, Exception):
+            errors.append((index, result))
+        else:
+            created_ids.extend(result)
+
+    if errors:
+        raise DFPBatchException(
+            'Failed to create {0} of {1} line item chunks ({2} line items created): {3}'.format(
+                len(errors), len(chunk_results), len(created_ids), errors[0][1]),
+            created_ids=created_ids, errors=errors)
+
+    logger.info(f"Created {len(created_ids)} line items in {len(chunk_results)} request(s)")
+    return created_ids
+
 def create_line_item_config(name, order_id, placement_ids, ad_unit_ids, cpm_micro_amount, sizes,
                              key_gen_obj=None, lineitem_type='PRICE_PRIORITY', currency_code='USD',
                              setup_type=None, creative_template_ids=None, same_adv_exception=False,
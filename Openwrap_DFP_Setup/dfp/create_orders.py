@@ -1,30 +1,39 @@
+import math
+import re
+
 from googleads import ad_manager
+from Openwrap_DFP_Setup import constant
+from Openwrap_DFP_Setup.dfp.batch_utils import chunk_list, run_chunks
 from Openwrap_DFP_Setup.dfp.client import get_client
+from Openwrap_DFP_Setup.dfp.get_line_items import get_line_items_by_order
+from Openwrap_DFP_Setup.dfp.get_users import get_user_id_by_email
+from Openwrap_DFP_Setup.dfp.lookup_cache import cached_lookup, remember_lookup
+from Openwrap_DFP_Setup.dfp.paginate import paginate
 
 
+@cached_lookup('order')
 def get_order_id_by_name(order_name):
     client = get_client()
     order_service = client.GetService('OrderService', version='v202502')
-    query = f"WHERE name = '{order_name}'"
-    response = order_service.getOrdersByStatement({'query': query})
-    # Handle API response object properly
-    if hasattr(response, 'results') and response.results and len(response.results) > 0:
-        return response.results[0].id
-    return None
+    query = 'WHERE name = :name'
+    values = [{
+        'key': 'name',
+        'value': {
+            'xsi_type': 'TextValue',
+            'value': order_name
+        }
+    }]
+    order = paginate(order_service.getOrdersByStatement, query, values).first()
+    return order.id if order is not None else None
 
 def create_order(order_name, advertiser_name, trafficker_email):
     from Openwrap_DFP_Setup.dfp.get_advertisers import get_advertiser_id_by_name
     
     client = get_client()
-    user_service = client.GetService('UserService', version='v202502')
     order_service = client.GetService('OrderService', version='v202502')
 
     # Get trafficker ID
-    users = user_service.getUsersByStatement({'query': f"WHERE email = '{trafficker_email}'"})
-    # Handle API response object properly - check if results exist and have content
-    if not hasattr(users, 'results') or not users.results or len(users.results) == 0:
-        raise Exception(f"No user found with email: {trafficker_email}")
-    trafficker_id = users.results[0].id
+    trafficker_id = get_user_id_by_email(trafficker_email)
 
     # Get advertiser ID using the proper function that handles creation if needed
     try:
@@ -38,4 +47,168 @@ def create_order(order_name, advertiser_name, trafficker_email):
         'traffickerId': trafficker_id
     }
     created = order_service.createOrders([order])
+    remember_lookup('order', (order_name,), created[0].id)
     return created[0].id
+
+def get_sharded_order_names(order_name, num_line_items, limit=None):
+    """
+    Returns the names of the orders needed to hold `num_line_items` line items
+    without going over the per-order line item limit.
+
+    Args:
+      order_name (str): the base order name
+      num_line_items (int): how many line items will be created
+      limit (int): max line items per order, defaults to constant.LINE_ITEMS_LIMIT
+    Returns:
+      an array: [order_name] if everything fits in one order, else
+        order_name-1, order_name-2, ...
+    """
+    if limit is None:
+        limit = constant.LINE_ITEMS_LIMIT
+    num_orders = max(1, math.ceil(num_line_items / float(limit)))
+    if num_orders == 1:
+        return [order_name]
+    return [f"{order_name}-{i}" for i in range(1, num_orders + 1)]
+
+def shard_evenly(items, num_shards):
+    """
+    Splits items into `num_shards` consecutive shards of near-equal size.
+
+    Args:
+      items (arr): the items to split
+      num_shards (int): how many shards
+    Returns:
+      an array of arrays: the shards, in input order
+    """
+    shard_size = max(1, math.ceil(len(items) / float(num_shards)))
+    shards = chunk_list(items, shard_size)
+    # Pad so there is exactly one (possibly empty) shard per order
+    return shards + [[] for _ in range(num_shards - len(shards))]
+
+def get_order_shard_ids_by_name(order_name):
+    """
+    Gets the orders named `order_name` or `order_name`-<n>, i.e. the orders
+    earlier setups of the same order name created.
+
+    Args:
+      order_name (str): the base order name
+    Returns:
+      a dict: the ID of each order keyed by name, the unsuffixed order first
+        and then by suffix
+    """
+    client = get_client()
+    order_service = client.GetService('OrderService', version='v202502')
+    query = 'WHERE name LIKE :name'
+    values = [{
+        'key': 'name',
+        'value': {
+            'xsi_type': 'TextValue',
+            'value': order_name + '%'
+        }
+    }]
+    pattern = re.compile(r'^{0}(?:-(\d+))?$'.format(re.escape(order_name)))
+    shards = []
+    for order in paginate(order_service.getOrdersByStatement, query, values):
+        match = pattern.match(order.name)
+        if match:
+            shards.append((int(match.group(1) or 0), order.name, order.id))
+    return {name: order_id for _, name, order_id in sorted(shards)}
+
+def assign_order_shards(order_name, line_item_names, limit=None):
+    """
+    Assigns line items to orders without going over the per-order line item
+    limit, counting the line items the orders already hold.
+
+    Line items that already exist in an order of an earlier setup stay there.
+    The others first fill the room left in the existing orders, then go to
+    new orders, split evenly. With no existing orders this is the same as
+    get_sharded_order_names() and shard_evenly().
+
+    Args:
+      order_name (str): the base order name
+      line_item_names (arr): the names of the line items of the setup
+      limit (int): max line items per order, defaults to constant.LINE_ITEMS_LIMIT
+    Returns:
+      a tuple: (the order names to get or create, the index in them of the
+        order of each line item, and the line items of each existing order
+        keyed by order ID, for reconcile_line_items())
+    """
+    if limit is None:
+        limit = constant.LINE_ITEMS_LIMIT
+
+    existing = get_order_shard_ids_by_name(order_name)
+    order_names = list(existing)
+    shard_of = [None] * len(line_item_names)
+    load = []
+    line_items_by_order = {}
+    for shard_idx, order_id in enumerate(existing.values()):
+        line_items = line_items_by_order[order_id] = get_line_items_by_order(order_id)
+        load.append(len(line_items))
+        names = set(line_item.name for line_item in line_items)
+        for idx, name in enumerate(line_item_names):
+            if shard_of[idx] is None and name in names:
+                shard_of[idx] = shard_idx
+
+    remaining = [idx for idx, shard_idx in enumerate(shard_of) if shard_idx is None]
+    for shard_idx, num_line_items in enumerate(load):
+        room = max(0, limit - num_line_items)
+        for idx in remaining[:room]:
+            shard_of[idx] = shard_idx
+        remaining = remaining[room:]
+
+    if remaining or not order_names:
+        new_names = get_sharded_order_names(order_name, len(remaining), limit)
+        if order_names:
+            # Number new shards after the highest existing one, so the order
+            # of an earlier single-order setup is kept as is
+            last = max([int(name.rsplit('-', 1)[1]) for name in order_names
+                        if name != order_name] or [0])
+            new_names = [f"{order_name}-{i}" for i in
+                         range(last + 1, last + 1 + len(new_names))]
+        for new_name, shard in zip(new_names, shard_evenly(remaining, len(new_names))):
+            for idx in shard:
+                shard_of[idx] = len(order_names)
+            order_names.append(new_name)
+    return order_names, shard_of, line_items_by_order
+
+def get_or_create_orders(order_names, advertiser_name, trafficker_email):
+    """
+    Gets or creates many orders. Existing orders are looked up concurrently and
+    the missing ones are created with a single request.
+
+    Args:
+      order_names (arr): the names of the orders
+      advertiser_name (str): the advertiser of new orders
+      trafficker_email (str): the email of the trafficker of new orders
+    Returns:
+      an array: the order IDs, in the order of `order_names`
+    """
+    from Openwrap_DFP_Setup.dfp.get_advertisers import get_advertiser_id_by_name
+
+    order_ids = run_chunks(lambda chunk: get_order_id_by_name(chunk[0]),
+                           [[name] for name in order_names], label='Order lookup')
+    missing = [name for name, order_id in zip(order_names, order_ids) if not order_id]
+    if not missing:
+        return order_ids
+
+    client = get_client()
+    order_service = client.GetService('OrderService', version='v202502')
+
+    # Get trafficker ID
+    trafficker_id = get_user_id_by_email(trafficker_email)
+
+    # Resolve the advertiser once so shards never race to create it
+    try:
+        advertiser_id = get_advertiser_id_by_name(advertiser_name)
+    except Exception as e:
+        raise Exception(f"Failed to get/create advertiser '{advertiser_name}': {str(e)}")
+
+    created = order_service.createOrders([{
+        'name': name,
+        'advertiserId': advertiser_id,
+        'traffickerId': trafficker_id
+    } for name in missing])
+    created_ids = {order.name: order.id for order in created}
+    for name, order_id in created_ids.items():
+        remember_lookup('order', (name,), order_id)
+    return [order_id or created_ids[name] for name, order_id in zip(order_names, order_ids)]
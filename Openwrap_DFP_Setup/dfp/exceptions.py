@@ -24,3 +24,27 @@ class DFPException(Exception):
     super(DFPException, self).__init__(detailed_message)
 
 
+
+
+class DFPBatchException(DFPException):
+  """
+  When some chunks of a batch operation failed. Keeps the results of the
+  chunks that succeeded so they are not lost, and the counts of the
+  operation if it keeps any.
+  """
+  def __init__(self, message, created_ids=None, errors=None, counts=None):
+    super(DFPBatchException, self).__init__(message)
+    self.created_ids = created_ids or []
+    self.errors = errors or []
+    self.counts = counts or {}
+
+
+class FakeServiceError(DFPException):
+  """
+  An API error raised by the fake DFP backend, named like the errors of the
+  real service, e.g. 'QuotaError.EXCEEDED_QUOTA'.
+  """
+  def __init__(self, reason, message=''):
+    super(FakeServiceError, self).__init__(
+      '[{0}] {1}'.format(reason, message).strip())
+    self.reason = reason
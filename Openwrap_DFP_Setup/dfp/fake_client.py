@@ -0,0 +1,410 @@
+import copy
+import itertools
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from Openwrap_DFP_Setup import constant
+from Openwrap_DFP_Setup import settings
+from Openwrap_DFP_Setup.dfp.exceptions import FakeServiceError
+from Openwrap_DFP_Setup.dfp.plan_client import ServiceObject, estimate_call_seconds
+
+
+logger = logging.getLogger(__name__)
+
+_METHOD_RE = re.compile(r'^(create|update|get)(\w+?)(ByStatement)?$')
+_ACTION_RE = re.compile(r'^perform(\w+)Action$')
+_LIMIT_RE = re.compile(r'\s+LIMIT\s+(\d+)(?:\s+OFFSET\s+(\d+))?\s*$', re.I)
+_CONDITION_RE = re.compile(
+  r'^\s*(\w+)\s*(=|!=|IN|LIKE)\s*(.+?)\s*$', re.I)
+
+# Object types that exist in a network before any setup runs. Looking one
+# up by name creates it when `auto_create_references` is set, so the fake
+# works with whatever advertiser, trafficker or placement a form names.
+REFERENCE_TYPES = {
+  'AdUnits': 'name',
+  'Companies': 'name',
+  'CreativeTemplates': 'name',
+  'Placements': 'name',
+  'Users': 'email',
+}
+
+# Fields an object of each type must be created with
+REQUIRED_FIELDS = {
+  'CustomTargetingKeys': ('name', 'type'),
+  'CustomTargetingValues': ('customTargetingKeyId', 'name'),
+  'Orders': ('name', 'advertiserId', 'traffickerId'),
+  'Companies': ('name', 'type'),
+  'Creatives': ('name', 'advertiserId'),
+  'LineItems': ('name', 'orderId', 'lineItemType', 'costPerUnit'),
+  'LineItemCreativeAssociations': ('lineItemId',),
+}
+
+# Status of a new object of each type
+INITIAL_STATUS = {
+  'CustomTargetingKeys': 'ACTIVE',
+  'CustomTargetingValues': 'ACTIVE',
+  'Orders': 'DRAFT',
+  'LineItems': 'DRAFT',
+  'LineItemCreativeAssociations': 'ACTIVE',
+}
+
+class FakeService(object):
+  """
+  A service of the fake backend. Every method call goes to the client.
+  """
+
+  def __init__(self, client, service_name):
+    self._client = client
+    self._service_name = service_name
+
+  def __getattr__(self, method_name):
+    def call(*args):
+      return self._client.call(self._service_name, method_name, args)
+    return call
+
+class FakeAdManagerClient(object):
+  """
+  In-process fake of the DFP services, for benchmarking and load testing
+  the setup pipeline offline.
+
+  Objects are kept in memory, so lookups see what earlier calls created.
+  Statements support the PQL the dfp modules use: `=`, `!=`, `IN` and `LIKE`
+  conditions joined by AND, with LIMIT and OFFSET. Each call sleeps for the
+  latency of constant.PLAN_* scaled by `latency_scale`, and the per-request
+  limits of the real API are enforced:
+    - at most `max_objects_per_request` objects per create/update call
+    - at most `max_concurrent_requests` requests in flight, past which
+      calls fail with QuotaError.EXCEEDED_QUOTA like the real API
+    - at most constant.LINE_ITEMS_LIMIT line items per order
+    - unique names for orders, companies, targeting keys, the values of a
+      key and the line items of an order
+  """
+
+  network_code = 'fake'
+
+  def __init__(self, latency_scale=None, max_objects_per_request=None,
+      max_concurrent_requests=None, auto_create_references=True):
+    if latency_scale is None:
+      latency_scale = getattr(settings, 'FAKE_DFP_LATENCY_SCALE', 0)
+    if max_objects_per_request is None:
+      max_objects_per_request = constant.FAKE_DFP_MAX_OBJECTS_PER_REQUEST
+    if max_concurrent_requests is None:
+      max_concurrent_requests = constant.FAKE_DFP_MAX_CONCURRENT_REQUESTS
+    self.latency_scale = latency_scale
+    self.max_objects_per_request = max_objects_per_request
+    self.max_concurrent_requests = max_concurrent_requests
+    self.auto_create_references = auto_create_references
+
+    self._lock = threading.Lock()
+    self._ids = itertools.count(1000001)
+    self._in_flight = 0
+    self.objects = {}
+    self.stats = OrderedDict()
+
+    root_ad_unit = self.add('AdUnits', name='Root', parentId=None)
+    self.network = {
+      'id': next(self._ids),
+      'networkCode': self.network_code,
+      'displayName': 'Fake network',
+      'currencyCode': 'USD',
+      'effectiveRootAdUnitId': root_ad_unit['id'],
+    }
+
+  def GetService(self, service_name, version=None, server=None):
+    return FakeService(self, service_name)
+
+  def add(self, object_type, **fields):
+    """
+    Adds an object directly, e.g. to seed an existing order.
+
+    Args:
+      object_type (str): the plural type, e.g. 'Orders'
+    Returns:
+      a dict: the stored object, with its new ID
+    """
+    with self._lock:
+      return self._store(object_type, fields)
+
+  def get_stats(self):
+    """
+    Returns per service method counts of calls, objects sent, errors and the
+    simulated latency, plus the number of stored objects of each type.
+    """
+    with self._lock:
+      return {
+        'methods': copy.deepcopy(self.stats),
+        'api_calls': sum(s['calls'] for s in self.stats.values()),
+        'objects': {t: len(objs) for t, objs in self.objects.items()},
+      }
+
+  def reset_stats(self):
+    with self._lock:
+      self.stats = OrderedDict()
+
+  def call(self, service_name, method_name, args):
+    payload = args[0] if args else None
+    num_objects = len(payload) if isinstance(payload, list) else 0
+    name = '{0}.{1}'.format(service_name, method_name)
+
+    with self._lock:
+      stats = self.stats.setdefault(name, {'calls': 0, 'objects': 0,
+        'errors': 0, 'seconds': 0.0})
+      stats['calls'] += 1
+      stats['objects'] += num_objects
+      if self._in_flight >= self.max_concurrent_requests:
+        stats['errors'] += 1
+        raise FakeServiceError('QuotaError.EXCEEDED_QUOTA',
+          'more than {0} concurrent requests'.format(self.max_concurrent_requests))
+      self._in_flight += 1
+
+    try:
+      if num_objects > self.max_objects_per_request:
+        raise FakeServiceError('RequestError.REQUEST_TOO_LARGE',
+          '{0} objects sent, at most {1} allowed'.format(
+            num_objects, self.max_objects_per_request))
+
+      seconds = estimate_call_seconds(method_name, num_objects) * self.latency_scale
+      if seconds > 0:
+        time.sleep(seconds)
+      with self._lock:
+        stats['seconds'] += seconds
+        return self._dispatch(method_name, args)
+    except FakeServiceError:
+      with self._lock:
+        stats['errors'] += 1
+      raise
+    finally:
+      with self._lock:
+        self._in_flight -= 1
+
+  def _dispatch(self, method_name, args):
+    if method_name == 'getCurrentNetwork':
+      return ServiceObject(self.network)
+
+    match = _ACTION_RE.match(method_name)
+    if match:
+      object_type = _pluralize(match.group(1))
+      return self._perform_action(object_type, args[0], args[1])
+
+    match = _METHOD_RE.match(method_name)
+    if match is None:
+      raise FakeServiceError('NotImplemented', method_name)
+    verb, object_type, by_statement = match.groups()
+    if verb == 'create':
+      self._check_create(object_type, args[0])
+      return [ServiceObject(self._store(object_type, obj)) for obj in args[0]]
+    if verb == 'update':
+      return [ServiceObject(self._update(object_type, obj)) for obj in args[0]]
+    if by_statement:
+      return self._select(object_type, args[0] if args else {})
+    raise FakeServiceError('NotImplemented', method_name)
+
+  def _store(self, object_type, fields):
+    obj = dict(_to_dict(fields))
+    obj['id'] = next(self._ids)
+    if object_type in INITIAL_STATUS:
+      obj.setdefault('status', INITIAL_STATUS[object_type])
+    if object_type == 'LineItems':
+      order = self.objects.get('Orders', {}).get(obj['orderId'])
+      obj['orderName'] = order['name'] if order else None
+    self.objects.setdefault(object_type, OrderedDict())[obj['id']] = obj
+    return obj
+
+  def _update(self, object_type, fields):
+    fields = _to_dict(fields)
+    stored = self.objects.get(object_type, {}).get(fields.get('id'))
+    if stored is None:
+      raise FakeServiceError('EntityNotFound',
+        '{0} {1}'.format(object_type, fields.get('id')))
+    stored.update(fields)
+    return stored
+
+  def _check_create(self, object_type, objects):
+    objects = [_to_dict(obj) for obj in objects]
+    for obj in objects:
+      for field in REQUIRED_FIELDS.get(object_type, ()):
+        if obj.get(field) in (None, ''):
+          raise FakeServiceError('RequiredError.REQUIRED',
+            '{0}.{1}'.format(object_type, field))
+
+    existing = self.objects.get(object_type, {}).values()
+    if object_type in ('Orders', 'Companies', 'CustomTargetingKeys'):
+      _check_unique(object_type, existing, objects, lambda o: o['name'])
+    elif object_type == 'CustomTargetingValues':
+      _check_unique(object_type, existing, objects,
+        lambda o: (str(o['customTargetingKeyId']), o['name'].lower()))
+    elif object_type == 'LineItems':
+      _check_unique(object_type, existing, objects,
+        lambda o: (str(o['orderId']), o['name']))
+      orders = self.objects.get('Orders', {})
+      per_order = {}
+      for obj in existing:
+        per_order[obj['orderId']] = per_order.get(obj['orderId'], 0) + 1
+      for obj in objects:
+        if obj['orderId'] not in orders:
+          raise FakeServiceError('CommonError.NOT_FOUND',
+            'order {0}'.format(obj['orderId']))
+        per_order[obj['orderId']] = per_order.get(obj['orderId'], 0) + 1
+        if per_order[obj['orderId']] > constant.LINE_ITEMS_LIMIT:
+          raise FakeServiceError('LineItemError.TOO_MANY_LINE_ITEMS',
+            'order {0} would have more than {1} line items'.format(
+              obj['orderId'], constant.LINE_ITEMS_LIMIT))
+    elif object_type == 'LineItemCreativeAssociations':
+      line_items = self.objects.get('LineItems', {})
+      creatives = self.objects.get('Creatives', {})
+      for obj in objects:
+        creative_id = obj.get('creativeId') or obj.get('creativeSetId')
+        if obj['lineItemId'] not in line_items or creative_id not in creatives:
+          raise FakeServiceError('CommonError.NOT_FOUND',
+            'line item {0} or creative {1}'.format(obj['lineItemId'], creative_id))
+
+  def _select(self, object_type, statement):
+    statement = _to_dict(statement)
+    query = statement.get('query') or ''
+    bound = {}
+    for value in statement.get('values') or []:
+      value = _to_dict(value)
+      bound[value['key']] = _to_dict(value.get('value') or {}).get('value')
+
+    limit, offset = constant.FAKE_DFP_PAGE_LIMIT, 0
+    match = _LIMIT_RE.search(query)
+    if match:
+      limit = min(int(match.group(1)), constant.FAKE_DFP_PAGE_LIMIT)
+      offset = int(match.group(2) or 0)
+      query = query[:match.start()]
+
+    conditions = _parse_where(query, bound)
+    objects = self.objects.get(object_type, {})
+    results = [obj for obj in objects.values()
+               if all(condition(obj) for condition in conditions)]
+
+    if not results and self.auto_create_references and object_type in REFERENCE_TYPES:
+      name_field = REFERENCE_TYPES[object_type]
+      fields = _get_equalities(query, bound)
+      if fields.get(name_field):
+        fields.setdefault('type', 'ADVERTISER')
+        results = [self._store(object_type, fields)]
+
+    page = results[offset:offset + limit]
+    return ServiceObject(totalResultSetSize=len(results),
+      startIndex=offset, results=[ServiceObject(obj) for obj in page])
+
+  def _perform_action(self, object_type, action, statement):
+    action_type = _to_dict(action).get('xsi_type', '')
+    selected = self._select(object_type, statement).results
+    objects = self.objects.get(object_type, {})
+    for obj in selected:
+      stored = objects[obj['id']]
+      if action_type.startswith('Delete'):
+        del objects[obj['id']]
+      elif action_type.startswith('Deactivate'):
+        stored['status'] = 'INACTIVE'
+      elif action_type.startswith('Activate'):
+        stored['status'] = 'ACTIVE'
+      elif action_type.startswith('Archive'):
+        stored['isArchived'] = True
+      elif action_type.startswith('Pause'):
+        stored['status'] = 'PAUSED'
+    return ServiceObject(numChanges=len(selected))
+
+_fake_client = None
+_fake_client_lock = threading.Lock()
+
+def get_fake_client():
+  """
+  Returns the process-wide fake client used when settings.DFP_BACKEND is
+  'fake', so objects created by one request are seen by the next.
+  """
+  global _fake_client
+  with _fake_client_lock:
+    if _fake_client is None:
+      logger.info('Using the fake DFP backend')
+      _fake_client = FakeAdManagerClient()
+    return _fake_client
+
+def reset_fake_client():
+  """
+  Drops the process-wide fake client and everything stored in it.
+  """
+  global _fake_client
+  with _fake_client_lock:
+    _fake_client = None
+
+def _pluralize(singular):
+  if singular.endswith('y'):
+    return singular[:-1] + 'ies'
+  return singular + 's'
+
+def _to_dict(obj):
+  # Payloads are dicts here, but googleads objects may be passed through
+  if isinstance(obj, dict):
+    return obj
+  return json.loads(json.dumps(obj, default=lambda o: getattr(o, '__dict__', str(o))))
+
+def _check_unique(object_type, existing, objects, key):
+  seen = set(key(obj) for obj in existing)
+  for obj in objects:
+    obj_key = key(obj)
+    if obj_key in seen:
+      raise FakeServiceError('UniqueError.NOT_UNIQUE',
+        '{0} {1}'.format(object_type, obj_key))
+    seen.add(obj_key)
+
+def _split_conditions(query):
+  query = re.sub(r'^\s*(SELECT\s+.+?\s+)?(FROM\s+\w+\s+)?', '', query, flags=re.I)
+  query = re.sub(r'\s+ORDER\s+BY\s+.*$', '', query, flags=re.I)
+  query = re.sub(r'^\s*WHERE\s+', '', query, flags=re.I)
+  if not query.strip():
+    return []
+  if re.search(r'\sOR\s', query, re.I):
+    raise FakeServiceError('PQLError.UNSUPPORTED', 'OR is not supported: ' + query)
+  return re.split(r'\s+AND\s+', query, flags=re.I)
+
+def _parse_value(token, bound):
+  token = token.strip()
+  if token.startswith(':'):
+    return bound.get(token[1:])
+  if len(token) >= 2 and token[0] == token[-1] and token[0] in '\'"':
+    return token[1:-1]
+  return token
+
+def _parse_where(query, bound):
+  conditions = []
+  for clause in _split_conditions(query):
+    match = _CONDITION_RE.match(clause)
+    if match is None:
+      raise FakeServiceError('PQLError.UNSUPPORTED', clause)
+    field, operator, operand = match.groups()
+    operator = operator.upper()
+    if operator == 'IN':
+      values = set(str(_parse_value(token, bound)).lower()
+                   for token in operand.strip('() ').split(','))
+      conditions.append(
+        lambda obj, f=field, v=values: str(obj.get(f)).lower() in v)
+    elif operator == 'LIKE':
+      pattern = re.escape(str(_parse_value(operand, bound))).replace('%', '.*')
+      regex = re.compile('^' + pattern + '$', re.I)
+      conditions.append(
+        lambda obj, f=field, r=regex: bool(r.match(str(obj.get(f)))))
+    else:
+      value = str(_parse_value(operand, bound)).lower()
+      if operator == '=':
+        conditions.append(
+          lambda obj, f=field, v=value: str(obj.get(f)).lower() == v)
+      else:
+        conditions.append(
+          lambda obj, f=field, v=value: str(obj.get(f)).lower() != v)
+  return conditions
+
+def _get_equalities(query, bound):
+  # field = value conditions of a statement, used to create looked up objects
+  fields = {}
+  for clause in _split_conditions(query):
+    match = _CONDITION_RE.match(clause)
+    if match and match.group(2) == '=':
+      fields[match.group(1)] = _parse_value(match.group(3), bound)
+  return fields
@@ -2,9 +2,9 @@
 
 import logging
 
-from googleads import ad_manager
-
 from Openwrap_DFP_Setup.dfp.client import get_client
+from Openwrap_DFP_Setup.dfp.lookup_cache import cached_lookup
+from Openwrap_DFP_Setup.dfp.paginate import paginate
 from Openwrap_DFP_Setup.dfp.exceptions import (
   BadSettingException,
   DFPObjectNotFound,
@@ -15,9 +15,11 @@ from Openwrap_DFP_Setup import settings
 
 logger = logging.getLogger(__name__)
 
+@cached_lookup('ad_unit', fields=('id', 'name'))
 def get_ad_unit_by_name(ad_unit_name):
   """
-  Gets a ad unit by name from DFP.
+  Gets a ad unit by name from DFP. Cached: cached ad units only carry their
+  id and name.
 
   Args:
     ad_unit_name (str): the name of the DFP ad unit
@@ -37,21 +39,12 @@ def get_ad_unit_by_name(ad_unit_name):
            'value': ad_unit_name
        }},
   ]
-  statement = ad_manager.FilterStatement(query, values)
-  response = ad_unit_service.getAdUnitsByStatement(
-    statement.ToStatement())
-
-  no_ad_unit_found = False
-  try:
-    no_ad_unit_found = True if len(response.results) < 1 else False
-  except (AttributeError, KeyError):
-    no_ad_unit_found = True
+  ad_unit = paginate(ad_unit_service.getAdUnitsByStatement, query, values).first()
 
-  if no_ad_unit_found:
+  if ad_unit is None:
     raise DFPObjectNotFound('No DFP ad_unit found with name {0}'.format(
       ad_unit_name))
   else:
-    ad_unit = response.results[0]
     logger.info(u'Found ad_unit with name "{name}".'.format(name=ad_unit.name))
   return ad_unit
 
@@ -2,8 +2,6 @@
 
 import logging
 
-from googleads import ad_manager
-
 from Openwrap_DFP_Setup import settings
 from Openwrap_DFP_Setup.dfp.client import get_client
 from Openwrap_DFP_Setup.dfp.exceptions import (
@@ -11,6 +9,8 @@ from Openwrap_DFP_Setup.dfp.exceptions import (
   DFPObjectNotFound,
   MissingSettingException
 )
+from Openwrap_DFP_Setup.dfp.lookup_cache import cached_lookup, remember_lookup
+from Openwrap_DFP_Setup.dfp.paginate import paginate
 
 
 logger = logging.getLogger(__name__)
@@ -35,6 +35,9 @@ def create_advertiser(name, advertiser_type="ADVERTISER"):
   ]
   advertisers = company_service.createCompanies(advertisers_config)
   advertiser = advertisers[0]
+  # Cached as missing by the lookup that preceded the creation
+  remember_lookup('advertiser', (name, advertiser_type), advertiser,
+    fields=('id', 'name', 'type'))
 
   # Display results.
   for advertiser in advertisers:
@@ -43,14 +46,17 @@ def create_advertiser(name, advertiser_type="ADVERTISER"):
 
   return advertiser
 
-def get_advertiser_id_by_name(name, advertiser_type="ADVERTISER"):
+@cached_lookup('advertiser', fields=('id', 'name', 'type'))
+def get_advertiser_by_name(name, advertiser_type="ADVERTISER"):
   """
-  Returns a DFP company ID from company name.
+  Gets a DFP company by name and type. Cached: cached companies only carry
+  their id, name and type.
 
   Args:
     name (str): the name of the DFP advertiser
+    advertiser_type (str): the company type
   Returns:
-    an integer: the advertiser's DFP ID
+    a DFP company, or None
   """
   dfp_client = get_client()
   company_service = dfp_client.GetService('CompanyService', version='v202502')
@@ -69,28 +75,36 @@ def get_advertiser_id_by_name(name, advertiser_type="ADVERTISER"):
            'value': advertiser_type
        }},
   ]
-  statement = ad_manager.FilterStatement(query, values)
+  # Two results are enough to tell the name is ambiguous
+  companies = paginate(company_service.getCompaniesByStatement, query, values,
+    page_size=2)
+  page = next(companies.iter_pages(), [])
+
+  if not page:
+    return None
+  elif companies.total > 1:
+    print(page)
+    raise BadSettingException(
+      'Multiple advertisers found with name {0}'.format(name))
+  return page[0]
+
+def get_advertiser_id_by_name(name, advertiser_type="ADVERTISER"):
+  """
+  Returns a DFP company ID from company name.
 
-  response = company_service.getCompaniesByStatement(statement.ToStatement())
+  Args:
+    name (str): the name of the DFP advertiser
+  Returns:
+    an integer: the advertiser's DFP ID
+  """
+  advertiser = get_advertiser_by_name(name, advertiser_type)
 
   # A company is required.
-  no_company_found = False
-  try:
-    no_company_found = True if len(response.results) < 1 else False 
-  except (AttributeError, KeyError):
-    no_company_found = True
-
-  if no_company_found:
+  if advertiser is None:
     if getattr(settings, 'DFP_CREATE_ADVERTISER_IF_DOES_NOT_EXIST', False):
       advertiser = create_advertiser(name, advertiser_type)
     else:
       raise DFPObjectNotFound('No advertiser found with name {0}'.format(name))
-  elif len(response.results) > 1:
-    print(response)
-    raise BadSettingException(
-      'Multiple advertisers found with name {0}'.format(name))
-  else:
-    advertiser = response.results[0]
 
   logger.info(u'Using existing advertiser with name "{name}" and '
     'type "{type}".'.format(name=advertiser.name, type=advertiser.type))
@@ -5,6 +5,8 @@ import logging
 from googleads import ad_manager
 
 from Openwrap_DFP_Setup.dfp.client import get_client
+from Openwrap_DFP_Setup.dfp.lookup_cache import cached_lookup
+from Openwrap_DFP_Setup.dfp.paginate import Paginator
 from Openwrap_DFP_Setup.dfp.exceptions import (
   BadSettingException,
   DFPObjectNotFound,
@@ -14,6 +16,7 @@ from Openwrap_DFP_Setup import settings
 
 logger = logging.getLogger(__name__)
 
+@cached_lookup('creative_template', fields=('id', 'name'))
 def get_creative_template_by_name(template_name):
     
     dfp_client = get_client()
@@ -26,20 +29,13 @@ def get_creative_template_by_name(template_name):
      .Where('name = :name')
      .WithBindVariable('name', template_name))
 
-    response = creative_template_service.getCreativeTemplatesByStatement(
-            statement.ToStatement())
-   
-    no_creative_template_found = False
-    try:
-        no_creative_template_found = True if len(response.results) < 1 else False
-    except (AttributeError, KeyError):
-        no_creative_template_found = True
+    creative_template = Paginator(
+        creative_template_service.getCreativeTemplatesByStatement, statement).first()
 
-    if no_creative_template_found:
+    if creative_template is None:
         raise DFPObjectNotFound('No DFP creative template found with name {0}'.format(
             template_name))
     else:
-        creative_template = response.results[0]
         #print(creative_template)
         print('Found creative_template with name "{name}" and id {id}.'.format(name=creative_template.name, id=creative_template.id))
     return creative_template
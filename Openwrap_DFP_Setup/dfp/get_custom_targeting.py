@@ -2,9 +2,10 @@
 
 import logging
 
-from googleads import ad_manager
-
+from Openwrap_DFP_Setup import constant
+from Openwrap_DFP_Setup.dfp.batch_utils import chunk_list
 from Openwrap_DFP_Setup.dfp.client import get_client
+from Openwrap_DFP_Setup.dfp.paginate import paginate
 
 
 logger = logging.getLogger(__name__)
@@ -32,82 +33,146 @@ def get_key_id_by_name(name):
       'value': name
     }
   }]
-  targeting_key_statement = ad_manager.FilterStatement(query, values)
-
-  response = custom_targeting_service.getCustomTargetingKeysByStatement(
-      targeting_key_statement.ToStatement())
-
-  key_id = None
-  if hasattr(response, 'results') and response.results and len(response.results) > 0:
-    key_id = response.results[0].id
-
-  return key_id
+  key = paginate(custom_targeting_service.getCustomTargetingKeysByStatement,
+    query, values).first()
+  return key.id if key is not None else None
 
 
-def get_targeting_by_key_name(name):
+def get_key_ids_by_names(names):
   """
-  Gets a set of custom targeting values by key name
+  Gets many targeting keys by key name with a single request.
 
   Args:
-    name (str): the name of the targeting key
+    names (arr): the names of the targeting keys
   Returns:
-    an array, or None: if the key exists, return an array of objects, where
-      each object is info about a custom targeting value
+    a dict: the ID of each existing key keyed by key name. Keys that do not
+      exist in DFP are left out.
   """
+  if not names:
+    return {}
 
   dfp_client = get_client()
   custom_targeting_service = dfp_client.GetService('CustomTargetingService',
     version='v202502')
 
-  # Get a key by name.
-  query = ('WHERE name = :name')
+  # Get the keys by name.
+  bind_names = ['name{0}'.format(i) for i in range(len(names))]
+  query = 'WHERE name IN ({0})'.format(
+    ', '.join(':' + bind_name for bind_name in bind_names))
   values = [{
-    'key': 'name',
+    'key': bind_name,
     'value': {
       'xsi_type': 'TextValue',
       'value': name
     }
-  }]
-  targeting_key_statement = ad_manager.FilterStatement(query, values)
+  } for bind_name, name in zip(bind_names, names)]
+  keys = paginate(custom_targeting_service.getCustomTargetingKeysByStatement,
+    query, values, label='Targeting keys')
+  return {key.name: key.id for key in keys}
 
-  response = custom_targeting_service.getCustomTargetingKeysByStatement(
-      targeting_key_statement.ToStatement())
 
-  # If the key exists, get predefined values.
-  key_values = None
-  if hasattr(response, 'results') and response.results and len(response.results) > 0:
-    key = response.results[0]
-    key_values = []
-
-    query = "WHERE status = 'ACTIVE' AND customTargetingKeyId IN (%s)" % str(key.id)
-    statement = ad_manager.FilterStatement(query)
-
-    response = custom_targeting_service.getCustomTargetingValuesByStatement(
-        statement.ToStatement())
-    while hasattr(response, 'results') and response.results and len(response.results) > 0:
-      for custom_val in response.results:
-        key_values.append({
-          'id': custom_val.id,
-          'name': custom_val.name,
-          'displayName': custom_val.displayName,
-          'customTargetingKeyId': custom_val.customTargetingKeyId
-        })
-      statement.offset += ad_manager.SUGGESTED_PAGE_LIMIT
-      response = custom_targeting_service.getCustomTargetingValuesByStatement(
-        statement.ToStatement())
-
-  if key_values is None:
-    logger.info(u'Key "{key_name}"" does not exist in DFP.'. format(
-      key_name=name))
-  elif len(key_values) < 1:
+def get_targeting_by_key_id(key_id, key_name=None):
+  """
+  Gets the active custom targeting values of a key.
+
+  Args:
+    key_id (int): the ID of the targeting key
+    key_name (str): the name of the targeting key, used for logging
+  Returns:
+    an array of objects, where each object is info about a custom
+      targeting value
+  """
+
+  dfp_client = get_client()
+  custom_targeting_service = dfp_client.GetService('CustomTargetingService',
+    version='v202502')
+
+  key_values = []
+
+  query = "WHERE status = 'ACTIVE' AND customTargetingKeyId IN (%s)" % str(key_id)
+  # Keys may have thousands of values: the next page is fetched while the
+  # current one is read
+  for custom_val in paginate(
+      custom_targeting_service.getCustomTargetingValuesByStatement, query,
+      prefetch=True, label='Targeting values'):
+    key_values.append({
+      'id': custom_val.id,
+      'name': custom_val.name,
+      'displayName': custom_val.displayName,
+      'customTargetingKeyId': custom_val.customTargetingKeyId
+    })
+
+  if len(key_values) < 1:
     logger.info(u'Key "{key_name}" exists but has no existing values.'. format(
-      key_name=name))
+      key_name=key_name or key_id))
   else:
     logger.info(u'Key "{key_name}" exists and has {num} existing values.'. format(
-      key_name=name, num=len(key_values)))
+      key_name=key_name or key_id, num=len(key_values)))
 
   return key_values
 
+
+def get_targeting_values_by_names(key_id, names):
+  """
+  Gets values of a key by name, e.g. to find values another setup created
+  after the values of the key were downloaded.
+
+  Args:
+    key_id (int): the ID of the targeting key
+    names (arr): the names of the values
+  Returns:
+    a dict: the ID of each existing value keyed by lowercased value name
+  """
+  dfp_client = get_client()
+  custom_targeting_service = dfp_client.GetService('CustomTargetingService',
+    version='v202502')
+
+  value_ids = {}
+  for chunk in chunk_list([str(name) for name in names],
+      constant.TARGETING_VALUES_PER_REQUEST):
+    bind_names = ['name{0}'.format(i) for i in range(len(chunk))]
+    query = 'WHERE customTargetingKeyId = :keyId AND name IN ({0})'.format(
+      ', '.join(':' + bind_name for bind_name in bind_names))
+    values = [{
+      'key': 'keyId',
+      'value': {
+        'xsi_type': 'NumberValue',
+        'value': key_id
+      }
+    }] + [{
+      'key': bind_name,
+      'value': {
+        'xsi_type': 'TextValue',
+        'value': name
+      }
+    } for bind_name, name in zip(bind_names, chunk)]
+    for value in paginate(
+        custom_targeting_service.getCustomTargetingValuesByStatement, query,
+        values, label='Targeting values'):
+      value_ids.setdefault(value.name.lower(), value.id)
+  return value_ids
+
+
+def get_targeting_by_key_name(name):
+  """
+  Gets a set of custom targeting values by key name
+
+  Args:
+    name (str): the name of the targeting key
+  Returns:
+    an array, or None: if the key exists, return an array of objects, where
+      each object is info about a custom targeting value
+  """
+  key_id = get_key_id_by_name(name)
+
+  # If the key exists, get predefined values.
+  if key_id is None:
+    logger.info(u'Key "{key_name}"" does not exist in DFP.'. format(
+      key_name=name))
+    return None
+
+  return get_targeting_by_key_id(key_id, key_name=name)
+
 def main():
   get_targeting_by_key_name('hb_bidder')
   get_targeting_by_key_name('hb_pb')
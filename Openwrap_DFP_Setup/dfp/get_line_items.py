@@ -2,9 +2,9 @@
 # -*- coding: utf-8 -*-
 
 import logging
-from googleads import ad_manager
 
 from Openwrap_DFP_Setup.dfp.client import get_client
+from Openwrap_DFP_Setup.dfp.paginate import paginate
 
 
 logger = logging.getLogger(__name__)
@@ -21,20 +21,31 @@ def get_line_item_count_by_order(order_id):
   dfp_client = get_client()
   line_item_service = dfp_client.GetService('LineItemService', version='v202502')
 
-   # Filter by order.
+  return paginate(line_item_service.getLineItemsByStatement,
+    *_order_filter(order_id)).count()
+
+def get_line_items_by_order(order_id):
+  """
+  Gets all the line items of an order, paging through the results.
+
+  Args:
+    order_id (long): the ID of the order
+  Returns:
+    an array of DFP line items
+  """
+  dfp_client = get_client()
+  line_item_service = dfp_client.GetService('LineItemService', version='v202502')
+
+  return list(paginate(line_item_service.getLineItemsByStatement,
+    *_order_filter(order_id), prefetch=True, label='Line items'))
+
+def _order_filter(order_id):
   query = 'WHERE orderId = :orderId'
   values = [{
     'key': 'orderId',
     'value': {
-      'xsi_type': 'TextValue',
+      'xsi_type': 'NumberValue',
       'value': order_id
     }
   }]
-  
-  statement = ad_manager.FilterStatement(query, values)
-  response = line_item_service.getLineItemsByStatement(statement.ToStatement())
-  if 'totalResultSetSize' in response :
-    return response['totalResultSetSize']
-  return 0     
-
-
+  return query, values
@@ -3,9 +3,8 @@
 
 import logging
 
-from googleads import ad_manager
-
 from Openwrap_DFP_Setup.dfp.client import get_client
+from Openwrap_DFP_Setup.dfp.paginate import paginate
 
 
 logger = logging.getLogger(__name__)
@@ -33,21 +32,7 @@ def get_order_by_name(order_name):
       'value': order_name
     }
   }]
-  statement = ad_manager.FilterStatement(query, values)
-  response = order_service.getOrdersByStatement(statement.ToStatement())
-
-  no_order_found = False
-  try:
-    no_order_found = True if len(response.results) < 1 else False 
-  except (AttributeError, KeyError):
-    no_order_found = True
-
-  if no_order_found:
-    return None
-  else:
-    order = response.results[0]
-    #logger.info(u'Found an order with name "{name}".'.format(name=order.name))
-    return order
+  return paginate(order_service.getOrdersByStatement, query, values).first()
 
 def get_all_orders(print_orders=False):
   """
@@ -62,23 +47,17 @@ def get_all_orders(print_orders=False):
   # Initialize appropriate service.
   order_service = dfp_client.GetService('OrderService', version='v202502')
 
-  # Create a statement to select orders.
-  statement = ad_manager.FilterStatement()
   print('Getting all orders...')
 
-  # Retrieve a small amount of orders at a time, paging
-  # through until all orders have been retrieved.
-  while True:
-    response = order_service.getOrdersByStatement(statement.ToStatement())
-    if hasattr(response, 'results') and response.results and len(response.results) > 0:
-      for order in response.results:
-        msg = u'Found an order with name "{name}"  id({id}).'.format(name=order.name,id=order.id)
-        if print_orders:
-          print(msg)
-      statement.offset += ad_manager.SUGGESTED_PAGE_LIMIT
-    else:
-      print('No additional orders found.')
-      break
+  # Orders are read a page at a time, the next page being fetched while
+  # the current one is printed.
+  orders = paginate(order_service.getOrdersByStatement, prefetch=True,
+    label='Orders')
+  for order in orders:
+    msg = u'Found an order with name "{name}"  id({id}).'.format(name=order.name,id=order.id)
+    if print_orders:
+      print(msg)
+  print('Found {0} orders.'.format(orders.items))
 
 def main():
   get_all_orders(print_orders=True)
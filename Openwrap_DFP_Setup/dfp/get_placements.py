@@ -2,9 +2,9 @@
 
 import logging
 
-from googleads import ad_manager
-
 from Openwrap_DFP_Setup.dfp.client import get_client
+from Openwrap_DFP_Setup.dfp.lookup_cache import cached_lookup
+from Openwrap_DFP_Setup.dfp.paginate import paginate
 from Openwrap_DFP_Setup.dfp.exceptions import (
   BadSettingException,
   DFPObjectNotFound,
@@ -15,9 +15,11 @@ from Openwrap_DFP_Setup import settings
 
 logger = logging.getLogger(__name__)
 
+@cached_lookup('placement', fields=('id', 'name'))
 def get_placement_by_name(placement_name):
   """
-  Gets a placement by name from DFP.
+  Gets a placement by name from DFP. Cached: cached placements only carry
+  their id and name.
 
   Args:
     placement_name (str): the name of the DFP placement
@@ -37,21 +39,12 @@ def get_placement_by_name(placement_name):
            'value': placement_name
        }},
   ]
-  statement = ad_manager.FilterStatement(query, values)
-  response = placement_service.getPlacementsByStatement(
-    statement.ToStatement())
-
-  no_placement_found = False
-  try:
-    no_placement_found = True if len(response.results) < 1 else False 
-  except (AttributeError, KeyError):
-    no_placement_found = True
+  placement = paginate(placement_service.getPlacementsByStatement, query, values).first()
 
-  if no_placement_found:
+  if placement is None:
     raise DFPObjectNotFound('No DFP placement found with name {0}'.format(
       placement_name))
   else:
-    placement = response.results[0]
     logger.info(u'Found placement with name "{name}".'.format(name=placement.name))
   return placement
 
@@ -5,6 +5,7 @@ import logging
 from googleads import ad_manager
 from Openwrap_DFP_Setup import settings
 from Openwrap_DFP_Setup.dfp.client import get_client
+from Openwrap_DFP_Setup.dfp.lookup_cache import cached_lookup
 from Openwrap_DFP_Setup.dfp.exceptions import (
   BadSettingException,
   DFPObjectNotFound,
@@ -14,6 +15,7 @@ from Openwrap_DFP_Setup.dfp.exceptions import (
 
 logger = logging.getLogger(__name__)
 
+@cached_lookup('root_ad_unit')
 def get_root_ad_unit_id():
   """
   Gets effectiveRootAdUnitIde from DFP.
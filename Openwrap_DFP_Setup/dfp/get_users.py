@@ -2,15 +2,16 @@
 
 import logging
 
-from googleads import ad_manager
-
 from Openwrap_DFP_Setup.dfp.client import get_client
+from Openwrap_DFP_Setup.dfp.lookup_cache import cached_lookup
+from Openwrap_DFP_Setup.dfp.paginate import paginate
 from Openwrap_DFP_Setup.dfp.exceptions import DFPObjectNotFound, MissingSettingException
 from Openwrap_DFP_Setup import settings
 
 
 logger = logging.getLogger(__name__)
 
+@cached_lookup('user')
 def get_user_id_by_email(email_address):
   """
   Returns a DFP user ID from email address.
@@ -32,23 +33,13 @@ def get_user_id_by_email(email_address):
            'value': email_address
        }},
   ]
-  statement = ad_manager.FilterStatement(query, values)
-
-  response = user_service.getUsersByStatement(statement.ToStatement())
+  # Only get the first user in case there are multiple matches.
+  user = paginate(user_service.getUsersByStatement, query, values).first()
 
   # A user is required.
-  no_user_found = False
-  try:
-    no_user_found = True if len(response.results) < 1 else False 
-  except (AttributeError, KeyError):
-    no_user_found = True
-
-  if no_user_found:
+  if user is None:
     raise DFPObjectNotFound('No DFP user found with given email address.')
 
-  # Only get the first user in case there are multiple matches.
-  user = response.results[0]
-
   logger.info(u'Found user with the given email address.')
 
   return user.id
@@ -0,0 +1,221 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class SetupJournal(object):
+  """
+  SQLite journal of the progress of setup jobs, so a failed job can be
+  resumed without creating again what it already created.
+
+  Per job it keeps the inputs and result of each stage, the line items
+  created (by order and name) and the line item <> creative associations
+  made.
+  """
+
+  def __init__(self, db_path):
+    self.db_path = db_path
+    self._lock = threading.Lock()
+    db_dir = os.path.dirname(db_path)
+    if db_dir and not os.path.exists(db_dir):
+      os.makedirs(db_dir)
+    with self._connect() as conn:
+      conn.executescript("""
+        CREATE TABLE IF NOT EXISTS stages (
+          job_id TEXT NOT NULL,
+          stage TEXT NOT NULL,
+          inputs TEXT,
+          result TEXT,
+          completed INTEGER NOT NULL DEFAULT 0,
+          updated_at REAL NOT NULL,
+          PRIMARY KEY (job_id, stage)
+        );
+        CREATE TABLE IF NOT EXISTS line_items (
+          job_id TEXT NOT NULL,
+          key TEXT NOT NULL,
+          line_item_id INTEGER NOT NULL,
+          PRIMARY KEY (job_id, key)
+        );
+        CREATE TABLE IF NOT EXISTS licas (
+          job_id TEXT NOT NULL,
+          line_item_id INTEGER NOT NULL,
+          creative_id INTEGER NOT NULL,
+          PRIMARY KEY (job_id, line_item_id, creative_id)
+        );
+      """)
+
+  def _connect(self):
+    return sqlite3.connect(self.db_path, timeout=10)
+
+  def for_job(self, job_id):
+    """
+    Returns the journal of one job.
+    """
+    return JobJournal(self, job_id)
+
+  def delete(self, job_id):
+    with self._lock, self._connect() as conn:
+      for table in ('stages', 'line_items', 'licas'):
+        conn.execute('DELETE FROM {0} WHERE job_id = ?'.format(table), (job_id,))
+
+class JobJournal(object):
+  """
+  The journal of one job. Also the checkpoint of
+  create_line_items_and_licas(): `line_items` and `licas` hold what was
+  created before, and record_line_items() and record_licas() add to them.
+  """
+
+  def __init__(self, journal, job_id):
+    self.journal = journal
+    self.job_id = job_id
+    self._line_items = None
+    self._licas = None
+
+  def begin(self, stage, inputs=None):
+    """
+    Records that a stage started, with its inputs. A stage completed before
+    keeps its result.
+    """
+    with self.journal._lock, self.journal._connect() as conn:
+      conn.execute(
+        "INSERT INTO stages (job_id, stage, inputs, updated_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (job_id, stage) DO UPDATE SET inputs = excluded.inputs, "
+        "updated_at = excluded.updated_at",
+        (self.job_id, stage, json.dumps(inputs), time.time()))
+
+  def complete(self, stage, result=None):
+    """
+    Records the result of a stage, e.g. the IDs it created.
+    """
+    with self.journal._lock, self.journal._connect() as conn:
+      conn.execute(
+        "INSERT INTO stages (job_id, stage, result, completed, updated_at) "
+        "VALUES (?, ?, ?, 1, ?) "
+        "ON CONFLICT (job_id, stage) DO UPDATE SET result = excluded.result, "
+        "completed = 1, updated_at = excluded.updated_at",
+        (self.job_id, stage, json.dumps(result), time.time()))
+
+  def get_inputs(self, stage):
+    """
+    Returns the inputs recorded for a stage, or None.
+    """
+    with self.journal._connect() as conn:
+      row = conn.execute(
+        "SELECT inputs FROM stages WHERE job_id = ? AND stage = ?",
+        (self.job_id, stage)).fetchone()
+    return json.loads(row[0]) if row and row[0] is not None else None
+
+  def get_result(self, stage):
+    """
+    Returns (completed, result) of a stage.
+    """
+    with self.journal._connect() as conn:
+      row = conn.execute(
+        "SELECT completed, result FROM stages WHERE job_id = ? AND stage = ?",
+        (self.job_id, stage)).fetchone()
+    if row is None or not row[0]:
+      return False, None
+    return True, json.loads(row[1]) if row[1] is not None else None
+
+  def run_stage(self, stage, func, *args, **kwargs):
+    """
+    Returns the result of a stage completed before, else runs func and
+    records its (JSON-serializable) result.
+    """
+    completed, result = self.get_result(stage)
+    if completed:
+      return result
+    self.begin(stage)
+    result = func(*args, **kwargs)
+    self.complete(stage, result)
+    return result
+
+  @property
+  def line_items(self):
+    """
+    Line item IDs created by the job, keyed by get_line_item_key().
+    """
+    if self._line_items is None:
+      with self.journal._connect() as conn:
+        self._line_items = dict(conn.execute(
+          "SELECT key, line_item_id FROM line_items WHERE job_id = ?",
+          (self.job_id,)))
+    return self._line_items
+
+  def record_line_items(self, line_items, line_item_ids):
+    """
+    Records line items that were created.
+
+    Args:
+      line_items (arr): the line item configs
+      line_item_ids (arr): their IDs, in the same order
+    """
+    rows = [(self.job_id, get_line_item_key(line_item), line_item_id)
+            for line_item, line_item_id in zip(line_items, line_item_ids)]
+    with self.journal._lock, self.journal._connect() as conn:
+      conn.executemany(
+        "INSERT OR REPLACE INTO line_items (job_id, key, line_item_id) "
+        "VALUES (?, ?, ?)", rows)
+    self.line_items.update((key, line_item_id) for _, key, line_item_id in rows)
+
+  @property
+  def licas(self):
+    """
+    (line item ID, creative ID) pairs associated by the job.
+    """
+    if self._licas is None:
+      with self.journal._connect() as conn:
+        self._licas = set(conn.execute(
+          "SELECT line_item_id, creative_id FROM licas WHERE job_id = ?",
+          (self.job_id,)))
+    return self._licas
+
+  def record_licas(self, licas):
+    """
+    Records line item <> creative associations that were made. Called from
+    the LICA worker threads.
+
+    Args:
+      licas (arr): LICA configs
+    """
+    pairs = [get_lica_key(lica) for lica in licas]
+    with self.journal._lock, self.journal._connect() as conn:
+      conn.executemany(
+        "INSERT OR IGNORE INTO licas (job_id, line_item_id, creative_id) "
+        "VALUES (?, ?, ?)", [(self.job_id,) + pair for pair in pairs])
+      self.licas.update(pairs)
+
+  def get_summary(self):
+    """
+    Returns the completed stages and the number of line items and LICAs
+    recorded.
+    """
+    with self.journal._connect() as conn:
+      stages = [stage for stage, in conn.execute(
+        "SELECT stage FROM stages WHERE job_id = ? AND completed = 1 "
+        "ORDER BY updated_at", (self.job_id,))]
+      line_items, = conn.execute(
+        "SELECT COUNT(*) FROM line_items WHERE job_id = ?",
+        (self.job_id,)).fetchone()
+      licas, = conn.execute(
+        "SELECT COUNT(*) FROM licas WHERE job_id = ?",
+        (self.job_id,)).fetchone()
+    return {'completed_stages': stages, 'line_items': line_items,
+      'licas': licas}
+
+def get_line_item_key(line_item):
+  # Line item names are unique within an order
+  return '{0}:{1}'.format(line_item['orderId'], line_item['name'])
+
+def get_lica_key(lica):
+  # Works on LICA configs as well as LICAs fetched from DFP, which are SOAP
+  # objects without dict methods
+  def get_field(name):
+    try:
+      return lica[name]
+    except (KeyError, TypeError):
+      return getattr(lica, name, None)
+  return (int(get_field('lineItemId')),
+    int(get_field('creativeSetId') or get_field('creativeId')))
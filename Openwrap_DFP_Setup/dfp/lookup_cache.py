@@ -0,0 +1,275 @@
+import functools
+import inspect
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from Openwrap_DFP_Setup import constant, settings
+from Openwrap_DFP_Setup.dfp.client import CachedAdManagerClient, get_client
+from Openwrap_DFP_Setup.dfp.exceptions import DFPObjectNotFound
+from Openwrap_DFP_Setup.dfp.plan_client import ServiceObject
+
+
+logger = logging.getLogger(__name__)
+
+class LookupCache(object):
+  """
+  SQLite-backed cache of DFP lookups, keyed by network code, entity type and
+  lookup key. Entries expire after a per-type TTL; lookups that found
+  nothing are cached too, for a shorter time. Past `max_entries`, the least
+  recently used entries are evicted.
+  """
+
+  def __init__(self, db_path, ttls=None, negative_ttl=None, max_entries=None):
+    self.db_path = db_path
+    self.ttls = ttls if ttls is not None else constant.LOOKUP_CACHE_TTL_SECONDS
+    self.negative_ttl = (negative_ttl if negative_ttl is not None
+      else constant.LOOKUP_CACHE_NEGATIVE_TTL_SECONDS)
+    self.max_entries = (max_entries if max_entries is not None
+      else constant.LOOKUP_CACHE_MAX_ENTRIES)
+    self._lock = threading.Lock()
+    self.stats = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'expired': 0,
+      'evicted': 0}
+    db_dir = os.path.dirname(db_path)
+    if db_dir and not os.path.exists(db_dir):
+      os.makedirs(db_dir)
+    with self._connect() as conn:
+      conn.execute("""
+        CREATE TABLE IF NOT EXISTS lookups (
+          network_code TEXT NOT NULL,
+          entity_type TEXT NOT NULL,
+          key TEXT NOT NULL,
+          found INTEGER NOT NULL,
+          value TEXT,
+          expires_at REAL NOT NULL,
+          last_used REAL NOT NULL,
+          PRIMARY KEY (network_code, entity_type, key)
+        )
+      """)
+      conn.execute(
+        "CREATE INDEX IF NOT EXISTS lookups_last_used ON lookups (last_used)")
+
+  def _connect(self):
+    return sqlite3.connect(self.db_path, timeout=10)
+
+  def get(self, network_code, entity_type, key):
+    """
+    Looks up a cached entry.
+
+    Returns:
+      (hit, found, value): whether a live entry exists, whether the entity
+        was found in DFP, and the cached value
+    """
+    now = time.time()
+    with self._lock, self._connect() as conn:
+      row = conn.execute(
+        "SELECT found, value, expires_at FROM lookups "
+        "WHERE network_code = ? AND entity_type = ? AND key = ?",
+        (network_code, entity_type, key)).fetchone()
+      if row is None:
+        self.stats['misses'] += 1
+        return False, False, None
+      found, value, expires_at = row
+      if expires_at < now:
+        conn.execute(
+          "DELETE FROM lookups "
+          "WHERE network_code = ? AND entity_type = ? AND key = ?",
+          (network_code, entity_type, key))
+        self.stats['expired'] += 1
+        self.stats['misses'] += 1
+        return False, False, None
+      conn.execute(
+        "UPDATE lookups SET last_used = ? "
+        "WHERE network_code = ? AND entity_type = ? AND key = ?",
+        (now, network_code, entity_type, key))
+      self.stats['hits' if found else 'negative_hits'] += 1
+    return True, bool(found), json.loads(value) if value is not None else None
+
+  def set(self, network_code, entity_type, key, value, found=True):
+    """
+    Caches a lookup result.
+
+    Args:
+      network_code (str): the network looked up in
+      entity_type (str): e.g. 'order', a key of constant.LOOKUP_CACHE_TTL_SECONDS
+      key (str): what was looked up, e.g. the order name
+      value: a JSON-serializable result
+      found (bool): False caches that nothing was found, `value` being the
+        error to raise, if any
+    """
+    now = time.time()
+    ttl = self.ttls.get(entity_type, 3600) if found else self.negative_ttl
+    with self._lock, self._connect() as conn:
+      conn.execute(
+        "INSERT OR REPLACE INTO lookups "
+        "(network_code, entity_type, key, found, value, expires_at, last_used) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (network_code, entity_type, key, 1 if found else 0,
+          json.dumps(value) if value is not None else None, now + ttl, now))
+      count, = conn.execute("SELECT COUNT(*) FROM lookups").fetchone()
+      if count > self.max_entries:
+        cursor = conn.execute(
+          "DELETE FROM lookups WHERE rowid IN "
+          "(SELECT rowid FROM lookups ORDER BY last_used LIMIT ?)",
+          (count - self.max_entries,))
+        self.stats['evicted'] += cursor.rowcount
+
+  def invalidate(self, network_code=None, entity_type=None, key=None):
+    """
+    Drops cached entries, all of them or those matching the given fields.
+
+    Returns:
+      an integer: the number of entries dropped
+    """
+    conditions = []
+    params = []
+    for column, value in (('network_code', network_code),
+        ('entity_type', entity_type), ('key', key)):
+      if value is not None:
+        conditions.append('{0} = ?'.format(column))
+        params.append(value)
+    where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+    with self._lock, self._connect() as conn:
+      cursor = conn.execute('DELETE FROM lookups' + where, params)
+    return cursor.rowcount
+
+  def get_stats(self):
+    """
+    Returns the hit/miss counters and the number of live entries per type.
+    """
+    with self._lock, self._connect() as conn:
+      rows = conn.execute(
+        "SELECT entity_type, COUNT(*) FROM lookups WHERE expires_at >= ? "
+        "GROUP BY entity_type", (time.time(),)).fetchall()
+      stats = dict(self.stats)
+    stats['entries'] = dict(rows)
+    return stats
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_lookup_cache():
+  """
+  Returns the process-wide cache at settings.LOOKUP_CACHE_FILE, or None when
+  the cache is disabled.
+  """
+  global _cache
+  path = getattr(settings, 'LOOKUP_CACHE_FILE', None)
+  if not path:
+    return None
+  with _cache_lock:
+    if _cache is None or _cache.db_path != path:
+      _cache = LookupCache(path)
+    return _cache
+
+def _get_network_code():
+  # Only lookups in live networks are cached: dry runs and the fake backend
+  # answer with made-up IDs
+  client = get_client()
+  if not isinstance(client, CachedAdManagerClient):
+    return None
+  return str(client.network_code)
+
+def _make_key(args):
+  return '\x1f'.join(str(arg) for arg in args)
+
+def cached_lookup(entity_type, fields=None):
+  """
+  Caches the results of a lookup function in the lookup cache, keyed by its
+  arguments, defaults included, however they are passed. DFPObjectNotFound
+  errors and None results are cached as negative entries.
+
+  Args:
+    entity_type (str): the entity type, for the TTL
+    fields (tuple): for functions returning DFP objects, the attributes
+      kept in the cache; cached objects are returned with these only
+  """
+  def decorator(func):
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+      cache = get_lookup_cache()
+      network_code = _get_network_code() if cache is not None else None
+      if network_code is None:
+        return func(*args, **kwargs)
+
+      bound = signature.bind(*args, **kwargs)
+      bound.apply_defaults()
+      key = _make_key(bound.arguments.values())
+      hit, found, value = cache.get(network_code, entity_type, key)
+      if hit:
+        if not found:
+          if value is not None:
+            raise DFPObjectNotFound(value)
+          return None
+        return ServiceObject(value) if fields else value
+
+      try:
+        result = func(*args, **kwargs)
+      except DFPObjectNotFound as e:
+        cache.set(network_code, entity_type, key, str(e), found=False)
+        raise
+      if result is None:
+        cache.set(network_code, entity_type, key, None, found=False)
+      else:
+        cache.set(network_code, entity_type, key, _to_cached(result, fields))
+      return result
+    return wrapper
+  return decorator
+
+def _to_cached(result, fields):
+  if not fields:
+    return result
+  return {field: _get_field(result, field) for field in fields}
+
+def _get_field(obj, field):
+  try:
+    return obj[field]
+  except (KeyError, TypeError):
+    return getattr(obj, field, None)
+
+def remember_lookup(entity_type, args, value, fields=None):
+  """
+  Caches the result of a lookup without making it, e.g. for an entity that
+  was just created and would otherwise be cached as missing.
+
+  Args:
+    entity_type (str): the entity type
+    args (tuple): all the arguments of the lookup function, in order
+    value: the lookup result
+    fields (tuple): as for cached_lookup()
+  """
+  cache = get_lookup_cache()
+  network_code = _get_network_code() if cache is not None else None
+  if network_code is None:
+    return
+  cache.set(network_code, entity_type, _make_key(args), _to_cached(value, fields))
+
+def refresh_lookups(entity_type=None, key=None, network_code=None):
+  """
+  Drops cached lookups so the next ones hit DFP.
+
+  Args:
+    entity_type (str): only this entity type
+    key (str): only this lookup key, e.g. an order name
+    network_code (str): only this network
+  Returns:
+    an integer: the number of entries dropped
+  """
+  cache = get_lookup_cache()
+  if cache is None:
+    return 0
+  dropped = cache.invalidate(network_code, entity_type, key)
+  logger.info('Dropped {0} cached DFP lookups.'.format(dropped))
+  return dropped
+
+def get_lookup_cache_stats():
+  """
+  Returns the lookup cache counters, or None when the cache is disabled.
+  """
+  cache = get_lookup_cache()
+  return cache.get_stats() if cache is not None else None
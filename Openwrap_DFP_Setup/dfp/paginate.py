@@ -0,0 +1,140 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from googleads import ad_manager
+
+from Openwrap_DFP_Setup import constant
+from Openwrap_DFP_Setup.dfp.batch_utils import submit_in_context
+
+
+logger = logging.getLogger(__name__)
+
+class Paginator(object):
+  """
+  Streams the results of a get*ByStatement call page by page, so a query
+  matching many objects is read fully without holding them all.
+
+  `pages` and `items` count what was read so far and `total` is the
+  totalResultSetSize reported by DFP. With `prefetch`, the next page is
+  requested on a background thread while the current one is processed.
+  """
+
+  def __init__(self, fetch, statement, page_size=None, prefetch=False,
+    label='Results'):
+    """
+    Args:
+      fetch (function): the service method, e.g.
+        line_item_service.getLineItemsByStatement
+      statement: an ad_manager.FilterStatement or StatementBuilder
+      page_size (int): results per request, defaults to
+        constant.STATEMENT_PAGE_SIZE
+      prefetch (bool): request the next page while the current one is used
+      label (str): what is read, for logging
+    """
+    if page_size is None:
+      page_size = constant.STATEMENT_PAGE_SIZE
+    self.fetch = fetch
+    self.statement = statement
+    self.statement.limit = page_size
+    self.page_size = page_size
+    self.prefetch = prefetch
+    self.label = label
+    self.pages = 0
+    self.items = 0
+    self.total = None
+
+  def _to_statement(self, offset):
+    self.statement.offset = offset
+    return self.statement.ToStatement()
+
+  def iter_pages(self):
+    """
+    Yields:
+      arrays of DFP objects, one per page
+    """
+    offset = self.statement.offset or 0
+    executor = ThreadPoolExecutor(max_workers=1) if self.prefetch else None
+    next_page = None
+    try:
+      response = self.fetch(self._to_statement(offset))
+      while True:
+        results = list(_get_field(response, 'results') or [])
+        self.total = _get_field(response, 'totalResultSetSize') or 0
+        offset += self.page_size
+        has_more = bool(results) and offset < self.total
+        if has_more and executor is not None:
+          # Statements are built here, as the caller may reuse this one
+          next_page = submit_in_context(executor, self.fetch,
+            self._to_statement(offset))
+        if results:
+          self.pages += 1
+          self.items += len(results)
+          yield results
+        if not has_more:
+          break
+        if next_page is not None:
+          response = next_page.result()
+          next_page = None
+        else:
+          response = self.fetch(self._to_statement(offset))
+    finally:
+      if executor is not None:
+        executor.shutdown(wait=False)
+      logger.debug(u'{0}: read {1} of {2} in {3} page(s).'.format(
+        self.label, self.items, self.total, self.pages))
+
+  def __iter__(self):
+    for page in self.iter_pages():
+      for item in page:
+        yield item
+
+  def _fetch_one(self):
+    self.statement.limit = 1
+    try:
+      response = self.fetch(self._to_statement(0))
+    finally:
+      self.statement.limit = self.page_size
+    self.total = _get_field(response, 'totalResultSetSize') or 0
+    return response
+
+  def first(self):
+    """
+    Returns the first result, or None, with a single request of one result.
+    """
+    results = _get_field(self._fetch_one(), 'results') or []
+    return results[0] if results else None
+
+  def count(self):
+    """
+    Returns the number of objects the statement matches, with a single
+    request of one result.
+    """
+    self._fetch_one()
+    return self.total
+
+def paginate(fetch, query='', values=None, page_size=None, prefetch=False,
+  label='Results'):
+  """
+  Returns a Paginator over the objects matching a PQL filter.
+
+  Args:
+    fetch (function): the service method, e.g.
+      order_service.getOrdersByStatement
+    query (str): the filter, e.g. 'WHERE orderId = :orderId'
+    values (arr): the bind variables of the filter
+    page_size (int): results per request
+    prefetch (bool): request the next page while the current one is used
+    label (str): what is read, for logging
+  Returns:
+    a Paginator, iterable over the matching objects
+  """
+  statement = ad_manager.FilterStatement(query, values)
+  return Paginator(fetch, statement, page_size=page_size, prefetch=prefetch,
+    label=label)
+
+def _get_field(obj, name):
+  # SOAP responses have attributes, stand-ins are dicts too
+  try:
+    return obj[name]
+  except (KeyError, TypeError):
+    return getattr(obj, name, None)
@@ -0,0 +1,205 @@
+import itertools
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from Openwrap_DFP_Setup import constant
+
+
+logger = logging.getLogger(__name__)
+
+# Services looked up but never created by a setup. A dry run assumes these
+# already exist in the network; everything else is planned as new.
+REFERENCE_SERVICES = (
+  'CompanyService',
+  'CreativeTemplateService',
+  'InventoryService',
+  'PlacementService',
+  'UserService',
+)
+
+# Count of created objects reported by create calls of each method
+PLANNED_OBJECTS = OrderedDict([
+  ('createCustomTargetingKeys', 'targeting_keys'),
+  ('createCustomTargetingValues', 'targeting_values'),
+  ('createOrders', 'orders'),
+  ('createCompanies', 'advertisers'),
+  ('createCreatives', 'creatives'),
+  ('createCreativeSets', 'creative_sets'),
+  ('createLineItems', 'line_items'),
+  ('createLineItemCreativeAssociations', 'licas'),
+])
+
+class ServiceObject(dict):
+  """
+  Stand-in for a SOAP response object, readable both as a dict and through
+  attributes like the objects returned by googleads.
+  """
+
+  def __getattr__(self, name):
+    try:
+      return self[name]
+    except KeyError:
+      raise AttributeError(name)
+
+class PlanningService(object):
+  """
+  Stand-in for a DFP service: every method call is recorded by the client
+  and answered locally.
+  """
+
+  def __init__(self, client, service_name):
+    self._client = client
+    self._service_name = service_name
+
+  def __getattr__(self, method_name):
+    def call(*args):
+      return self._client.call(self._service_name, method_name, args)
+    return call
+
+class PlanningAdManagerClient(object):
+  """
+  Local stand-in for an AdManagerClient used for dry runs.
+
+  Lookups of reference objects (advertisers, users, placements...) return
+  a match, lookups of anything a setup creates return nothing, and create
+  calls echo their objects back with new IDs. Every call is recorded with
+  the number of objects and payload bytes it would have sent.
+
+  As nothing is read from the network, the planned counts are upper
+  bounds: targeting values, orders or line items that already exist are
+  counted as created.
+  """
+
+  network_code = 'plan'
+
+  def __init__(self):
+    self._ids = itertools.count(1)
+    self._lock = threading.Lock()
+    self._owner = threading.get_ident()
+    self.calls = []
+
+  def GetService(self, service_name, version=None, server=None):
+    return PlanningService(self, service_name)
+
+  def call(self, service_name, method_name, args):
+    payload = args[0] if args else None
+    num_objects = len(payload) if isinstance(payload, list) else 0
+    payload_bytes = len(json.dumps(args, default=str)) if args else 0
+    with self._lock:
+      self.calls.append({
+        'service': service_name,
+        'method': method_name,
+        'objects': num_objects,
+        'payload_bytes': payload_bytes,
+        # Calls made from batch workers run concurrently with each other
+        'concurrent': threading.get_ident() != self._owner,
+      })
+    return self._respond(service_name, method_name, payload)
+
+  def _next_id(self):
+    with self._lock:
+      return next(self._ids)
+
+  def _respond(self, service_name, method_name, payload):
+    if method_name.startswith('create'):
+      return [ServiceObject(obj, id=self._next_id()) for obj in payload]
+    if method_name.startswith('update'):
+      return [ServiceObject(obj) for obj in payload]
+    if method_name == 'getCurrentNetwork':
+      return ServiceObject(id=self._next_id(), networkCode=self.network_code,
+        effectiveRootAdUnitId=self._next_id())
+    if method_name.startswith('perform'):
+      return ServiceObject(numChanges=0)
+    if method_name.endswith('ByStatement'):
+      if service_name in REFERENCE_SERVICES:
+        name = _get_bound_text(payload) or 'planned'
+        return ServiceObject(totalResultSetSize=1, results=[ServiceObject(
+          id=self._next_id(), name=name, email=name, type='ADVERTISER')])
+      return ServiceObject(totalResultSetSize=0, results=[])
+    return None
+
+  def get_report(self, max_workers=None):
+    """
+    Summarizes the recorded calls.
+
+    Args:
+      max_workers (int): concurrent requests of batch operations, defaults
+        to constant.MAX_CONCURRENT_REQUESTS
+    Returns:
+      a dict with the planned object counts, upper bounds as flagged by
+        `counts_are_upper_bounds`, and per service method the number of
+        calls, objects, payload bytes and estimated seconds, plus the
+        projected wall time of the whole run
+    """
+    if max_workers is None:
+      max_workers = constant.MAX_CONCURRENT_REQUESTS
+
+    methods = OrderedDict()
+    sequential_seconds = 0.0
+    concurrent_seconds = {}
+    concurrent_calls = {}
+    for call in self.calls:
+      name = '{0}.{1}'.format(call['service'], call['method'])
+      seconds = estimate_call_seconds(call['method'], call['objects'])
+      stats = methods.setdefault(name, {'calls': 0, 'objects': 0,
+        'payload_bytes': 0, 'seconds': 0.0})
+      stats['calls'] += 1
+      stats['objects'] += call['objects']
+      stats['payload_bytes'] += call['payload_bytes']
+      stats['seconds'] += seconds
+      if call['concurrent']:
+        concurrent_seconds[name] = concurrent_seconds.get(name, 0.0) + seconds
+        concurrent_calls[name] = concurrent_calls.get(name, 0) + 1
+      else:
+        sequential_seconds += seconds
+
+    # Concurrent calls of a method are spread over the batch worker pool
+    projected_seconds = sequential_seconds
+    for name, seconds in concurrent_seconds.items():
+      projected_seconds += seconds / min(max_workers, concurrent_calls[name])
+
+    counts = OrderedDict((label, 0) for label in PLANNED_OBJECTS.values())
+    for name, stats in methods.items():
+      label = PLANNED_OBJECTS.get(name.split('.', 1)[1])
+      if label:
+        counts[label] += stats['objects']
+
+    for stats in methods.values():
+      stats['seconds'] = round(stats['seconds'], 2)
+
+    return {
+      'counts': counts,
+      'counts_are_upper_bounds': True,
+      'api_calls': sum(stats['calls'] for stats in methods.values()),
+      'payload_bytes': sum(stats['payload_bytes'] for stats in methods.values()),
+      'methods': methods,
+      'max_workers': max_workers,
+      'projected_seconds': round(projected_seconds, 2),
+    }
+
+def estimate_call_seconds(method_name, num_objects):
+  """
+  Estimates the latency of a DFP call from the fixed cost of a request and
+  the cost of each object sent in it.
+
+  Args:
+    method_name (str): the service method
+    num_objects (int): objects sent in the call
+  Returns:
+    a float: seconds
+  """
+  per_object = constant.PLAN_OBJECT_LATENCY_SECONDS.get(method_name,
+    constant.PLAN_OBJECT_LATENCY_SECONDS['default'])
+  return constant.PLAN_REQUEST_LATENCY_SECONDS + per_object * num_objects
+
+def _get_bound_text(statement):
+  # The first text bind variable of a statement, e.g. the name looked up
+  if not isinstance(statement, dict):
+    return None
+  for value in statement.get('values') or []:
+    bound = value.get('value') or {}
+    if bound.get('xsi_type') == 'TextValue':
+      return bound.get('value')
+  return None
@@ -0,0 +1,242 @@
+import hashlib
+import json
+import logging
+
+from Openwrap_DFP_Setup import constant
+from Openwrap_DFP_Setup.dfp.batch_utils import chunk_list, run_chunks
+from Openwrap_DFP_Setup.dfp.client import get_client
+from Openwrap_DFP_Setup.dfp.get_line_items import get_line_items_by_order
+from Openwrap_DFP_Setup.dfp.journal import get_line_item_key
+
+
+logger = logging.getLogger(__name__)
+
+def get_line_item_fingerprint(line_item):
+  """
+  Returns a hash of what a line item sells and how: its type, rate, sizes
+  and targeting, but not its name. Works on line item configs as well as
+  line items fetched from DFP, whose targeting DFP may have regrouped.
+
+  Args:
+    line_item: a line item config or DFP line item
+  Returns:
+    a string
+  """
+  cost = _get_field(line_item, 'costPerUnit') or {}
+  targeting = _get_field(line_item, 'targeting') or {}
+  inventory = _get_field(targeting, 'inventoryTargeting') or {}
+  technology = _get_field(targeting, 'technologyTargeting') or {}
+  device_categories = _get_field(
+    _get_field(technology, 'deviceCategoryTargeting') or {},
+    'targetedDeviceCategories') or []
+  device_capabilities = _get_field(
+    _get_field(technology, 'deviceCapabilityTargeting') or {},
+    'targetedDeviceCapabilities') or []
+
+  fingerprint = [
+    _get_field(line_item, 'lineItemType'),
+    str(_get_field(cost, 'currencyCode')),
+    int(_get_field(cost, 'microAmount') or 0),
+    sorted('{0}x{1}'.format(
+      _get_field(_get_field(placeholder, 'size') or {}, 'width'),
+      _get_field(_get_field(placeholder, 'size') or {}, 'height'))
+      for placeholder in _get_field(line_item, 'creativePlaceholders') or []),
+    sorted(str(placement_id) for placement_id in
+      _get_field(inventory, 'targetedPlacementIds') or []),
+    sorted(str(_get_field(ad_unit, 'adUnitId')) for ad_unit in
+      _get_field(inventory, 'targetedAdUnits') or []),
+    sorted(str(_get_field(device, 'id')) for device in device_categories),
+    sorted(str(_get_field(device, 'id')) for device in device_capabilities),
+    _normalize_custom_targeting(_get_field(targeting, 'customTargeting')),
+  ]
+  return hashlib.sha256(json.dumps(fingerprint).encode('utf-8')).hexdigest()
+
+def _normalize_custom_targeting(node):
+  # Sets are flattened and sorted so that e.g. AND(a, b) sent as a config
+  # and OR(AND(b, a)) returned by DFP compare equal
+  if not node:
+    return None
+  children = _get_field(node, 'children')
+  if children is None:
+    return [
+      str(_get_field(node, 'keyId')),
+      _get_field(node, 'operator'),
+      sorted(str(value_id) for value_id in _get_field(node, 'valueIds') or []),
+    ]
+  if isinstance(children, dict):
+    children = [children]
+  operator = _get_field(node, 'logicalOperator')
+  normalized = []
+  for child in children:
+    child = _normalize_custom_targeting(child)
+    if child is None:
+      continue
+    if child[0] == 'SET' and child[1] == operator:
+      normalized.extend(child[2])
+    else:
+      normalized.append(child)
+  if not normalized:
+    return None
+  if len(normalized) == 1:
+    return normalized[0]
+  return ['SET', operator, sorted(normalized, key=json.dumps)]
+
+def _get_field(obj, name):
+  # Configs are dicts, SOAP objects have attributes
+  try:
+    return obj[name]
+  except (KeyError, TypeError):
+    return getattr(obj, name, None)
+
+def _set_field(obj, name, value):
+  if isinstance(obj, dict):
+    obj[name] = value
+  else:
+    setattr(obj, name, value)
+
+def plan_line_items(line_items, existing_line_items, exclude=None):
+  """
+  Compares line item configs with the line items already in their orders.
+
+  A config matches the existing line item of its order with the same name,
+  or else an unmatched one with the same fingerprint (e.g. renamed by an
+  earlier version of the tool). Each existing line item matches once.
+
+  Args:
+    line_items (arr): line item configs
+    existing_line_items (arr): DFP line items of the orders of the configs
+    exclude (set): get_line_item_key() of configs to plan as created
+      whatever exists
+  Returns:
+    a dict with
+      create: indexes of the configs to create
+      update: (index, existing line item) pairs whose fingerprint differs
+      skip: (index, existing line item ID) pairs already set up
+      extra: IDs of the existing line items no config matched
+  """
+  by_name = {}
+  by_fingerprint = {}
+  for line_item in existing_line_items:
+    order_id = str(_get_field(line_item, 'orderId'))
+    by_name[(order_id, _get_field(line_item, 'name'))] = line_item
+    by_fingerprint.setdefault(
+      (order_id, get_line_item_fingerprint(line_item)), []).append(line_item)
+
+  plan = {'create': [], 'update': [], 'skip': [], 'extra': []}
+  matched = set()
+  renamed = []
+  for index, config in enumerate(line_items):
+    if exclude and get_line_item_key(config) in exclude:
+      plan['create'].append(index)
+      continue
+    order_id = str(config['orderId'])
+    fingerprint = get_line_item_fingerprint(config)
+    existing = by_name.get((order_id, config['name']))
+    if existing is not None:
+      matched.add(_get_field(existing, 'id'))
+      if get_line_item_fingerprint(existing) == fingerprint:
+        plan['skip'].append((index, _get_field(existing, 'id')))
+      else:
+        plan['update'].append((index, existing))
+    else:
+      renamed.append((index, order_id, fingerprint))
+
+  # Fingerprints are only matched once names have claimed their line items
+  for index, order_id, fingerprint in renamed:
+    candidates = [line_item for line_item in
+                  by_fingerprint.get((order_id, fingerprint), [])
+                  if _get_field(line_item, 'id') not in matched]
+    if candidates:
+      matched.add(_get_field(candidates[0], 'id'))
+      plan['skip'].append((index, _get_field(candidates[0], 'id')))
+    else:
+      plan['create'].append(index)
+  plan['create'].sort()
+  plan['skip'].sort()
+
+  plan['extra'] = [_get_field(line_item, 'id') for line_item in existing_line_items
+                   if _get_field(line_item, 'id') not in matched]
+  return plan
+
+def apply_line_item_config(line_item, config):
+  """
+  Copies the rate, sizes and targeting of a config onto an existing line
+  item, leaving its name, dates and status alone.
+
+  Args:
+    line_item: a DFP line item
+    config (dict): a line item config
+  Returns:
+    the line item
+  """
+  for field in ('lineItemType', 'costPerUnit', 'valueCostPerUnit',
+      'creativePlaceholders'):
+    if field in config:
+      _set_field(line_item, field, config[field])
+  targeting = _get_field(line_item, 'targeting')
+  if targeting is None:
+    _set_field(line_item, 'targeting', config['targeting'])
+  else:
+    for field in ('inventoryTargeting', 'technologyTargeting', 'customTargeting'):
+      _set_field(targeting, field, config['targeting'].get(field))
+  return line_item
+
+def _update_line_item_chunk(chunk):
+  line_item_service = get_client().GetService('LineItemService', version='v202502')
+  return [item['id'] for item in line_item_service.updateLineItems(chunk)]
+
+def reconcile_line_items(line_items, chunk_size=None, max_workers=None,
+  checkpoint=None, line_items_by_order=None):
+  """
+  Brings the orders of line item configs in line with them: the line items
+  of each order are fetched with one paged query, those that differ from
+  their config are updated, and those that are missing are left to create.
+  Extending a setup's price buckets thus only creates the new buckets.
+
+  Existing line items keep their creatives; pass their IDs to
+  create_line_items_and_licas() as existing_line_item_ids to add the
+  associations they miss.
+
+  Args:
+    line_items (arr): line item configs
+    chunk_size (int): line items per update request, defaults to
+      constant.LINE_ITEMS_PER_REQUEST
+    max_workers (int): max number of concurrent update requests
+    checkpoint: a JobJournal; line items it recorded are left to create, so
+      create_line_items_and_licas() resumes their associations
+    line_items_by_order (dict): line items already fetched, keyed by order
+      ID, e.g. by assign_order_shards(); only the other orders are fetched
+  Returns:
+    a tuple: (line item IDs in input order, None for those to create, and
+      the plan from plan_line_items())
+  """
+  if chunk_size is None:
+    chunk_size = constant.LINE_ITEMS_PER_REQUEST
+
+  fetched = {str(order_id): order_line_items for order_id, order_line_items
+             in (line_items_by_order or {}).items()}
+  existing_line_items = []
+  for order_id in sorted(set(config['orderId'] for config in line_items), key=str):
+    order_line_items = fetched.get(str(order_id))
+    if order_line_items is None:
+      order_line_items = get_line_items_by_order(order_id)
+    existing_line_items.extend(order_line_items)
+
+  plan = plan_line_items(line_items, existing_line_items,
+    exclude=checkpoint.line_items if checkpoint is not None else None)
+  logger.info(u'Line item plan: {0} to create, {1} to update, {2} up to date, '
+    '{3} other line items in the orders.'.format(len(plan['create']),
+      len(plan['update']), len(plan['skip']), len(plan['extra'])))
+
+  line_item_ids = [None] * len(line_items)
+  for index, line_item_id in plan['skip']:
+    line_item_ids[index] = line_item_id
+  if plan['update']:
+    updates = [apply_line_item_config(existing, line_items[index])
+               for index, existing in plan['update']]
+    run_chunks(_update_line_item_chunk, chunk_list(updates, chunk_size),
+      max_workers=max_workers, retries=constant.BATCH_MAX_RETRIES,
+      label='Line item update')
+    for index, existing in plan['update']:
+      line_item_ids[index] = _get_field(existing, 'id')
+  return line_item_ids, plan
@@ -2,7 +2,8 @@
 import logging
 from googleads import ad_manager
 
-from dfp.client import get_client
+from Openwrap_DFP_Setup.dfp.client import get_client
+from Openwrap_DFP_Setup.dfp.paginate import Paginator
 
 
 logger = logging.getLogger(__name__)
@@ -20,34 +21,31 @@ def remove_licas(line_item_id):
   lica_service = dfp_client.GetService(
     'LineItemCreativeAssociationService', version='v202502')
 
- # Create query.
-  statement = (dfp.StatementBuilder()
+  # Create query.
+  statement = (ad_manager.StatementBuilder(version='v202502')
                .Where('lineItemId = :lineItemId AND status = :status')
                .WithBindVariable('status', 'ACTIVE')
                .WithBindVariable('lineItemId', int(line_item_id)))
 
-  num_deactivated_licas = 0
-
   # Get LICAs by statement.
-  while True:
-    response = lica_service.getLineItemCreativeAssociationsByStatement(
-        statement.ToStatement())
-
-    if hasattr(response, 'results') and response.results and len(response.results):
-      for lica in response.results:
-        print ('LICA with line item id "%s", creative id "%s", and status'
-               ' "%s" will be deactivated.' %
-               (lica.lineItemId, lica.creativeId, lica.status))
-
-      result = lica_service.performLineItemCreativeAssociationAction(
-        {'xsi_type': 'DeactivateLineItemCreativeAssociations'},
-        statement.ToStatement())
-
-      if result and int(result['numChanges']) > 0:
-        num_deactivated_licas += int(result['numChanges'])
-      statement.offset += statement.limit
-    else:
-      break
+  licas = Paginator(lica_service.getLineItemCreativeAssociationsByStatement,
+    statement, label='LICAs')
+  for lica in licas:
+    print ('LICA with line item id "%s", creative id "%s", and status'
+           ' "%s" will be deactivated.' %
+           (lica.lineItemId, lica.creativeId, lica.status))
+
+  # Deactivated LICAs no longer match the statement, so they are all
+  # deactivated with a single unpaged action rather than page by page.
+  num_deactivated_licas = 0
+  if licas.items:
+    statement.offset = None
+    statement.limit = None
+    result = lica_service.performLineItemCreativeAssociationAction(
+      {'xsi_type': 'DeactivateLineItemCreativeAssociations'},
+      statement.ToStatement())
+    if result and int(result['numChanges']) > 0:
+      num_deactivated_licas = int(result['numChanges'])
 
   logger.info(
      u'Removed {0} line item <> creative associations.'.format(num_deactivated_licas))
@@ -0,0 +1,277 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from Openwrap_DFP_Setup import constant
+
+
+logger = logging.getLogger(__name__)
+
+# Job the current context works for. Batch workers inherit it, so the DFP
+# calls they make are aggregated under the job.
+_current_job = ContextVar('tracing_job', default=None)
+# Stage of the job the current context is in
+_current_stage = ContextVar('tracing_stage', default=None)
+
+class Tracer(object):
+  """
+  Aggregates spans (timed operations) by name, over the whole process and
+  per job for the most recent jobs.
+  """
+
+  def __init__(self, max_jobs=None):
+    if max_jobs is None:
+      max_jobs = constant.TRACING_MAX_JOBS
+    self.max_jobs = max_jobs
+    self._lock = threading.Lock()
+    self.totals = OrderedDict()
+    self.jobs = OrderedDict()
+
+  def record(self, name, seconds, payload_bytes=0, results=0, error=False,
+      job_id=None):
+    """
+    Adds a finished span to the aggregates.
+
+    Args:
+      name (str): the span name, e.g. 'dfp.LineItemService.createLineItems'
+      seconds (float): the duration
+      payload_bytes (int): size of the request
+      results (int): number of objects returned
+      error (bool): whether the operation raised
+      job_id (str): the job the span belongs to, if any
+    """
+    with self._lock:
+      _add(self.totals, name, seconds, payload_bytes, results, error)
+      if job_id is not None:
+        job = self.jobs.pop(job_id, None)
+        if job is None:
+          job = OrderedDict()
+          while len(self.jobs) >= self.max_jobs:
+            self.jobs.popitem(last=False)
+        self.jobs[job_id] = job
+        _add(job, name, seconds, payload_bytes, results, error)
+
+  def get_metrics(self, job_id=None):
+    """
+    Returns the aggregates of every span name, for one job or the process.
+
+    Returns:
+      a dict keyed by span name, each with count, errors, seconds,
+        max_seconds, payload_bytes and results; or None for an unknown job
+    """
+    with self._lock:
+      spans = self.totals if job_id is None else self.jobs.get(job_id)
+      if spans is None:
+        return None
+      return OrderedDict((name, dict(stats)) for name, stats in spans.items())
+
+  def get_job_ids(self):
+    with self._lock:
+      return list(self.jobs)
+
+  def reset(self):
+    with self._lock:
+      self.totals = OrderedDict()
+      self.jobs = OrderedDict()
+
+def _add(spans, name, seconds, payload_bytes, results, error):
+  stats = spans.get(name)
+  if stats is None:
+    stats = spans[name] = {'count': 0, 'errors': 0, 'seconds': 0.0,
+      'max_seconds': 0.0, 'payload_bytes': 0, 'results': 0}
+  stats['count'] += 1
+  stats['errors'] += 1 if error else 0
+  stats['seconds'] += seconds
+  stats['max_seconds'] = max(stats['max_seconds'], seconds)
+  stats['payload_bytes'] += payload_bytes
+  stats['results'] += results
+
+tracer = Tracer()
+
+@contextmanager
+def span(name, payload_bytes=0):
+  """
+  Times the block as a span of the current job. The yielded dict can be
+  given a 'results' count by the block.
+
+  Args:
+    name (str): the span name
+    payload_bytes (int): size of the request
+  """
+  info = {'results': 0}
+  started = time.perf_counter()
+  error = False
+  try:
+    yield info
+  except BaseException:
+    error = True
+    raise
+  finally:
+    tracer.record(name, time.perf_counter() - started, payload_bytes,
+      info['results'], error, _current_job.get())
+
+@contextmanager
+def job_context(job_id):
+  """
+  Aggregates the spans recorded within the block, and in the batch workers
+  it starts, under `job_id`.
+  """
+  token = _current_job.set(job_id)
+  try:
+    yield
+  finally:
+    _current_job.reset(token)
+
+def get_current_job():
+  """Returns the job_id of the current context, or None"""
+  return _current_job.get()
+
+def get_current_stage():
+  """Returns the job stage of the current context, or None"""
+  return _current_stage.get()
+
+class StageSpans(object):
+  """
+  Times consecutive stages of a run: starting a stage ends the previous
+  one. Stages are recorded as 'stage.<name>' spans.
+  """
+
+  def __init__(self):
+    self._stage = None
+    self._started = None
+    self._token = None
+    self._job_id = _current_job.get()
+
+  def start(self, stage):
+    self.finish()
+    self._stage = stage
+    self._started = time.perf_counter()
+    self._token = _current_stage.set(stage)
+
+  def finish(self, error=False):
+    if self._stage is None:
+      return
+    seconds = time.perf_counter() - self._started
+    tracer.record('stage.' + self._stage, seconds, error=error,
+      job_id=self._job_id)
+    logger.debug('Stage %s %s in %.2fs', self._stage,
+      'failed' if error else 'finished', seconds, extra={'duration': seconds})
+    try:
+      _current_stage.reset(self._token)
+    except ValueError:
+      # Finished from another context than it was started in
+      pass
+    self._stage = None
+
+class TracedService(object):
+  """
+  Wraps a DFP service so every method call is recorded as a
+  'dfp.<service>.<method>' span with its estimated payload size and result
+  count.
+  """
+
+  def __init__(self, service, service_name):
+    self._service = service
+    self._service_name = service_name
+
+  def __getattr__(self, name):
+    attr = getattr(self._service, name)
+    if not callable(attr):
+      return attr
+
+    def call(*args, **kwargs):
+      payload_bytes = _estimate_payload_bytes(name, args)
+      with span('dfp.{0}.{1}'.format(self._service_name, name),
+          payload_bytes) as info:
+        result = attr(*args, **kwargs)
+        info['results'] = _count_results(result)
+      return result
+    return call
+
+class TracedClient(object):
+  """
+  Wraps a client so the services it returns are traced.
+  """
+
+  def __init__(self, client):
+    self._client = client
+
+  def GetService(self, service_name, *args, **kwargs):
+    return TracedService(self._client.GetService(service_name, *args, **kwargs),
+      service_name)
+
+  def __getattr__(self, name):
+    return getattr(self._client, name)
+
+def _estimate_payload_bytes(method_name, args):
+  # Objects sent times their typical size, see constant.TRACING_OBJECT_BYTES
+  if not args:
+    return 0
+  payload = args[0]
+  num_objects = len(payload) if isinstance(payload, (list, tuple)) else 1
+  return num_objects * constant.TRACING_OBJECT_BYTES.get(method_name,
+    constant.TRACING_OBJECT_BYTES['default'])
+
+def _count_results(result):
+  if result is None:
+    return 0
+  if isinstance(result, (list, tuple)):
+    return len(result)
+  # A page of a statement; its results are missing or None when empty
+  try:
+    results = result['results']
+  except (KeyError, TypeError, IndexError):
+    results = getattr(result, 'results', False)
+  if results is False:
+    return 1
+  return len(results or [])
+
+def get_metrics(job_id=None):
+  """
+  Returns span aggregates for the process and, with a job_id, one job.
+
+  Returns:
+    a dict, or None for an unknown job
+  """
+  if job_id is not None:
+    spans = tracer.get_metrics(job_id)
+    if spans is None:
+      return None
+    return {'job_id': job_id, 'spans': spans}
+  return {'spans': tracer.get_metrics(), 'jobs': tracer.get_job_ids()}
+
+def format_prometheus():
+  """
+  Renders the process-wide span aggregates in the Prometheus text format.
+
+  Returns:
+    a string
+  """
+  spans = tracer.get_metrics()
+  metrics = [
+    ('lineitem_span_seconds', 'summary',
+      'Time spent in traced operations', None),
+    ('lineitem_span_max_seconds', 'gauge',
+      'Longest traced operation', 'max_seconds'),
+    ('lineitem_span_errors_total', 'counter',
+      'Traced operations that raised', 'errors'),
+    ('lineitem_span_payload_bytes_total', 'counter',
+      'Estimated bytes sent by traced DFP calls', 'payload_bytes'),
+    ('lineitem_span_results_total', 'counter',
+      'Objects returned by traced DFP calls', 'results'),
+  ]
+  lines = []
+  for metric, metric_type, help_text, field in metrics:
+    lines.append('# HELP {0} {1}'.format(metric, help_text))
+    lines.append('# TYPE {0} {1}'.format(metric, metric_type))
+    for name, stats in spans.items():
+      label = '{span="%s"}' % name.replace('\\', '\\\\').replace('"', '\\"')
+      if field is None:
+        lines.append('{0}_sum{1} {2:.6f}'.format(metric, label, stats['seconds']))
+        lines.append('{0}_count{1} {2}'.format(metric, label, stats['count']))
+      else:
+        lines.append('{0}{1} {2}'.format(metric, label, stats[field]))
+  return '\n'.join(lines) + '\n'
@@ -45,6 +45,21 @@ else:
 
 print(f"DEBUG: Final GOOGLEADS_YAML_FILE path: {GOOGLEADS_YAML_FILE}")
 
+# Backend of every DFP call. 'live' talks to Ad Manager with the credentials
+# of GOOGLEADS_YAML_FILE; 'fake' uses an in-process fake of the services
+# (dfp/fake_client.py) to benchmark and load test setups offline.
+DFP_BACKEND = os.environ.get('DFP_BACKEND', 'live')
+
+# Latency of the fake backend, as a fraction of the latency model used by
+# dry runs (constant.PLAN_*). 0 answers immediately.
+FAKE_DFP_LATENCY_SCALE = float(os.environ.get('FAKE_DFP_LATENCY_SCALE', '0.1'))
+
+# SQLite file caching lookups of advertisers, orders, placements, ad units,
+# creative templates and users across runs (dfp/lookup_cache.py). Empty
+# disables the cache.
+LOOKUP_CACHE_FILE = os.environ.get('LOOKUP_CACHE_FILE',
+  os.path.join(ROOT_DIR, 'data', 'lookup_cache.db'))
+
 #########################################################################
 # DFP SETTINGS
 #########################################################################
@@ -1,4 +1,11 @@
-from Openwrap_DFP_Setup.tasks.dfp_utils import DFPValueIdGetter, get_or_create_dfp_targeting_key
+import logging
+
+from Openwrap_DFP_Setup.tasks.dfp_utils import (
+    get_dfp_value_id_getters,
+    get_or_create_dfp_targeting_keys
+)
+
+logger = logging.getLogger(__name__)
 
 class OpenWrapTargetingKeyGen:
     def __init__(self, price_els=None, creative_type=None, bidder_code=None):
@@ -6,85 +13,100 @@ class OpenWrapTargetingKeyGen:
         self.creative_type = creative_type or 'WEB'
         self.bidder_code = bidder_code
         # Get or create targeting keys for pwtecp, pwtplt, pwtbst, and pwtpid
-        self.pwtecp_key_id = get_or_create_dfp_targeting_key('pwtecp')
-        self.pwtplt_key_id = get_or_create_dfp_targeting_key('pwtplt')
-        self.pwtbst_key_id = get_or_create_dfp_targeting_key('pwtbst')
-        self.pwtpid_key_id = get_or_create_dfp_targeting_key('pwtpid')
-        # Default value getter for granular buckets (EXACT)
-        self.pwtecp_value_getter = DFPValueIdGetter('pwtecp')
-        self.pwtplt_value_getter = DFPValueIdGetter('pwtplt')
-        self.pwtbst_value_getter = DFPValueIdGetter('pwtbst')
-        self.pwtpid_value_getter = DFPValueIdGetter('pwtpid')
+        # with a single lookup
+        key_ids = get_or_create_dfp_targeting_keys(
+            ['pwtecp', 'pwtplt', 'pwtbst', 'pwtpid'])
+        self.pwtecp_key_id = key_ids['pwtecp']
+        self.pwtplt_key_id = key_ids['pwtplt']
+        self.pwtbst_key_id = key_ids['pwtbst']
+        self.pwtpid_key_id = key_ids['pwtpid']
+        # Download the values of the four keys concurrently. The pwtecp
+        # getter is the default (EXACT) one for granular buckets.
+        value_getters = get_dfp_value_id_getters(key_ids)
+        self.pwtecp_value_getter = value_getters['pwtecp']
+        self.pwtplt_value_getter = value_getters['pwtplt']
+        self.pwtbst_value_getter = value_getters['pwtbst']
+        self.pwtpid_value_getter = value_getters['pwtpid']
+
+    def _get_pwtecp_names(self, p):
+        # pwtecp: price bucket value(s), or the bucket start if none are given
+        pwtecp_values = p.get('pwtecp_values')
+        if pwtecp_values:
+            return pwtecp_values
+        return [str(p['start_range'])]
+
+    def _resolve_pwtecp_value_ids(self):
+        """
+        Resolves every distinct pwtecp value across all price buckets with one
+        bulk pass per match type.
+
+        Returns:
+          a tuple of dicts: (exact, prefix) value IDs keyed by value name
+        """
+        # Phase one: collect the distinct names per match type.
+        exact_names = {}
+        prefix_names = {}
+        for p in self.price_els:
+            # Use PREFIX match type for catch-all (integer) buckets, else EXACT
+            names = prefix_names if p.get('is_catch_all', False) else exact_names
+            for name in self._get_pwtecp_names(p):
+                names.setdefault(name, None)
+
+        # Phase two: resolve (and create if needed) each set in bulk.
+        exact_ids = dict(zip(exact_names,
+            self.pwtecp_value_getter.get_value_ids(list(exact_names))))
+        prefix_ids = {}
+        if prefix_names:
+            prefix_getter = self.pwtecp_value_getter.with_match_type('PREFIX')
+            prefix_ids = dict(zip(prefix_names,
+                prefix_getter.get_value_ids(list(prefix_names))))
+        return exact_ids, prefix_ids
+
+    def _get_constant_criteria(self):
+        """
+        Builds the pwtplt, pwtbst and pwtpid criteria shared by every bucket.
+        """
+        # pwtplt: creative type
+        criteria = [{
+            'xsi_type': 'CustomCriteria',
+            'keyId': self.pwtplt_key_id,
+            'valueIds': [self.pwtplt_value_getter.get_value_id(self.creative_type)],
+            'operator': 'IS'
+        }]
+        # pwtbst: always 1
+        criteria.append({
+            'xsi_type': 'CustomCriteria',
+            'keyId': self.pwtbst_key_id,
+            'valueIds': [self.pwtbst_value_getter.get_value_id('1')],
+            'operator': 'IS'
+        })
+        # pwtpid: bidder code (if provided)
+        if self.bidder_code:
+            criteria.append({
+                'xsi_type': 'CustomCriteria',
+                'keyId': self.pwtpid_key_id,
+                'valueIds': [self.pwtpid_value_getter.get_value_id(self.bidder_code)],
+                'operator': 'IS'
+            })
+        return criteria
 
     def get_dfp_targeting(self):
-        print("DEBUG: self.price_els =", self.price_els)
+        logger.debug("Building targeting for {0} price buckets".format(len(self.price_els)))
+        exact_ids, prefix_ids = self._resolve_pwtecp_value_ids()
+        constant_criteria = self._get_constant_criteria()
+
         # Return a list of targeting sets, one per line item
         targeting_sets = []
         for p in self.price_els:
-            top_level_targeting = {
-                'logicalOperator': 'AND',
-                'children': []
-            }
-            # pwtecp: price bucket value(s)
-            pwtecp_values = p.get('pwtecp_values')
-            is_catch_all = p.get('is_catch_all', False)
-            if pwtecp_values:
-                # Use PREFIX match type for catch-all (integer) buckets
-                if is_catch_all:
-                    pwtecp_value_getter_prefix = DFPValueIdGetter('pwtecp', match_type='PREFIX')
-                    pwtecp_value_ids = [pwtecp_value_getter_prefix.get_value_id(val) for val in pwtecp_values]
-                else:
-                    pwtecp_value_ids = [self.pwtecp_value_getter.get_value_id(val) for val in pwtecp_values]
-                child_pwtecp = {
-                    'xsi_type': 'CustomCriteria',
-                    'keyId': self.pwtecp_key_id,
-                    'valueIds': pwtecp_value_ids,
-                    'operator': 'IS'
-                }
-            else:
-                price_value = str(p['start_range'])
-                # Use PREFIX for catch-all, else EXACT
-                if is_catch_all:
-                    pwtecp_value_getter_prefix = DFPValueIdGetter('pwtecp', match_type='PREFIX')
-                    pwtecp_value_id = pwtecp_value_getter_prefix.get_value_id(price_value)
-                else:
-                    pwtecp_value_id = self.pwtecp_value_getter.get_value_id(price_value)
-                child_pwtecp = {
-                    'xsi_type': 'CustomCriteria',
-                    'keyId': self.pwtecp_key_id,
-                    'valueIds': [pwtecp_value_id],
-                    'operator': 'IS'
-                }
-            top_level_targeting['children'].append(child_pwtecp)
-            # pwtplt: creative type
-            pwtplt_value_id = self.pwtplt_value_getter.get_value_id(self.creative_type)
-            child_pwtplt = {
+            value_ids = prefix_ids if p.get('is_catch_all', False) else exact_ids
+            child_pwtecp = {
                 'xsi_type': 'CustomCriteria',
-                'keyId': self.pwtplt_key_id,
-                'valueIds': [pwtplt_value_id],
+                'keyId': self.pwtecp_key_id,
+                'valueIds': [value_ids[name] for name in self._get_pwtecp_names(p)],
                 'operator': 'IS'
             }
-            top_level_targeting['children'].append(child_pwtplt)
-            # pwtbst: always 1
-            pwtbst_value_id = self.pwtbst_value_getter.get_value_id('1')
-            child_pwtbst = {
-                'xsi_type': 'CustomCriteria',
-                'keyId': self.pwtbst_key_id,
-                'valueIds': [pwtbst_value_id],
-                'operator': 'IS'
-            }
-            top_level_targeting['children'].append(child_pwtbst)
-            
-            # pwtpid: bidder code (if provided)
-            if self.bidder_code:
-                pwtpid_value_id = self.pwtpid_value_getter.get_value_id(self.bidder_code)
-                child_pwtpid = {
-                    'xsi_type': 'CustomCriteria',
-                    'keyId': self.pwtpid_key_id,
-                    'valueIds': [pwtpid_value_id],
-                    'operator': 'IS'
-                }
-                top_level_targeting['children'].append(child_pwtpid)
-            
-            targeting_sets.append(top_level_targeting)
+            targeting_sets.append({
+                'logicalOperator': 'AND',
+                'children': [child_pwtecp] + constant_criteria
+            })
         return targeting_sets
@@ -87,6 +87,11 @@ class PrebidTargetingKeyGen(TargetingKeyGen):
         self.hb_pb_value_id = self.HBPBValueGetter.get_value_id(price_str)
         return self.hb_pb_value_id
 
+    def set_price_values(self, price_strs):
+        # Creates every missing hb_pb value with bulk requests, so the
+        # per-line-item set_price_value calls are all cache hits.
+        return self.HBPBValueGetter.get_value_ids(price_strs)
+
     def get_dfp_targeting(self):
       # Create key/value targeting for Prebid.
       # https://github.com/googleads/googleads-python-lib/blob/master/examples/dfp/v201802/line_item_service/target_custom_criteria.py
@@ -150,24 +155,30 @@ def setup_partner(user_email, advertiser_name, order_name, placements, ad_units,
   advertiser_id = get_advertisers.get_advertiser_id_by_name(
     advertiser_name)
 
-  # Create the order.
-  order_id = create_orders.create_order(order_name, advertiser_id, user_id)
+  # Create line item configs; their orders are filled in below.
+  line_items_config = create_line_item_configs(prices, None,
+    placement_ids, ad_unit_ids, bidder_code, sizes, PrebidTargetingKeyGen(),
+    currency_code)
+
+  # Create the orders. Setups above the per-order line item limit are
+  # sharded across order_name-1, order_name-2, ...
+  order_names, shard_of_line_item, _ = create_orders.assign_order_shards(
+    order_name, [config['name'] for config in line_items_config])
+  order_ids = create_orders.get_or_create_orders(order_names, advertiser_name,
+    user_email)
+  for config, shard_idx in zip(line_items_config, shard_of_line_item):
+    config['orderId'] = order_ids[shard_idx]
 
   # Create creatives.
   creative_configs = create_creatives.create_duplicate_creative_configs(
       bidder_code, order_name, advertiser_id, num_creatives=num_creatives)
   creative_ids = create_creatives.create_creatives(creative_configs)
 
-  # Create line items.
-  line_items_config = create_line_item_configs(prices, order_id,
-    placement_ids, ad_unit_ids, bidder_code, sizes, PrebidTargetingKeyGen(),
-    currency_code)
-
   logger.info("Creating line items...")
   line_item_ids = create_line_items.create_line_items(line_items_config)
 
-  # Associate creatives with line items.
-  associate_line_items_and_creatives.make_licas(line_item_ids,
+  # Associate creatives with line items, in batches sent concurrently.
+  associate_line_items_and_creatives.make_licas_streaming(line_item_ids,
     creative_ids, size_overrides=sizes)
 
   logger.info("""
@@ -200,6 +211,10 @@ def create_line_item_configs(prices, order_id, placement_ids, ad_unit_ids, bidde
   # The DFP targeting value ID for this `hb_bidder` code.
   key_gen_obj.set_bidder_value(bidder_code)
 
+  # Resolve all `hb_pb` price values in bulk.
+  key_gen_obj.set_price_values(
+    [num_to_str(micro_amount_to_num(price)) for price in prices])
+
   line_items_config = []
   for price in prices:
 
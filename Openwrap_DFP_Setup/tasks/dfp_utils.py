@@ -1,4 +1,8 @@
+import copy
+
 from Openwrap_DFP_Setup.dfp import get_custom_targeting, create_custom_targeting
+from Openwrap_DFP_Setup.dfp.batch_utils import run_chunks
+from Openwrap_DFP_Setup.dfp.exceptions import DFPObjectNotFound
 
 class TargetingKeyGen():
     def __init__(self):
@@ -16,6 +20,10 @@ class TargetingKeyGen():
         assert False
         return None
 
+    def set_price_values(self, price_strs):
+        # Optional hook to resolve every price value up front, in bulk.
+        return None
+
 class DFPValueIdGetter(object):
   """
   A class to bulk fetch DFP values by key and then create new values as needed.
@@ -25,6 +33,8 @@ class DFPValueIdGetter(object):
     """
     Args:
       key_name (str): the name of the DFP key
+      key_id (int): optional, the ID of the DFP key if already known. Saves
+        looking the key up again.
     """
     self.key_name = key_name
     self.match_type = 'EXACT'
@@ -32,23 +42,96 @@ class DFPValueIdGetter(object):
     if 'match_type' in kwargs:
         self.match_type = kwargs['match_type']
 
-    self.key_id = get_custom_targeting.get_key_id_by_name(key_name)
-    self.existing_values = get_custom_targeting.get_targeting_by_key_name(
-      key_name)
+    if kwargs.get('key_id') is not None:
+      self.key_id = kwargs['key_id']
+      self.existing_values = get_custom_targeting.get_targeting_by_key_id(
+        self.key_id, key_name=key_name)
+    else:
+      self.key_id = get_custom_targeting.get_key_id_by_name(key_name)
+      self.existing_values = get_custom_targeting.get_targeting_by_key_name(
+        key_name)
+
+    # Index of value IDs keyed by lowercased value name. Built once per key
+    # and kept up to date as values get created.
+    self.value_ids = {}
+    for value_obj in self.existing_values or []:
+      self.value_ids.setdefault(value_obj['name'].lower(), value_obj['id'])
     super(DFPValueIdGetter, self).__init__()
 
+  def with_match_type(self, match_type):
+    """
+    Returns a getter for the same key that creates values with another match
+    type. It shares this getter's value index, so no values are re-fetched.
+
+    Args:
+      match_type (str): e.g. 'EXACT' or 'PREFIX'
+    Returns:
+      a DFPValueIdGetter
+    """
+    getter = copy.copy(self)
+    getter.match_type = match_type
+    return getter
+
   def _get_value_id_from_cache(self, value_name):
-    val_id = None
-    if self.existing_values:
-      for value_obj in self.existing_values:
-        if value_obj['name'].lower() == value_name.lower():
-          val_id = value_obj['id']
-          break
-    return val_id
-
-  def _create_value_and_return_id(self, value_name):
-    return create_custom_targeting.create_targeting_value(value_name,
+    return self.value_ids.get(str(value_name).lower())
+
+  def _create_values(self, value_names):
+    created_ids = create_custom_targeting.create_targeting_values(value_names,
       self.key_id, match_type=self.match_type)
+    for name, val_id in created_ids.items():
+      self.value_ids[str(name).lower()] = val_id
+
+  def _create_missing_values(self, value_names):
+    # A batch with one duplicate fails as a whole: what it left missing is
+    # looked up, then created once more
+    error = None
+    for attempt in range(2):
+      try:
+        self._create_values(value_names)
+      except Exception as e:
+        error = e
+      value_names = [name for name in value_names
+                     if self._get_value_id_from_cache(name) is None]
+      if value_names:
+        self.value_ids.update(get_custom_targeting.get_targeting_values_by_names(
+          self.key_id, value_names))
+        value_names = [name for name in value_names
+                       if self._get_value_id_from_cache(name) is None]
+      if not value_names:
+        return
+    raise DFPObjectNotFound(
+      'Could not create or find {0} values of key "{1}": {2}{3}'.format(
+        len(value_names), self.key_name, ', '.join(value_names[:10]),
+        ' ({0})'.format(error) if error is not None else ''))
+
+  def get_value_ids(self, value_names):
+    """
+    Get the DFP custom value IDs for many names, creating all the missing
+    values in a single batch.
+
+    Values still missing after the batch, e.g. because another setup created
+    them since the values of the key were downloaded and the batch failed as
+    a duplicate, are looked up by name again.
+
+    Args:
+      value_names (arr): the names of the DFP values
+    Returns:
+      an array: the ID of each DFP value, in the order of `value_names`
+    Raises:
+      DFPObjectNotFound: if some values could be neither created nor found
+    """
+    missing = []
+    seen = set()
+    for value_name in value_names:
+      lowered = str(value_name).lower()
+      if lowered not in self.value_ids and lowered not in seen:
+        seen.add(lowered)
+        missing.append(str(value_name))
+
+    if missing:
+      self._create_missing_values(missing)
+
+    return [self._get_value_id_from_cache(value_name) for value_name in value_names]
 
   def get_value_id(self, value_name):
     """
@@ -59,15 +142,7 @@ class DFPValueIdGetter(object):
     Returns:
       an integer: the ID of the DFP value
     """
-    # First, check the cached values (case-insensitive)
-    val_id = self._get_value_id_from_cache(value_name)
-    if not val_id:
-      # Refresh the cache from DFP in case the value was created elsewhere
-      self.existing_values = get_custom_targeting.get_targeting_by_key_name(self.key_name)
-    val_id = self._get_value_id_from_cache(value_name)
-    if not val_id:
-      val_id = self._create_value_and_return_id(value_name)
-    return val_id
+    return self.get_value_ids([value_name])[0]
 
 def get_or_create_dfp_targeting_key(name, key_type='FREEFORM'):
   """
@@ -82,3 +157,37 @@ def get_or_create_dfp_targeting_key(name, key_type='FREEFORM'):
   if key_id is None:
     key_id = create_custom_targeting.create_targeting_key(name, key_type=key_type)
   return key_id
+
+def get_or_create_dfp_targeting_keys(names, key_type='FREEFORM'):
+  """
+  Get or create many custom targeting keys by name, looking all of them up
+  with a single request.
+
+  Args:
+    names (arr): the names of the targeting keys
+  Returns:
+    a dict: the ID of each targeting key keyed by name
+  """
+  key_ids = get_custom_targeting.get_key_ids_by_names(names)
+  for name in names:
+    if key_ids.get(name) is None:
+      key_ids[name] = create_custom_targeting.create_targeting_key(name,
+        key_type=key_type)
+  return key_ids
+
+def get_dfp_value_id_getters(key_ids):
+  """
+  Builds a DFPValueIdGetter per key, downloading the values of all the keys
+  concurrently.
+
+  Args:
+    key_ids (dict): the ID of each targeting key keyed by name
+  Returns:
+    a dict: a DFPValueIdGetter per key name
+  """
+  names = list(key_ids)
+  getters = run_chunks(
+    lambda chunk: DFPValueIdGetter(chunk[0], key_id=key_ids[chunk[0]]),
+    [[name] for name in names], max_workers=len(names),
+    label='Targeting value download')
+  return dict(zip(names, getters))
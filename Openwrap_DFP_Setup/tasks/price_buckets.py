@@ -0,0 +1,265 @@
+import math
+import sys
+from array import array
+from collections.abc import Sequence
+
+from Openwrap_DFP_Setup.tasks.price_utils import num_to_micro_amount
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+# One cent in micro-amounts, the step between two pwtecp values.
+CENT_MICRO_AMOUNT = 10000
+
+# Arbitrary max CPM (500.00, as in price_utils.get_prices_array) in cents.
+# Every price string up to it is precomputed once per process.
+CPM_MAX_CENTS = 50000
+
+_price_strings = None
+_integer_price_strings = None
+
+def _micro_to_cents(micro_amount):
+  # Rounds half up to the nearest cent.
+  return (micro_amount + CENT_MICRO_AMOUNT // 2) // CENT_MICRO_AMOUNT
+
+def cents_to_str(cents):
+  """
+  Formats an amount in cents as a price string with 2 decimals.
+
+  Args:
+    cents (int)
+  Returns:
+    a string, e.g. 512 -> '5.12'
+  """
+  if 0 <= cents <= CPM_MAX_CENTS:
+    return get_price_strings()[cents]
+  return '%d.%02d' % divmod(int(cents), 100)
+
+def get_price_strings():
+  """
+  Returns the process-wide table of interned price strings, where entry `c`
+  is the price of `c` cents: ('0.00', '0.01', ..., '500.00').
+
+  Returns:
+    a tuple of CPM_MAX_CENTS + 1 strings
+  """
+  global _price_strings
+  if _price_strings is None:
+    _price_strings = tuple(sys.intern('%d.%02d' % divmod(cents, 100))
+                           for cents in range(CPM_MAX_CENTS + 1))
+  return _price_strings
+
+def get_integer_price_strings():
+  """
+  Returns the process-wide table of interned catch-all (PREFIX) price
+  strings, where entry `n` is 'n.': ('0.', '1.', ..., '500.').
+
+  Returns:
+    a tuple of CPM_MAX_CENTS // 100 + 1 strings
+  """
+  global _integer_price_strings
+  if _integer_price_strings is None:
+    _integer_price_strings = tuple(sys.intern('{0}.'.format(value))
+                                   for value in range(CPM_MAX_CENTS // 100 + 1))
+  return _integer_price_strings
+
+class PwtecpValues(Sequence):
+  """
+  Read-only view of consecutive pwtecp values of a price bucket.
+
+  Values below the CPM cap come straight from the shared string table, so a
+  bucket holds a range rather than its own copy of the strings.
+  """
+
+  def __init__(self, first, count, catch_all=False):
+    self.first = first
+    self.count = count
+    self.catch_all = catch_all
+
+  def __len__(self):
+    return self.count
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return [self[i] for i in range(*index.indices(self.count))]
+    if index < 0:
+      index += self.count
+    if not 0 <= index < self.count:
+      raise IndexError('pwtecp value index out of range')
+
+    value = self.first + index
+    table = get_integer_price_strings() if self.catch_all else get_price_strings()
+    if value < len(table):
+      return table[value]
+    return '{0}.'.format(value) if self.catch_all else cents_to_str(value)
+
+  def __iter__(self):
+    table = get_integer_price_strings() if self.catch_all else get_price_strings()
+    end = self.first + self.count
+    for value in table[self.first:min(end, len(table))]:
+      yield value
+    for value in range(max(self.first, len(table)), end):
+      yield '{0}.'.format(value) if self.catch_all else cents_to_str(value)
+
+  def __eq__(self, other):
+    if isinstance(other, (PwtecpValues, list, tuple)):
+      return list(self) == list(other)
+    return NotImplemented
+
+  def __repr__(self):
+    return repr(list(self))
+
+class PriceBuckets(Sequence):
+  """
+  Compact, array-backed list of expanded price buckets.
+
+  Every bucket is described by a few integers stored in parallel arrays: its
+  start in micro-amounts and the first pwtecp value and count of pwtecp
+  values it targets. Indexing a PriceBuckets returns the bucket as the dict
+  `index()` and `OpenWrapTargetingKeyGen` work with.
+  """
+
+  def __init__(self):
+    self.start_micro_amounts = array('q')
+    self.end_micro_amounts = array('q')
+    self.granularity_micro_amounts = array('q')
+    # First pwtecp value, in cents for granular buckets and in units for
+    # catch-all buckets.
+    self.value_starts = array('q')
+    self.value_counts = array('q')
+    self.catch_all = array('b')
+    self.rate_ids = []
+
+  def __len__(self):
+    return len(self.start_micro_amounts)
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return [self[i] for i in range(*index.indices(len(self)))]
+    if index < 0:
+      index += len(self)
+    if not 0 <= index < len(self):
+      raise IndexError('price bucket index out of range')
+
+    start = _micro_to_cents(self.start_micro_amounts[index])
+    bucket = {
+      'start_range': cents_to_str(start),
+      'rate_id': self.rate_ids[index],
+      'pwtecp_values': self.get_pwtecp_values(index),
+    }
+    if self.catch_all[index]:
+      bucket['end_range'] = cents_to_str(
+        _micro_to_cents(self.end_micro_amounts[index]))
+      bucket['granularity'] = '-1'
+      bucket['is_catch_all'] = True
+    else:
+      bucket['granularity'] = cents_to_str(
+        _micro_to_cents(self.granularity_micro_amounts[index]))
+    return bucket
+
+  def get_pwtecp_values(self, index):
+    """
+    Returns the pwtecp values targeted by a bucket.
+
+    Args:
+      index (int): the bucket index
+    Returns:
+      a PwtecpValues view of the shared price strings
+    """
+    return PwtecpValues(self.value_starts[index], self.value_counts[index],
+                        catch_all=bool(self.catch_all[index]))
+
+  @property
+  def num_pwtecp_values(self):
+    return sum(self.value_counts)
+
+  def to_dicts(self):
+    return [self[i] for i in range(len(self))]
+
+  def add_catch_all(self, start, end, rate_id):
+    """
+    Adds a single catch-all bucket covering [start, end]. It targets every
+    integer pwtecp value of the range with a PREFIX match.
+
+    Args:
+      start (float)
+      end (float)
+      rate_id (str)
+    """
+    first = int(math.ceil(start))
+    self.start_micro_amounts.append(num_to_micro_amount(start, 6))
+    self.end_micro_amounts.append(num_to_micro_amount(end, 6))
+    self.granularity_micro_amounts.append(-1)
+    self.value_starts.append(first)
+    self.value_counts.append(max(0, int(math.floor(end)) + 1 - first))
+    self.catch_all.append(1)
+    self.rate_ids.append(rate_id)
+
+  def add_range(self, start, end, granularity, rate_id):
+    """
+    Adds one bucket every `granularity` from `start` up to and including
+    `end`. Each bucket targets every cent value from its start up to, but
+    excluding, the start of the next bucket.
+
+    Args:
+      start (float)
+      end (float)
+      granularity (float)
+      rate_id (str)
+    """
+    start_micro = num_to_micro_amount(start, 6)
+    end_micro = num_to_micro_amount(end, 6)
+    gran_micro = num_to_micro_amount(granularity, 6)
+    if gran_micro <= 0:
+      raise ValueError('granularity must be positive, got {0}'.format(granularity))
+    if end_micro < start_micro:
+      return
+
+    if np is not None:
+      starts = np.arange(start_micro, end_micro + 1, gran_micro, dtype=np.int64)
+      ends = np.minimum(starts + gran_micro, end_micro)
+      first_cents = (starts + CENT_MICRO_AMOUNT // 2) // CENT_MICRO_AMOUNT
+      last_cents = -(-ends // CENT_MICRO_AMOUNT) - 1
+      counts = np.where(starts < ends, np.maximum(last_cents - first_cents, 0) + 1, 0)
+      num_buckets = len(starts)
+      self.start_micro_amounts.frombytes(starts.tobytes())
+      self.end_micro_amounts.frombytes(ends.tobytes())
+      self.value_starts.frombytes(first_cents.tobytes())
+      self.value_counts.frombytes(counts.astype(np.int64).tobytes())
+    else:
+      starts = range(start_micro, end_micro + 1, gran_micro)
+      num_buckets = len(starts)
+      for bucket_start in starts:
+        bucket_end = min(bucket_start + gran_micro, end_micro)
+        first_cent = _micro_to_cents(bucket_start)
+        last_cent = -(-bucket_end // CENT_MICRO_AMOUNT) - 1
+        self.start_micro_amounts.append(bucket_start)
+        self.end_micro_amounts.append(bucket_end)
+        self.value_starts.append(first_cent)
+        self.value_counts.append(
+          max(last_cent - first_cent, 0) + 1 if bucket_start < bucket_end else 0)
+
+    self.granularity_micro_amounts.extend([gran_micro] * num_buckets)
+    self.catch_all.extend([0] * num_buckets)
+    self.rate_ids.extend([rate_id] * num_buckets)
+
+def expand_price_ranges(ranges):
+  """
+  Expands price ranges into price buckets, working in integer micro-amounts
+  so wide, fine-grained ranges don't accumulate float drift.
+
+  Args:
+    ranges (arr): (start, end, granularity, rate_id) tuples. A granularity of
+      -1 makes a single catch-all bucket for the whole range.
+  Returns:
+    a PriceBuckets
+  """
+  buckets = PriceBuckets()
+  for start, end, granularity, rate_id in ranges:
+    if granularity == -1:
+      buckets.add_catch_all(start, end, rate_id)
+    else:
+      buckets.add_range(start, end, granularity, rate_id)
+  return buckets
@@ -5,6 +5,7 @@ import logging
 import sys
 import update_settings
 from dfp.client import get_client
+from dfp.paginate import Paginator
 from prettytable import PrettyTable
 
 # Colorama for cross-platform support for colored logging.
@@ -107,7 +108,7 @@ Confirm the Input:
 
     def get_line_items(self):
         """
-        Function to build the statement based on filter condition and return all selected line items
+        Function to build the statement based on filter condition and return all selected line items, reading every page of results
         """
         statement = (ad_manager.StatementBuilder()
                  .Where('orderName = :order_name AND name LIKE :line_item_name AND lineItemType = :line_item_type')
@@ -115,8 +116,8 @@ Confirm the Input:
                  .WithBindVariable('line_item_name', self.setting_class.LINE_ITEM_NAME_REGEX)
                  .WithBindVariable('line_item_type', self.setting_class.DFP_LINEITEM_TYPE))
 
-        response = self.ad_manager_client.GetService('LineItemService', version=self.API_VERSION).getLineItemsByStatement(statement.ToStatement())
-        return response
+        line_item_service = self.ad_manager_client.GetService('LineItemService', version=self.API_VERSION)
+        return list(Paginator(line_item_service.getLineItemsByStatement, statement, prefetch=True, label='Line items'))
 
     def print_skipped_line_items(self, skip_line_items):
         """
@@ -226,8 +227,7 @@ Confirm the Input:
         The user is prompted for confirmation before proceeding with the update.
         If the update is successful, the names of the updated line items are logged.
         """
-        response = self.get_line_items()
-        line_items = response.results if hasattr(response, 'results') and response.results else []
+        line_items = self.get_line_items()
         if len(line_items) <= 0:
             self.logger.info("No line item found for given input")
             return
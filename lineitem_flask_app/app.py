@@ -1,9 +1,14 @@
 
 
+import atexit
+import copy
 import os
+import queue
 import sys
+import threading
 import logging
 import logging.handlers
+import time
 from datetime import datetime
 import traceback
 
@@ -29,14 +34,30 @@ root_openwrap_dir = os.path.join(parent_dir, 'Openwrap_DFP_Setup')
 if root_openwrap_dir not in sys.path:
     sys.path.insert(0, root_openwrap_dir)
 
+from log_format import JsonFormatter, LogContextFilter
+
 # Create logs directory if it doesn't exist
 logs_dir = os.path.join(current_dir, 'logs')
 if not os.path.exists(logs_dir):
     os.makedirs(logs_dir)
 
+# Format of all.log and errors.log: 'text' or 'json' (one object per line)
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text').lower()
+
+# Writes the queued log records to the handlers, see setup_logging()
+log_listener = None
+
 # Configure comprehensive logging
 def setup_logging():
-    """Setup comprehensive logging configuration"""
+    """
+    Setup comprehensive logging configuration.
+
+    Loggers only put records on a queue; a QueueListener thread formats and
+    writes them to the console and log files, so file I/O stays off the
+    request and job threads.
+    """
+    global log_listener
+    
     # Create formatters
     detailed_formatter = logging.Formatter(
         '%(asctime)s - %(name)s - %(levelname)s - %(funcName)s:%(lineno)d - %(message)s'
@@ -44,6 +65,7 @@ def setup_logging():
     simple_formatter = logging.Formatter(
         '%(asctime)s - %(levelname)s - %(message)s'
     )
+    file_formatter = JsonFormatter() if LOG_FORMAT == 'json' else detailed_formatter
     
     # Root logger configuration
     root_logger = logging.getLogger()
@@ -52,12 +74,12 @@ def setup_logging():
     # Clear any existing handlers
     for handler in root_logger.handlers[:]:
         root_logger.removeHandler(handler)
+    stop_logging()
     
     # Console handler (INFO level and above)
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(simple_formatter)
-    root_logger.addHandler(console_handler)
     
     # File handler for all logs (DEBUG level and above)
     all_logs_file = os.path.join(logs_dir, 'all.log')
@@ -65,8 +87,7 @@ def setup_logging():
         all_logs_file, maxBytes=10*1024*1024, backupCount=5
     )
     file_handler.setLevel(logging.DEBUG)
-    file_handler.setFormatter(detailed_formatter)
-    root_logger.addHandler(file_handler)
+    file_handler.setFormatter(file_formatter)
     
     # Error file handler (ERROR level and above)
     error_logs_file = os.path.join(logs_dir, 'errors.log')
@@ -74,8 +95,18 @@ def setup_logging():
         error_logs_file, maxBytes=10*1024*1024, backupCount=5
     )
     error_handler.setLevel(logging.ERROR)
-    error_handler.setFormatter(detailed_formatter)
-    root_logger.addHandler(error_handler)
+    error_handler.setFormatter(file_formatter)
+    
+    # Records are tagged with their job and stage before they are queued,
+    # on the thread that logged them
+    log_queue = queue.Queue(-1)
+    queue_handler = ContextQueueHandler(log_queue)
+    queue_handler.addFilter(LogContextFilter())
+    root_logger.addHandler(queue_handler)
+    log_listener = logging.handlers.QueueListener(
+        log_queue, console_handler, file_handler, error_handler, respect_handler_level=True
+    )
+    log_listener.start()
     
     # Flask app specific logger
     app_logger = logging.getLogger('lineitem_app')
@@ -83,8 +114,32 @@ def setup_logging():
     
     return app_logger
 
+def stop_logging():
+    """Writes out the queued log records and stops the listener thread"""
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler keeping tracebacks apart from the message (as exc_text),
+    so the listener's formatters can render them, e.g. as a JSON field.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        # Resolve the message now: args may not be safe to use on another thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
 # Setup logging
 logger = setup_logging()
+atexit.register(stop_logging)
 
 print(f"DEBUG: Current directory: {current_dir}")
 print(f"DEBUG: Parent directory: {parent_dir}")
@@ -132,20 +187,18 @@ except ImportError:
     create_line_item_config = create_line_items_module.create_line_item_config
     create_line_items = create_line_items_module.create_line_items
 
-from flask import Flask, render_template, request, redirect, flash, jsonify
+from flask import Flask, render_template, request, redirect, flash, jsonify, Response, stream_with_context
 # Import all required modules
-from Openwrap_DFP_Setup.dfp.create_orders import get_order_id_by_name, create_order
-from Openwrap_DFP_Setup.dfp.get_root_ad_unit_id import get_root_ad_unit_id
-from Openwrap_DFP_Setup.tasks.add_new_openwrap_partner import OpenWrapTargetingKeyGen
 from Openwrap_DFP_Setup import settings
-from Openwrap_DFP_Setup.dfp.create_creatives import create_duplicate_creative_configs, create_creatives
-from Openwrap_DFP_Setup.dfp.associate_line_items_and_creatives import make_licas
-from Openwrap_DFP_Setup.dfp.get_advertisers import create_advertiser
-from Openwrap_DFP_Setup.dfp.get_advertisers import get_advertiser_id_by_name
-from Openwrap_DFP_Setup.dfp.get_placements import get_placement_ids_by_name
-from Openwrap_DFP_Setup.tasks.price_utils import num_to_str
-
-import math
+from Openwrap_DFP_Setup.dfp.client import get_client_cache_stats, use_client
+from Openwrap_DFP_Setup.dfp.plan_client import PlanningAdManagerClient
+from Openwrap_DFP_Setup.dfp.tracing import get_metrics, format_prometheus
+from Openwrap_DFP_Setup.dfp.lookup_cache import get_lookup_cache_stats, refresh_lookups
+from Openwrap_DFP_Setup.dfp.journal import SetupJournal
+from setup_pipeline import run_lineitem_setup
+from jobs import JobStore, JobQueue, FAILED
+from log_index import LogIndex, parse_time
+from log_reader import tail_lines, read_since, search_logs, follow_log, get_line_level, LineFilter, LEVELS
 
 # Setup Google Ad Manager credentials for Render deployment
 logger.info("Starting Google Ads setup - VERSION 2")
@@ -169,87 +222,53 @@ except Exception as e:
 app = Flask(__name__)
 app.secret_key = 'lineitem_creator_secret'
 
-def get_exchange_rate(from_currency, to_currency):
-    """
-    Get exchange rate between currencies.
-    This is a simplified implementation - in production, you'd want to use a real exchange rate API.
-    """
-    # Simplified exchange rates (you should replace this with a real API)
-    exchange_rates = {
-        'USD': {
-            'INR': 83.0,   # 1 USD = 83 INR (approximate)
-            'EUR': 0.92,   # 1 USD = 0.92 EUR
-            'GBP': 0.79,   # 1 USD = 0.79 GBP
-            'JPY': 150.0,  # 1 USD = 150 JPY (approximate)
-        },
-        'INR': {
-            'USD': 0.012,  # 1 INR = 0.012 USD
-            'EUR': 0.011,  # 1 INR = 0.011 EUR
-            'GBP': 0.0095, # 1 INR = 0.0095 GBP
-            'JPY': 1.81,   # 1 INR = 1.81 JPY
-        },
-        'EUR': {
-            'USD': 1.09,   # 1 EUR = 1.09 USD
-            'INR': 90.2,   # 1 EUR = 90.2 INR
-            'GBP': 0.86,   # 1 EUR = 0.86 GBP
-            'JPY': 163.0,  # 1 EUR = 163 JPY
-        },
-        'GBP': {
-            'USD': 1.27,   # 1 GBP = 1.27 USD
-            'INR': 105.1,  # 1 GBP = 105.1 INR
-            'EUR': 1.16,   # 1 GBP = 1.16 EUR
-            'JPY': 190.0,  # 1 GBP = 190 JPY
-        },
-        'JPY': {
-            'USD': 0.0067, # 1 JPY = 0.0067 USD
-            'INR': 0.55,   # 1 JPY = 0.55 INR
-            'EUR': 0.0061, # 1 JPY = 0.0061 EUR
-            'GBP': 0.0053, # 1 JPY = 0.0053 GBP
-        }
-    }
-    
-    if from_currency == to_currency:
-        return 1.0
-    
-    if from_currency in exchange_rates and to_currency in exchange_rates[from_currency]:
-        return exchange_rates[from_currency][to_currency]
-    
-    # If no direct rate found, try reverse conversion
-    if to_currency in exchange_rates and from_currency in exchange_rates[to_currency]:
-        return 1.0 / exchange_rates[to_currency][from_currency]
-    
-    # Default to 1.0 if no conversion rate found
-    logger.warning(f"No exchange rate found for {from_currency} to {to_currency}, using 1.0")
-    return 1.0
+# Setups run as background jobs so a large setup doesn't hold the request
+# (and the browser) for minutes. Job state survives restarts in SQLite.
+job_store = JobStore(os.path.join(current_dir, 'data', 'jobs.db'))
+interrupted_jobs = job_store.fail_interrupted()
+if interrupted_jobs:
+    logger.warning(f"Marked {interrupted_jobs} jobs interrupted by a restart as failed")
+job_queue = JobQueue(job_store, max_workers=int(os.environ.get('JOB_WORKERS', 2)))
+setup_journal = SetupJournal(os.path.join(current_dir, 'data', 'journal.db'))
+
+# Log files shown by the logs page
+LOG_FILES = {
+    'all.log': 'All Logs',
+    'errors.log': 'Error Logs Only'
+}
+LOG_TAIL_LINES = 1000
+# Seconds a log stream stays open; EventSource then reconnects with its
+# cursor, so abandoned streams don't hold a worker thread for good
+LOG_STREAM_TIMEOUT_SECONDS = 300
+
+@app.template_global()
+def get_log_level(log_line):
+    """Level of a log line for the logs page, 'unknown' for continuation lines"""
+    level = get_line_level(log_line)
+    return level.lower() if level else 'unknown'
+
+@app.template_global()
+def get_log_level_class(log_line):
+    level = get_log_level(log_line)
+    return level if level != 'unknown' else ''
 
 @app.route('/logs')
 def view_logs():
     """View application logs"""
     try:
-        # Get log files
-        log_files = {
-            'all.log': 'All Logs',
-            'errors.log': 'Error Logs Only'
-        }
-        
         selected_file = request.args.get('file', 'all.log')
-        if selected_file not in log_files:
+        if selected_file not in LOG_FILES:
             selected_file = 'all.log'
         
-        # Read log file
-        log_file_path = os.path.join(logs_dir, selected_file)
-        logs_content = []
-        
-        if os.path.exists(log_file_path):
-            with open(log_file_path, 'r') as f:
-                # Read last 1000 lines
-                lines = f.readlines()
-                logs_content = lines[-1000:] if len(lines) > 1000 else lines
+        # Read the last lines only, however large the file
+        logs_content, cursor = tail_lines(os.path.join(logs_dir, selected_file), LOG_TAIL_LINES)
         
         return render_template('logs.html', 
                              logs_content=logs_content, 
-                             log_files=log_files, 
-                             selected_file=selected_file)
+                             log_files=LOG_FILES, 
+                             selected_file=selected_file,
+                             cursor=cursor,
+                             now=datetime.now())
     except Exception as e:
         logger.error(f"Error viewing logs: {e}")
         flash(f"Error viewing logs: {str(e)}", 'error')
@@ -257,23 +276,45 @@ def view_logs():
 
 @app.route('/api/logs')
 def get_logs():
-    """API endpoint to get logs for AJAX requests"""
+    """
+    API endpoint to get logs for AJAX requests.
+
+    Returns the last `lines` lines, or with `cursor` only the lines written
+    since the previous poll (`append` is then true unless the file was
+    cleared). With `q`, returns the lines matching it across the file and
+    its rotated backups instead.
+    """
     try:
         selected_file = request.args.get('file', 'all.log')
-        if selected_file not in ['all.log', 'errors.log']:
+        if selected_file not in LOG_FILES:
             selected_file = 'all.log'
-        
+        num_lines = min(max(request.args.get('lines', LOG_TAIL_LINES, type=int), 1), 10000)
         log_file_path = os.path.join(logs_dir, selected_file)
-        logs_content = []
         
-        if os.path.exists(log_file_path):
-            with open(log_file_path, 'r') as f:
-                lines = f.readlines()
-                logs_content = lines[-1000:] if len(lines) > 1000 else lines
+        query = request.args.get('q', '').strip()
+        if query:
+            matches = search_logs(log_file_path, query, max_results=num_lines)
+            return jsonify({
+                'success': True,
+                'logs': [match['line'] for match in matches],
+                'matches': matches,
+                'file': selected_file,
+                'query': query,
+                'timestamp': datetime.now().isoformat()
+            })
+        
+        cursor = request.args.get('cursor')
+        if cursor:
+            logs_content, cursor, reset = read_since(log_file_path, cursor, num_lines)
+        else:
+            logs_content, cursor = tail_lines(log_file_path, num_lines)
+            reset = True
         
         return jsonify({
             'success': True,
             'logs': logs_content,
+            'cursor': cursor,
+            'append': not reset,
             'file': selected_file,
             'timestamp': datetime.now().isoformat()
         })
@@ -284,11 +325,76 @@ def get_logs():
             'error': str(e)
         }), 500
 
+# Full-text index of all.log and its rotations, updated as it is searched
+log_index = LogIndex(os.path.join(current_dir, 'data', 'logs_index.db'),
+                     os.path.join(logs_dir, 'all.log'))
+# Catch up on the history in the background; searches meanwhile see what's indexed
+threading.Thread(target=log_index.update, name='log-index', daemon=True).start()
+
+@app.route('/api/logs/search')
+def search_log_index():
+    """
+    API endpoint searching all.log and its rotated backups through the log
+    index: `q` (words), `levels` (comma-separated), `since` and `until`
+    (ISO 8601 or epoch seconds), `logger`, `job_id` and `limit`.
+    """
+    levels = [level.strip().upper() for level in request.args.get('levels', '').split(',') if level.strip()]
+    unknown = [level for level in levels if level not in LEVELS]
+    if unknown:
+        return jsonify({'success': False, 'error': f"Unknown log levels: {', '.join(unknown)}"}), 400
+    try:
+        since = parse_time(request.args.get('since'))
+        until = parse_time(request.args.get('until'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f"Invalid time: {e}"}), 400
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 5000)
+    
+    try:
+        started = time.perf_counter()
+        records = log_index.search(text=request.args.get('q'), levels=levels, since=since, until=until,
+                                   logger_name=request.args.get('logger'), job_id=request.args.get('job_id'),
+                                   limit=limit)
+        return jsonify({
+            'success': True,
+            'records': records,
+            'count': len(records),
+            'took_ms': round((time.perf_counter() - started) * 1000, 1)
+        })
+    except Exception as e:
+        logger.error(f"Error searching logs: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/logs/stream')
+def stream_logs():
+    """
+    Server-sent events with the lines written to a log file from now on,
+    optionally only those at the comma-separated `levels` or containing
+    `q`. The stream ends after LOG_STREAM_TIMEOUT_SECONDS and reconnecting
+    clients resume from their Last-Event-ID.
+    """
+    selected_file = request.args.get('file', 'all.log')
+    if selected_file not in LOG_FILES:
+        selected_file = 'all.log'
+    levels = [level.strip().upper() for level in request.args.get('levels', '').split(',') if level.strip()]
+    unknown = [level for level in levels if level not in LEVELS]
+    if unknown:
+        return jsonify({'success': False, 'error': f"Unknown log levels: {', '.join(unknown)}"}), 400
+    line_filter = LineFilter(levels, request.args.get('q', '').strip() or None)
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('cursor')
+    
+    return Response(stream_with_context(follow_log(os.path.join(logs_dir, selected_file), cursor, line_filter,
+                                                   timeout=LOG_STREAM_TIMEOUT_SECONDS)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/clear-logs')
 def clear_logs():
     """Clear all log files"""
     try:
-        for filename in ['all.log', 'errors.log']:
+        for filename in LOG_FILES:
             log_file_path = os.path.join(logs_dir, filename)
             if os.path.exists(log_file_path):
                 # Clear the file by opening in write mode
@@ -303,365 +409,120 @@ def clear_logs():
     
     return redirect('/logs')
 
+def plan_lineitem_setup(form):
+    """
+    Dry run of a setup: runs the whole pipeline against a local stand-in for
+    the DFP services and reports what it would send, without any API call.
+    """
+    logger.info(f"Planning setup for order '{form.get('order_name')}' (dry run)")
+    planner = PlanningAdManagerClient()
+    started = time.time()
+    with use_client(planner):
+        result = run_lineitem_setup(form)
+    report = planner.get_report()
+    report['order_names'] = result['order_names']
+    report['plan_seconds'] = round(time.time() - started, 2)
+    logger.info(f"Dry run: {report['api_calls']} API calls, at most {report['counts']}, "
+                f"projected {report['projected_seconds']}s")
+    return report
+
+@app.route('/api/plan', methods=['POST'])
+def plan():
+    """API endpoint returning the dry-run plan of the submitted form"""
+    try:
+        return jsonify({'success': True, 'plan': plan_lineitem_setup(request.form.to_dict())})
+    except Exception as e:
+        logger.exception(f"Error planning setup: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+def run_journaled_setup(form, progress):
+    """
+    Runs a setup job, recording its progress in the setup journal so that,
+    if it fails, it can be resumed from where it stopped
+    """
+    journal = setup_journal.for_job(progress.job_id)
+    journal.begin('form', form)
+    return run_lineitem_setup(form, progress=progress, journal=journal)
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
-        try:
-            logger.info("Processing form submission (after user confirmation)")
-            form = request.form
-
-            order_name = form['order_name']
-            user_email = form['user_email']
-            advertiser_name = form['advertiser_name']
-            network_code = form['network_code']
-            lineitem_prefix = form.get('lineitem_prefix', '')
-            lineitem_type = form['lineitem_type']
-            setup_type = form.get('openwrap_setup_type', 'WEB')
-            
-            logger.info(f"Form data - Order: {order_name}, Advertiser: {advertiser_name}, Network: {network_code}")
-            logger.info(f"Form data - Line Item Type: {lineitem_type}, Setup Type: {setup_type}, Prefix: {lineitem_prefix}")
-            
-            # Map setup_type to canonical pwtplt value
-            pwtplt_map = {
-                'WEB': 'DISPLAY',
-                'WEB_SAFEFRAME': 'DISPLAY',
-                'IN_APP': 'IN_APP',
-                'IN_APP_VIDEO': 'IN_APP',
-                'AMP': 'AMP',
-                'NATIVE': 'NATIVE',
-                'IN_APP_NATIVE': 'NATIVE',
-                'ADPOD': 'VIDEO',
-                'VIDEO': 'VIDEO',
-                'JWPLAYER': 'VIDEO',
-            }
-            canonical_pwtplt = pwtplt_map.get(setup_type, setup_type)
-            creative_sizes_str = form['creative_sizes']
-            currency_code = form.get('currency_code', 'USD')
-            num_creatives = int(form.get('num_creatives', '1') or '1')
-            
-            logger.info(f"Creative sizes: {creative_sizes_str}, Currency: {currency_code}, Num creatives: {num_creatives}")
-            
-            # Extract currency exchange settings
-            currency_exchange = form.get('currency_exchange') == 'on'  # Checkbox returns 'on' when checked
-            target_currency = form.get('target_currency', 'INR')  # New field for target currency, default to INR
-            
-            if currency_exchange:
-                logger.info(f"Currency exchange enabled: {currency_code} -> {target_currency}")
-
-            # Prepare price bucket ranges
-            expanded_prices = []
-            ranges_count = int(form.get('ranges_count', '0') or '0')
-            logger.debug(f"ranges_count: {ranges_count}")
-            
-            # If no ranges provided, create a default range
-            if ranges_count == 0:
-                logger.debug("No ranges provided, creating default range")
-                expanded_prices.append({
-                    'start_range': '5.00',
-                    'end_range': '7.00',
-                    'granularity': '0.03',
-                    'rate_id': '2',
-                    'pwtecp_values': ['5.00', '5.01', '5.02']
-                })
-            else:
-                logger.info(f"Processing {ranges_count} price ranges")
-                for i in range(ranges_count):
-                    start = float(form.get(f'start_range_{i}'))
-                    end = float(form.get(f'end_range_{i}'))
-                    gran = float(form.get(f'granularity_{i}'))
-                    rate_id = form.get(f'rate_id_{i}')
-                    
-                    logger.debug(f"Range {i+1}: {start} to {end}, granularity: {gran}, rate_id: {rate_id}")
-                    
-                    # Apply currency conversion if enabled
-                    if currency_exchange and target_currency != currency_code:
-                        exchange_rate = get_exchange_rate(currency_code, target_currency)
-                        original_start, original_end, original_gran = start, end, gran
-                        start = start * exchange_rate
-                        end = end * exchange_rate
-                        if gran != -1:
-                            gran = gran * exchange_rate
-                        logger.info(f"Applied exchange rate {exchange_rate}: {original_start}-{original_end} -> {start:.2f}-{end:.2f}")
-                    
-                    if gran == -1:
-                        # Catch-all: one line item for the whole range, pwtecp is all integer values in range
-                        pwtecp_values = [f"{int(x)}." for x in range(int(math.ceil(start)), int(math.floor(end)) + 1)]
-                        expanded_prices.append({
-                            'start_range': num_to_str(start, 2),
-                            'end_range': num_to_str(end, 2),
-                            'granularity': '-1',
-                            'rate_id': rate_id,
-                            'pwtecp_values': pwtecp_values,
-                            'is_catch_all': True
-                        })
-                        logger.debug(f"Created catch-all range: {start:.2f}-{end:.2f} with {len(pwtecp_values)} pwtecp values")
-                    else:
-                        current = start
-                        bucket_count = 0
-                        while current <= end + 1e-8:  # add epsilon for float rounding
-                            # For each bucket, generate all pwtecp values in the bucket
-                            bucket_start = current
-                            bucket_end = min(current + gran, end)
-                            
-                            # Generate pwtecp values for the bucket range
-                            pwtecp_values = []
-                            x = bucket_start
-                            while x < bucket_end:  # Exclude bucket_end value to avoid overlap
-                                pwtecp_values.append(f"{x:.2f}")
-                                x = round(x + 0.01, 2)  # Increment by 0.01
-                            
-                            expanded_prices.append({
-                                'start_range': num_to_str(current, 2),
-                                'granularity': num_to_str(gran, 2),
-                                'rate_id': rate_id,
-                                'pwtecp_values': pwtecp_values
-                            })
-                            bucket_count += 1
-                            current = round(current + gran, 8)
-                        
-                        logger.debug(f"Created {bucket_count} buckets for range {start:.2f}-{end:.2f}")
-
-            # Get bidder name and code from form
-            bidder_name = form.get('bidder_name', '').strip() or None
-            bidder_code = form.get('bidder_code', '').strip() or None
-            
-            # Auto-generate names if both bidder name and code are provided
-            if bidder_name and bidder_code:
-                # Override form values with auto-generated ones
-                original_order_name = order_name
-                original_advertiser_name = advertiser_name
-                original_lineitem_prefix = lineitem_prefix
-                
-                order_name = f'Openwrap-{bidder_name}-display'
-                advertiser_name = f'Network OpenWrap {bidder_name}'
-                lineitem_prefix = f'OpenWrap-{bidder_name}-display'
-                
-                logger.info(f"Auto-generated names for bidder '{bidder_name}':")
-                logger.info(f"  Order Name: {original_order_name} -> {order_name}")
-                logger.info(f"  Advertiser Name: {original_advertiser_name} -> {advertiser_name}")
-                logger.info(f"  Line Item Prefix: {original_lineitem_prefix} -> {lineitem_prefix}")
-            
-            # Setup Google Ads client with the network code from the form
-            if os.environ.get('RENDER') and network_code:
-                try:
-                    from googleads_env import setup_googleads_for_render
-                    setup_googleads_for_render(network_code)
-                    logger.debug(f"Reconfigured Google Ads client with network code: {network_code}")
-                except Exception as e:
-                    logger.warning(f"Failed to reconfigure Google Ads client: {e}")
-            
-            logger.info(f"Final configuration:")
-            logger.info(f"  Expanded price buckets: {len(expanded_prices)}")
-            logger.info(f"  Network code: {network_code}")
-            logger.info(f"  Bidder name: {bidder_name}")
-            logger.info(f"  Bidder code: {bidder_code}")
-            logger.info(f"  Canonical pwtplt: {canonical_pwtplt}")
-
-            logger.info("Creating OpenWrap targeting key generator")
-            try:
-                key_gen_obj = OpenWrapTargetingKeyGen(price_els=expanded_prices, creative_type=canonical_pwtplt, bidder_code=bidder_code)
-                logger.info("OpenWrap targeting key generator created successfully")
-            except Exception as e:
-                logger.error(f"Failed to create OpenWrap targeting key generator: {e}")
-                raise
-
-            # Ensure order exists
-            logger.info(f"Checking if order '{order_name}' exists")
-            try:
-                order_id = get_order_id_by_name(order_name)
-                if not order_id:
-                    logger.info(f"Creating new order '{order_name}'")
-                    order_id = create_order(order_name, advertiser_name, user_email)
-                    logger.info(f"Order created with ID: {order_id}")
-                else:
-                    logger.info(f"Using existing order with ID: {order_id}")
-            except Exception as e:
-                logger.error(f"Error with order creation/lookup: {e}")
-                raise
-
-            # Handle sizes
-            sizes = []
-            try:
-                for size_str in creative_sizes_str.split(','):
-                    w, h = size_str.lower().split('x')
-                    sizes.append({'width': int(w.strip()), 'height': int(h.strip())})
-                logger.info(f"Creative sizes: {sizes}")
-            except Exception as e:
-                logger.error(f"Error parsing creative sizes '{creative_sizes_str}': {e}")
-                raise
-
-            # Determine inventory targeting
-            placement_ids = []
-            ad_unit_ids = []
-            placement_names_str = form.get('placement_names', '').strip()
-            if placement_names_str:
-                # User provided placement names (comma-separated)
-                placement_names = [p.strip() for p in placement_names_str.split(',') if p.strip()]
-                if placement_names:
-                    logger.info(f"Looking up placements: {placement_names}")
-                    try:
-                        placement_ids = get_placement_ids_by_name(placement_names)
-                        logger.info(f"Found placement IDs: {placement_ids}")
-                    except Exception as e:
-                        logger.error(f"Error looking up placements: {e}")
-                        raise
-            if not placement_ids:
-                # Run of Network: target root ad unit
-                logger.info("No placements specified, using Run of Network targeting")
-                try:
-                    ad_unit_ids = [get_root_ad_unit_id()]
-                    logger.info(f"Root ad unit ID: {ad_unit_ids}")
-                except Exception as e:
-                    logger.error(f"Error getting root ad unit ID: {e}")
-                    raise
-
-            # Get all targeting sets (one per line item)
-            logger.info("Generating DFP targeting")
-            try:
-                targeting_sets = key_gen_obj.get_dfp_targeting()
-                logger.info(f"Generated {len(targeting_sets)} targeting sets")
-            except Exception as e:
-                logger.error(f"Error generating DFP targeting: {e}")
-                raise
-
-            # Use target currency for line items if currency exchange is enabled
-            final_currency_code = target_currency if currency_exchange else currency_code
-
-            # Create line item configs for each price bucket
-            logger.info("Creating line item configurations")
-            line_items_to_create = []
-            price_configs = key_gen_obj.price_els
-            for idx, price in enumerate(price_configs):
-                # Format price string as per default logic
-                if price.get('granularity') == '-1':
-                    price_str = f"{float(price['start_range']):.2f}"
-                    if lineitem_prefix:
-                        name = f"{lineitem_prefix}_HB ${price_str}+ (Catch-all {price['start_range']}-{price['end_range']})"
-                    else:
-                        name = f"HB ${price_str}+ (Catch-all {price['start_range']}-{price['end_range']})"
-                    micro_amount = int(float(price['start_range']) * 1000000)
-                else:
-                    price_str = f"{float(price['start_range']):.2f}"
-                    if lineitem_prefix:
-                        name = f"{lineitem_prefix}_HB ${price_str}"
-                    else:
-                        name = f"HB ${price_str}"
-                micro_amount = int(float(price['start_range']) * 1000000)
-                
-                logger.debug(f"Creating line item config {idx+1}/{len(price_configs)}: {name}")
-                logger.debug(f"  Price: ${price_str}, Micro amount: {micro_amount}, Currency: {final_currency_code}")
-                
-                try:
-                    config = create_line_item_config(
-                        name=name,
-                        order_id=order_id,
-                        placement_ids=placement_ids,
-                        ad_unit_ids=ad_unit_ids,
-                        cpm_micro_amount=micro_amount,
-                        sizes=sizes,
-                        key_gen_obj=None,  # We'll pass custom targeting directly
-                        lineitem_type=lineitem_type,
-                        currency_code=final_currency_code,
-                        setup_type=setup_type,
-                        custom_targeting=targeting_sets[idx]
-                    )
-                    line_items_to_create.append(config)
-                    logger.debug(f"Line item config created successfully: {name}")
-                except Exception as e:
-                    logger.error(f"Error creating line item config for {name}: {e}")
-                    raise
-
-            logger.info(f"Creating {len(line_items_to_create)} line items")
-            try:
-                result_ids = create_line_items(line_items_to_create)
-                logger.info(f"Line items created successfully: {result_ids}")
-            except Exception as e:
-                logger.error(f"Error creating line items: {e}")
-                raise
-
-            # --- Create creatives and associate them with line items ---
-            # Get advertiser ID (needed for creatives)
-            advertiser_id = None
-            try:
-                # Try to get advertiser ID by name
-                logger.info(f"Looking up advertiser: {advertiser_name}")
-                advertiser_id = get_advertiser_id_by_name(advertiser_name)
-                logger.info(f"Found advertiser ID: {advertiser_id}")
-            except ImportError:
-                # Fallback: create advertiser if not found
-                logger.info(f"Creating new advertiser: {advertiser_name}")
-                try:
-                    advertiser_result = create_advertiser(advertiser_name)
-                    advertiser_id = advertiser_result['id']
-                    logger.info(f"Advertiser created with ID: {advertiser_id}")
-                except Exception as e:
-                    logger.error(f"Error creating advertiser: {e}")
-                    raise
-            except Exception as e:
-                logger.error(f"Error looking up advertiser: {e}")
-                raise
-            
-            # Select creative snippet file based on platform
-            if setup_type in ["IN_APP", "IN_APP_VIDEO", "IN_APP_NATIVE"]:
-                creative_file = "creative_snippet_openwrap_in_app.html"
-            elif setup_type == "AMP":
-                creative_file = "creative_snippet_openwrap_amp.html"
-            elif setup_type in ["VIDEO", "JWPLAYER", "ADPOD"]:
-                # Use a video-specific snippet if available, else fallback
-                creative_file = "creative_snippet_openwrap_sf.html"  # fallback to .html if not present
-            else:
-                creative_file = "creative_snippet_openwrap.html"
-            
-            logger.info(f"Using creative file: {creative_file}")
-            
-            # Create creative configs
-            logger.info(f"Creating {num_creatives} creatives per line item")
-            try:
-                creative_configs = create_duplicate_creative_configs(
-                    bidder_code=None,  # Not used for OpenWrap
-                    order_name=order_name,
-                    advertiser_id=advertiser_id,
-                    sizes=sizes,
-                    num_creatives=num_creatives,
-                    prefix=lineitem_prefix,
-                    creative_file=creative_file
-                )
-                logger.info(f"Creative configs created: {len(creative_configs)}")
-            except Exception as e:
-                logger.error(f"Error creating creative configs: {e}")
-                raise
-            
-            logger.info("Creating creatives")
-            try:
-                creative_ids = create_creatives(creative_configs)
-                logger.info(f"Creatives created successfully: {creative_ids}")
-            except Exception as e:
-                logger.error(f"Error creating creatives: {e}")
-                raise
-            
-            # Associate creatives with line items
-            logger.info("Associating creatives with line items")
-            try:
-                make_licas(result_ids, creative_ids, size_overrides=sizes, setup_type=setup_type)
-                logger.info("Creative association completed")
-            except Exception as e:
-                logger.error(f"Error associating creatives with line items: {e}")
-                raise
-
-            # Prepare summary info
-            currency_info = f" (Currency: {final_currency_code})" if currency_exchange else ""
-            summary_message = f"✅ Order '{order_name}' created. Line items: {len(result_ids)}. Creatives per line item: {num_creatives}.{currency_info}"
-            flash(summary_message, 'success')
-            logger.info(f"Form processing completed successfully: {summary_message}")
-            return redirect('/')
-
-        except Exception as e:
-            error_msg = f"Unexpected error in form processing: {str(e)}"
-            logger.exception(error_msg)
-            flash(f"❌ {error_msg}")
-            return redirect('/')
-
-    return render_template('index.html', form_data=None, settings=settings)
+        form = request.form.to_dict()
+        job_id = job_queue.submit(run_journaled_setup, form)
+        logger.info(f"Queued setup job {job_id} for order '{form.get('order_name')}'")
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify({'success': True, 'job_id': job_id}), 202
+        return redirect(f'/?job_id={job_id}')
+
+    return render_template('index.html', form_data=None, settings=settings, job_id=request.args.get('job_id'))
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """API endpoint returning the state of a setup job"""
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    job['journal'] = setup_journal.for_job(job_id).get_summary()
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/api/jobs/<job_id>/resume', methods=['POST'])
+def resume_job(job_id):
+    """
+    API endpoint resuming a failed setup job: stages, line items and LICAs
+    it completed are skipped, the rest is run again under the same job ID
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    if job['status'] != FAILED:
+        return jsonify({'success': False, 'error': f"Only failed jobs can be resumed, this one is {job['status']}"}), 409
+    journal = setup_journal.for_job(job_id)
+    form = journal.get_inputs('form')
+    if form is None:
+        return jsonify({'success': False, 'error': 'No journal for this job'}), 409
+    if job_queue.resume(job_id, run_journaled_setup, form) is None:
+        return jsonify({'success': False, 'error': 'This job is already being resumed'}), 409
+    logger.info(f"Resuming setup job {job_id} from {journal.get_summary()}")
+    return jsonify({'success': True, 'job_id': job_id, 'journal': journal.get_summary()}), 202
+
+@app.route('/api/jobs/<job_id>/stream')
+def stream_job(job_id):
+    """Server-sent events with the state of a setup job until it finishes"""
+    return Response(stream_with_context(job_queue.stream(job_id)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/metrics')
+def api_metrics():
+    """API endpoint returning span timings of DFP calls and setup stages, for the process or ?job_id="""
+    job_id = request.args.get('job_id')
+    metrics = get_metrics(job_id)
+    if metrics is None:
+        return jsonify({'success': False, 'error': 'No metrics for this job'}), 404
+    metrics['client_cache'] = get_client_cache_stats()
+    metrics['lookup_cache'] = get_lookup_cache_stats()
+    return jsonify({'success': True, 'metrics': metrics})
+
+@app.route('/api/lookup-cache/refresh', methods=['POST'])
+def refresh_lookup_cache():
+    """
+    API endpoint dropping cached DFP lookups (advertisers, orders, placements...),
+    all of them or those of the given entity_type, key and network_code
+    """
+    params = request.get_json(silent=True) or request.form
+    try:
+        dropped = refresh_lookups(entity_type=params.get('entity_type') or None,
+                                  key=params.get('key') or None,
+                                  network_code=params.get('network_code') or None)
+        return jsonify({'success': True, 'dropped': dropped, 'lookup_cache': get_lookup_cache_stats()})
+    except Exception as e:
+        logger.error(f"Error refreshing lookup cache: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Span timings in the Prometheus text exposition format"""
+    return Response(format_prometheus(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     import os
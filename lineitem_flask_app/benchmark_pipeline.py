@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Benchmarks the line item setup pipeline against the fake DFP backend.
+
+Runs the index() flow (setup_pipeline.run_lineitem_setup) and the Prebid
+setup_partner flow over parametrized scenarios and records, per stage, the
+wall time, API calls and peak RSS. Results are written as JSON with sorted
+keys so runs of two commits can be diffed.
+
+Usage:
+    python benchmark_pipeline.py                     # one-factor-at-a-time scenarios
+    python benchmark_pipeline.py --grid full         # full cross product (slow)
+    python benchmark_pipeline.py --flows index --output before.json
+"""
+
+import argparse
+import importlib.util
+import itertools
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+# Add the current and Openwrap_DFP_Setup directories to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+for path in (current_dir, parent_dir, os.path.join(parent_dir, 'Openwrap_DFP_Setup')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from Openwrap_DFP_Setup import constant
+from Openwrap_DFP_Setup.dfp.client import use_client
+from Openwrap_DFP_Setup.dfp.fake_client import FakeAdManagerClient
+
+# Scenario used as the baseline; each axis below is varied from it in turn
+BASELINE = {
+    'buckets': 100,
+    'sizes': 2,
+    'creatives': 1,
+    'catch_all': False,
+    'setup_type': 'WEB',
+}
+AXES = {
+    'buckets': [10, 100, 1000, 5000],
+    'sizes': [1, 5, 20],
+    'creatives': [1, 3, 5],
+    'catch_all': [False, True],
+    'setup_type': ['WEB', 'VIDEO', 'ADPOD'],
+}
+FLOWS = ('index', 'prebid')
+# Flows that need an optional package, skipped when it is not installed
+FLOW_REQUIREMENTS = {
+    'prebid': 'colorama',
+}
+# setup_partner has no catch-all buckets or setup types
+FLOW_AXES = {
+    'index': sorted(AXES),
+    'prebid': ['buckets', 'creatives', 'sizes'],
+}
+
+
+class RSSSampler:
+    """Samples the resident set size of the process on a background thread"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self.reset()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def reset(self):
+        self.peak = current_rss()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss())
+            time.sleep(self.interval)
+
+
+def current_rss():
+    """Current resident set size in bytes, or the peak so far where /proc is missing"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class StageRecorder:
+    """
+    Progress callback of run_lineitem_setup recording wall time, API calls
+    and peak RSS of each stage.
+    """
+
+    def __init__(self, client, sampler):
+        self.client = client
+        self.sampler = sampler
+        self.stages = []
+        self._current = None
+
+    def __call__(self, stage, percent, message=None):
+        self.start(stage)
+
+    def start(self, stage):
+        self.finish()
+        self.sampler.reset()
+        stats = self.client.get_stats()
+        self._current = {
+            'stage': stage,
+            'started': time.perf_counter(),
+            'methods': {name: s['calls'] for name, s in stats['methods'].items()},
+        }
+
+    def finish(self):
+        if self._current is None:
+            return
+        stats = self.client.get_stats()
+        calls = {}
+        for name, s in stats['methods'].items():
+            count = s['calls'] - self._current['methods'].get(name, 0)
+            if count:
+                calls[name] = count
+        self.stages.append({
+            'stage': self._current['stage'],
+            'seconds': round(time.perf_counter() - self._current['started'], 4),
+            'api_calls': sum(calls.values()),
+            'calls': calls,
+            'peak_rss_mb': round(self.sampler.peak / 1048576.0, 1),
+        })
+        self._current = None
+
+
+def get_sizes(num_sizes):
+    return [{'width': 300 + i, 'height': 250} for i in range(num_sizes)]
+
+
+def build_form(scenario):
+    """The index() form of a scenario: `buckets` line items at 0.01 granularity"""
+    buckets = scenario['buckets']
+    granular = buckets - 1 if scenario['catch_all'] else buckets
+    end = granular * 0.01
+    form = {
+        'order_name': 'bench-order',
+        'user_email': 'bench@example.com',
+        'advertiser_name': 'Bench Advertiser',
+        'network_code': 'fake',
+        'lineitem_type': 'PRICE_PRIORITY',
+        'openwrap_setup_type': scenario['setup_type'],
+        'creative_sizes': ','.join('{width}x{height}'.format(**s) for s in get_sizes(scenario['sizes'])),
+        'num_creatives': str(scenario['creatives']),
+        'ranges_count': '1',
+        'start_range_0': '0.01',
+        'end_range_0': '%.2f' % end,
+        'granularity_0': '0.01',
+        'rate_id_0': '2',
+    }
+    if scenario['catch_all']:
+        form['ranges_count'] = '2'
+        form.update({
+            'start_range_1': '%.2f' % (end + 0.01),
+            'end_range_1': '%.2f' % (end + 50),
+            'granularity_1': '-1',
+            'rate_id_1': '2',
+        })
+    return form
+
+
+def run_index_flow(scenario, recorder):
+    from setup_pipeline import run_lineitem_setup
+    recorder.start('prepare')
+    result = run_lineitem_setup(build_form(scenario), progress=recorder)
+    return {'line_items': len(result['line_item_ids']), 'licas': result['licas']}
+
+
+def run_prebid_flow(scenario, recorder):
+    from tasks.add_new_prebid_partner import setup_partner
+    from tasks.price_utils import get_prices_array
+    recorder.start('setup_partner')
+    prices = get_prices_array({
+        'precision': 2,
+        'min': 0.01,
+        'max': scenario['buckets'] * 0.01,
+        'increment': 0.01,
+    })
+    setup_partner(
+        user_email='bench@example.com',
+        advertiser_name='Bench Advertiser',
+        order_name='bench-order',
+        placements=[],
+        ad_units=[],
+        sizes=get_sizes(scenario['sizes']),
+        bidder_code='bench',
+        prices=prices,
+        num_creatives=scenario['creatives'],
+        currency_code='USD',
+    )
+    return {'line_items': len(prices)}
+
+
+def run_scenario(flow, scenario, latency_scale):
+    client = FakeAdManagerClient(latency_scale=latency_scale)
+    result = {'flow': flow, 'scenario': scenario, 'error': None}
+    with RSSSampler() as sampler:
+        recorder = StageRecorder(client, sampler)
+        started = time.perf_counter()
+        try:
+            with use_client(client):
+                runner = run_index_flow if flow == 'index' else run_prebid_flow
+                result['output'] = runner(scenario, recorder)
+        except Exception as e:
+            result['error'] = '{0}: {1}'.format(type(e).__name__, e)
+        recorder.finish()
+        result['wall_seconds'] = round(time.perf_counter() - started, 4)
+        result['peak_rss_mb'] = round(max([s['peak_rss_mb'] for s in recorder.stages] or [0]), 1)
+
+    stats = client.get_stats()
+    result['stages'] = recorder.stages
+    result['api_calls'] = stats['api_calls']
+    result['calls'] = {name: s['calls'] for name, s in stats['methods'].items()}
+    result['api_errors'] = sum(s['errors'] for s in stats['methods'].values())
+    result['objects'] = stats['objects']
+    return result
+
+
+def get_scenarios(flow, grid):
+    names = FLOW_AXES[flow]
+    baseline = {name: BASELINE[name] for name in names}
+    if grid == 'full':
+        for values in itertools.product(*(AXES[name] for name in names)):
+            yield dict(zip(names, values))
+        return
+    # One factor at a time, from the baseline
+    yield baseline
+    for name in names:
+        for value in AXES[name]:
+            if value != baseline[name]:
+                scenario = dict(baseline)
+                scenario[name] = value
+                yield scenario
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=current_dir,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--flows', default=','.join(FLOWS),
+                        help='comma-separated flows to run: index, prebid')
+    parser.add_argument('--grid', choices=('axes', 'full'), default='axes',
+                        help='vary one parameter at a time, or the full cross product')
+    parser.add_argument('--latency-scale', type=float, default=0.01,
+                        help='fake backend latency as a fraction of the dry-run latency model')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--verbose', action='store_true', help='keep pipeline logging')
+    args = parser.parse_args()
+
+    flows = [flow.strip() for flow in args.flows.split(',') if flow.strip()]
+    for flow in flows:
+        if flow not in FLOWS:
+            parser.error(f"unknown flow '{flow}'")
+    for flow in list(flows):
+        requirement = FLOW_REQUIREMENTS.get(flow)
+        if requirement and importlib.util.find_spec(requirement) is None:
+            print(f"Skipping the {flow} flow: {requirement} is not installed")
+            flows.remove(flow)
+
+    if not args.verbose:
+        # Logging thousands of line items would dominate the timings; errors
+        # are kept in the results
+        logging.disable(logging.CRITICAL)
+
+    results = []
+    for flow in flows:
+        for scenario in get_scenarios(flow, args.grid):
+            result = run_scenario(flow, scenario, args.latency_scale)
+            results.append(result)
+            status = result['error'] or 'ok'
+            print(f"{flow:7} {json.dumps(scenario, sort_keys=True)} "
+                  f"{result['wall_seconds']:8.2f}s {result['api_calls']:5} calls "
+                  f"{result['peak_rss_mb']:7.1f} MB  {status}")
+
+    report = {
+        'meta': {
+            'commit': get_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'grid': args.grid,
+            'latency_scale': args.latency_scale,
+            'max_concurrent_requests': constant.MAX_CONCURRENT_REQUESTS,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2, sort_keys=True)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,25 @@
 import os
 import tempfile
 
+def _write_if_changed(path, content):
+    """Write content to path unless the file already holds it. Returns True if written."""
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            if f.read() == content:
+                return False
+    with open(path, 'w') as f:
+        f.write(content)
+    return True
+
+def _invalidate_cached_clients(yaml_path):
+    """Drop cached Ad Manager clients loaded from a rewritten credentials file"""
+    try:
+        from Openwrap_DFP_Setup.dfp.client import invalidate_client_cache
+    except ImportError:
+        return
+    dropped = invalidate_client_cache(yaml_path)
+    print(f"DEBUG: Invalidated {dropped} cached Ad Manager client(s) for {yaml_path}")
+
 def create_googleads_yaml_from_env(network_code=None):
     """Create googleads.yaml file from environment variable with dynamic network code"""
     print("DEBUG: googleads_env.py - create_googleads_yaml_from_env called")
@@ -19,8 +38,7 @@ def create_googleads_yaml_from_env(network_code=None):
         
         # Create temporary JSON file
         json_path = os.path.join(temp_dir, 'service_account.json')
-        with open(json_path, 'w') as f:
-            f.write(service_account_json)
+        json_changed = _write_if_changed(json_path, service_account_json)
         print(f"DEBUG: Created service account JSON at: {json_path}")
         
         # Create YAML file that references the JSON file with dynamic network code
@@ -30,8 +48,9 @@ def create_googleads_yaml_from_env(network_code=None):
   network_code: '{network_code}'
   path_to_private_key_file: {json_path}"""
         
-        with open(yaml_path, 'w') as f:
-            f.write(yaml_content)
+        yaml_changed = _write_if_changed(yaml_path, yaml_content)
+        if json_changed or yaml_changed:
+            _invalidate_cached_clients(yaml_path)
         
         print(f"DEBUG: Created googleads.yaml from GOOGLE_SERVICE_ACCOUNT_JSON at: {yaml_path}")
         return yaml_path
@@ -48,8 +67,8 @@ def create_googleads_yaml_from_env(network_code=None):
         temp_dir = tempfile.gettempdir()
         yaml_path = os.path.join(temp_dir, 'googleads.yaml')
         
-        with open(yaml_path, 'w') as f:
-            f.write(yaml_content)
+        if _write_if_changed(yaml_path, yaml_content):
+            _invalidate_cached_clients(yaml_path)
         
         print(f"DEBUG: Created googleads.yaml from GOOGLEADS_YAML_CONTENT at: {yaml_path}")
         return yaml_path
@@ -0,0 +1,187 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from Openwrap_DFP_Setup.dfp.tracing import StageSpans, job_context
+
+logger = logging.getLogger('lineitem_app.jobs')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+FINISHED_STATUSES = (DONE, FAILED)
+
+
+class JobStore:
+    """SQLite-backed table of setup jobs and their progress"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    progress INTEGER NOT NULL DEFAULT 0,
+                    message TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def create(self):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, stage, progress, created_at, updated_at) "
+                "VALUES (?, ?, ?, 0, ?, ?)",
+                (job_id, QUEUED, 'queued', now, now))
+        return job_id
+
+    def update(self, job_id, **fields):
+        if 'result' in fields and fields['result'] is not None:
+            fields['result'] = json.dumps(fields['result'])
+        fields['updated_at'] = time.time()
+        columns = ', '.join(f"{name} = ?" for name in fields)
+        with self._lock, self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?",
+                         list(fields.values()) + [job_id])
+
+    def requeue(self, job_id, from_status=FAILED):
+        """
+        Moves a job back to queued if it is still in `from_status`, in a
+        single UPDATE so two callers can't both requeue it. Returns True if
+        this call requeued it.
+        """
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, stage = ?, progress = 0, message = NULL, "
+                "error = NULL, updated_at = ? WHERE id = ? AND status = ?",
+                (QUEUED, 'queued', time.time(), job_id, from_status))
+        return cursor.rowcount == 1
+
+    def fail_interrupted(self):
+        """Marks jobs left queued or running by a previous process as failed"""
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE status IN (?, ?)",
+                (FAILED, 'Interrupted by a server restart', time.time(), QUEUED, RUNNING))
+        return cursor.rowcount
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        if job['result']:
+            job['result'] = json.loads(job['result'])
+        return job
+
+
+class JobProgress:
+    """
+    Handed to a running job so it can report its current stage. Each stage
+    is timed as a 'stage.<name>' span of the job.
+    """
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.job_id = job_id
+        self.stages = StageSpans()
+
+    def __call__(self, stage, progress, message=None):
+        logger.info(f"Job {self.job_id}: {stage} ({progress}%) {message or ''}".rstrip())
+        self.stages.start(stage)
+        self.store.update(self.job_id, stage=stage, progress=int(progress), message=message)
+
+
+class JobQueue:
+    """Runs setup jobs on a background thread pool, recording them in a JobStore"""
+
+    def __init__(self, store, max_workers=2):
+        self.store = store
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='setup-job')
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queues func(*args, progress=JobProgress, **kwargs) and returns the job ID.
+        The function's return value is stored as the job result.
+        """
+        job_id = self.store.create()
+        self.executor.submit(self._run, job_id, func, args, kwargs)
+        return job_id
+
+    def resume(self, job_id, func, *args, **kwargs):
+        """
+        Queues a failed job to run again under the same ID, e.g. to resume
+        a setup from its journal. Returns the job ID, or None if the job was
+        not failed (any more), e.g. because it was resumed meanwhile.
+        """
+        if not self.store.requeue(job_id, from_status=FAILED):
+            return None
+        self.executor.submit(self._run, job_id, func, args, kwargs)
+        return job_id
+
+    def _run(self, job_id, func, args, kwargs):
+        with job_context(job_id):
+            progress = JobProgress(self.store, job_id)
+            self.store.update(job_id, status=RUNNING, stage='starting')
+            started = time.perf_counter()
+            try:
+                result = func(*args, progress=progress, **kwargs)
+            except Exception as e:
+                progress.stages.finish(error=True)
+                logger.exception(f"Job {job_id} failed",
+                                 extra={'duration': time.perf_counter() - started})
+                self.store.update(job_id, status=FAILED, error=str(e))
+                return
+            progress.stages.finish()
+            logger.info(f"Job {job_id} finished",
+                        extra={'duration': time.perf_counter() - started})
+            self.store.update(job_id, status=DONE, stage='done', progress=100, result=result)
+
+    def stream(self, job_id, poll_interval=0.5, timeout=None):
+        """
+        Yields server-sent events with the job state each time it changes,
+        until the job finishes.
+        """
+        last_updated = None
+        started = last_sent = time.time()
+        while True:
+            job = self.store.get(job_id)
+            if job is None:
+                yield f"event: error\ndata: {json.dumps({'error': 'Job not found'})}\n\n"
+                return
+            if job['updated_at'] != last_updated:
+                last_updated = job['updated_at']
+                last_sent = time.time()
+                yield f"data: {json.dumps(job)}\n\n"
+            elif time.time() - last_sent > 15:
+                # Comment line keeping proxies from closing an idle stream
+                last_sent = time.time()
+                yield ": keepalive\n\n"
+            if job['status'] in FINISHED_STATUSES:
+                return
+            if timeout is not None and time.time() - started > timeout:
+                return
+            time.sleep(poll_interval)
@@ -0,0 +1,54 @@
+"""
+Log record context and the JSON-lines log format.
+
+Records are tagged with the setup job and stage they were logged in, so
+log lines of a job can be picked out of all.log. With LOG_FORMAT=json the
+log files hold one JSON object per line.
+"""
+
+import json
+import logging
+from datetime import datetime
+
+from Openwrap_DFP_Setup.dfp.tracing import get_current_job, get_current_stage
+
+
+class LogContextFilter(logging.Filter):
+    """
+    Adds the current job_id and stage to records. Must run in the thread
+    that logs, i.e. on the handler records are queued from.
+    """
+
+    def filter(self, record):
+        if getattr(record, 'job_id', None) is None:
+            record.job_id = get_current_job()
+        if getattr(record, 'stage', None) is None:
+            record.stage = get_current_stage()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as single-line JSON objects with the timestamp, level,
+    logger, source, message and, where set, job_id, stage and duration
+    (seconds, given with extra={'duration': ...}).
+    """
+
+    def format(self, record):
+        entry = {
+            'timestamp': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'function': record.funcName,
+            'line': record.lineno,
+            'message': record.getMessage(),
+        }
+        for field in ('job_id', 'stage', 'duration'):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = round(value, 4) if isinstance(value, float) else value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
@@ -0,0 +1,298 @@
+"""
+SQLite full-text index of the application log and its rotated backups.
+
+Each log record (a line, plus the traceback lines following it) is stored
+with its timestamp, level, logger and message, and its message is indexed
+with FTS5. The index remembers how far it has read each file by inode, so
+updating it only parses what was appended, and rollovers, which rename the
+files, cost nothing.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+from log_reader import get_log_files
+
+# '%(asctime)s - %(name)s - %(levelname)s - %(funcName)s:%(lineno)d - %(message)s'
+_TEXT_RECORD = re.compile(
+    r'^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}) - (\S+) - (DEBUG|INFO|WARNING|ERROR|CRITICAL) - (?:\S+:\d+ - )?(.*)$')
+
+# Records inserted per statement while catching up on a large file
+INSERT_BATCH = 5000
+
+
+def parse_record(line):
+    """
+    Parses the first line of a text or JSON log record.
+
+    Returns:
+        a dict with timestamp (epoch seconds), level, logger, message and
+        job_id, or None for lines continuing the previous record
+    """
+    if line.startswith('{'):
+        try:
+            entry = json.loads(line)
+            timestamp = datetime.fromisoformat(entry['timestamp']).timestamp()
+        except (ValueError, KeyError, TypeError):
+            return None
+        message = entry.get('message', '')
+        if entry.get('exception'):
+            message += '\n' + entry['exception']
+        return {
+            'timestamp': timestamp,
+            'level': entry.get('level'),
+            'logger': entry.get('logger'),
+            'message': message,
+            'job_id': entry.get('job_id'),
+        }
+
+    match = _TEXT_RECORD.match(line)
+    if match is None:
+        return None
+    asctime, logger_name, level, message = match.groups()
+    return {
+        'timestamp': datetime.strptime(asctime, '%Y-%m-%d %H:%M:%S,%f').timestamp(),
+        'level': level,
+        'logger': logger_name,
+        'message': message,
+        'job_id': None,
+    }
+
+
+def _fts_query(text):
+    # Every word must match; quoted so user input can't break FTS syntax
+    return ' '.join('"%s"' % word.replace('"', '""') for word in text.split())
+
+
+class LogIndex:
+    """Searchable index of a log file and its rotations, kept in SQLite"""
+
+    def __init__(self, db_path, log_path):
+        self.db_path = db_path
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS records (
+                    id INTEGER PRIMARY KEY,
+                    inode INTEGER NOT NULL,
+                    timestamp REAL NOT NULL,
+                    level TEXT,
+                    logger TEXT,
+                    message TEXT NOT NULL,
+                    job_id TEXT
+                );
+                CREATE INDEX IF NOT EXISTS records_timestamp ON records (timestamp);
+                CREATE INDEX IF NOT EXISTS records_level ON records (level, timestamp);
+                CREATE INDEX IF NOT EXISTS records_inode ON records (inode);
+                CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5 (
+                    message, content='records', content_rowid='id'
+                );
+                CREATE TRIGGER IF NOT EXISTS records_insert AFTER INSERT ON records BEGIN
+                    INSERT INTO records_fts (rowid, message) VALUES (new.id, new.message);
+                END;
+                CREATE TRIGGER IF NOT EXISTS records_delete AFTER DELETE ON records BEGIN
+                    INSERT INTO records_fts (records_fts, rowid, message)
+                    VALUES ('delete', old.id, old.message);
+                END;
+                CREATE TRIGGER IF NOT EXISTS records_update AFTER UPDATE ON records BEGIN
+                    INSERT INTO records_fts (records_fts, rowid, message)
+                    VALUES ('delete', old.id, old.message);
+                    INSERT INTO records_fts (rowid, message) VALUES (new.id, new.message);
+                END;
+                CREATE TABLE IF NOT EXISTS files (
+                    inode INTEGER PRIMARY KEY,
+                    offset INTEGER NOT NULL
+                );
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def update(self, wait=True):
+        """
+        Indexes the records appended to the log files since the last update.
+        Records of files that were cleared, or rotated out of the backups,
+        are dropped.
+
+        Args:
+            wait: if False, return at once when another update is running
+        Returns:
+            the number of records added
+        """
+        if not self._lock.acquire(blocking=wait):
+            return 0
+        try:
+            return self._update()
+        finally:
+            self._lock.release()
+
+    def _update(self):
+        # Oldest first, so records are numbered in order
+        inodes = {}
+        for path in reversed(get_log_files(self.log_path)):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            inodes[stat.st_ino] = (path, stat.st_size)
+
+        conn = self._connect()
+        try:
+            # Each file is indexed in its own transaction, so searches see a
+            # long catch-up progress. BEGIN IMMEDIATE keeps other processes
+            # from indexing the same lines meanwhile.
+            conn.execute("BEGIN IMMEDIATE")
+            for inode, in conn.execute("SELECT inode FROM files").fetchall():
+                if inode not in inodes:
+                    conn.execute("DELETE FROM records WHERE inode = ?", (inode,))
+                    conn.execute("DELETE FROM files WHERE inode = ?", (inode,))
+            conn.commit()
+
+            added = 0
+            for inode, (path, size) in inodes.items():
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute("SELECT offset FROM files WHERE inode = ?", (inode,)).fetchone()
+                offset = row[0] if row else 0
+                if size < offset:
+                    # Cleared
+                    conn.execute("DELETE FROM records WHERE inode = ?", (inode,))
+                    conn.execute("UPDATE files SET offset = 0 WHERE inode = ?", (inode,))
+                    offset = 0
+                if size > offset:
+                    added += self._index_file(conn, path, inode, offset)
+                conn.commit()
+            return added
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _index_file(self, conn, path, inode, offset):
+        last = conn.execute(
+            "SELECT id, message FROM records WHERE inode = ? ORDER BY id DESC LIMIT 1",
+            (inode,)).fetchone()
+        last_id, last_message = last if last else (None, None)
+        pending = []
+        added = 0
+
+        def flush(records):
+            conn.executemany(
+                "INSERT INTO records (inode, timestamp, level, logger, message, job_id) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(inode, r['timestamp'], r['level'], r['logger'], r['message'], r['job_id'])
+                 for r in records])
+
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    # Still being written
+                    break
+                offset += len(raw)
+                line = raw.decode('utf-8', errors='replace').rstrip('\n')
+                record = parse_record(line)
+                if record is not None:
+                    pending.append(record)
+                    added += 1
+                    if len(pending) > INSERT_BATCH:
+                        # The last record may still get traceback lines
+                        flush(pending[:-1])
+                        del pending[:-1]
+                elif pending:
+                    pending[-1]['message'] += '\n' + line
+                elif last_id is not None:
+                    # Continues the last record indexed by a previous update
+                    last_message += '\n' + line
+                    conn.execute("UPDATE records SET message = ? WHERE id = ?",
+                                 (last_message, last_id))
+        flush(pending)
+        conn.execute("INSERT OR REPLACE INTO files (inode, offset) VALUES (?, ?)",
+                     (inode, offset))
+        return added
+
+    def search(self, text=None, levels=None, since=None, until=None,
+               logger_name=None, job_id=None, limit=100):
+        """
+        Finds log records, newest first. While a large backlog is being
+        indexed by another thread, the records indexed so far are searched.
+
+        Args:
+            text: words that must all appear in the message
+            levels: level names to keep
+            since, until: epoch seconds bounding the record timestamps
+            logger_name: keep records of this logger and its children
+            job_id: keep records logged by this job (JSON logs only)
+            limit: most records returned
+        Returns:
+            an array of dicts with timestamp (ISO 8601), level, logger,
+            message and job_id
+        """
+        self.update(wait=False)
+
+        conditions = []
+        params = []
+        if text and text.split():
+            conditions.append("records.id IN (SELECT rowid FROM records_fts WHERE records_fts MATCH ?)")
+            params.append(_fts_query(text))
+        if levels:
+            conditions.append(f"level IN ({', '.join('?' * len(levels))})")
+            params.extend(levels)
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("timestamp <= ?")
+            params.append(until)
+        if logger_name:
+            conditions.append("(logger = ? OR logger LIKE ? ESCAPE '\\')")
+            escaped = logger_name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            params.extend([logger_name, escaped + '.%'])
+        if job_id:
+            conditions.append("job_id = ?")
+            params.append(job_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT timestamp, level, logger, message, job_id FROM records {where} "
+                "ORDER BY timestamp DESC, id DESC LIMIT ?",
+                params + [limit]).fetchall()
+        return [{
+            'timestamp': datetime.fromtimestamp(timestamp).isoformat(timespec='milliseconds'),
+            'level': level,
+            'logger': name,
+            'message': message,
+            'job_id': record_job_id,
+        } for timestamp, level, name, message, record_job_id in rows]
+
+    def get_stats(self):
+        with self._connect() as conn:
+            records, = conn.execute("SELECT COUNT(*) FROM records").fetchone()
+            files, = conn.execute("SELECT COUNT(*) FROM files").fetchone()
+        return {'records': records, 'files': files}
+
+
+def parse_time(value):
+    """
+    Parses a time given as epoch seconds or ISO 8601.
+
+    Returns:
+        epoch seconds, or None if value is empty
+    Raises:
+        ValueError: if value is neither
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
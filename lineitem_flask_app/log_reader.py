@@ -0,0 +1,262 @@
+"""
+Reads application log files without loading them whole.
+
+Lines are read back from the end of a file in blocks, so the last N lines
+cost O(N) I/O whatever the file size. A cursor ("<inode>:<offset>") marks
+how far a client has read, so polling fetches only the lines appended since,
+and survives RotatingFileHandler rollovers and cleared logs.
+"""
+
+import json
+import os
+import re
+import time
+
+BLOCK_SIZE = 64 * 1024
+
+# RotatingFileHandler keeps all.log.1 (newest) to all.log.5 (oldest)
+BACKUP_COUNT = 5
+
+LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+# Level of a text line, or of a JSON line (LOG_FORMAT=json)
+_LEVEL_PATTERN = re.compile(r' - (DEBUG|INFO|WARNING|ERROR|CRITICAL) - |"level": "(DEBUG|INFO|WARNING|ERROR|CRITICAL)"')
+
+
+def _decode(line):
+    return line.decode('utf-8', errors='replace')
+
+
+def make_cursor(path, offset=None):
+    """Returns a cursor at `offset` of the file, or at its end"""
+    stat = os.stat(path)
+    return f"{stat.st_ino}:{stat.st_size if offset is None else offset}"
+
+
+def parse_cursor(cursor):
+    """Returns (inode, offset) of a cursor, or None if it is malformed"""
+    try:
+        inode, offset = cursor.split(':', 1)
+        return int(inode), int(offset)
+    except (AttributeError, ValueError):
+        return None
+
+
+def tail_lines(path, num_lines, block_size=BLOCK_SIZE):
+    """
+    Returns the last `num_lines` lines of a file, reading blocks backwards
+    from its end.
+
+    Returns:
+        (lines, cursor): the lines, oldest first, and a cursor at the end of
+        the file for read_since()
+    """
+    if not os.path.exists(path):
+        return [], None
+
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        position = end
+        data = b''
+        # One more newline than lines wanted, so the first line is complete
+        while position > 0 and data.count(b'\n') <= num_lines:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            data = f.read(read_size) + data
+        inode = os.fstat(f.fileno()).st_ino
+
+    lines = data.splitlines(keepends=True)
+    if position > 0:
+        # The first line was cut by the block boundary
+        lines = lines[1:]
+    return [_decode(line) for line in lines[-num_lines:]] if num_lines else [], f"{inode}:{end}"
+
+
+def _read_from(path, offset, max_lines):
+    # Complete lines from offset on; a partial last line is left for later
+    lines = []
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b'\n') or len(lines) >= max_lines:
+                break
+            lines.append(_decode(line))
+            offset += len(line)
+    return lines, offset
+
+
+def _find_rotated(path, inode):
+    # The backup a rolled over file was renamed to, newest first
+    for index in range(1, BACKUP_COUNT + 1):
+        backup = f"{path}.{index}"
+        try:
+            if os.stat(backup).st_ino == inode:
+                return index
+        except OSError:
+            return None
+    return None
+
+
+def read_since(path, cursor, max_lines=1000):
+    """
+    Returns the lines appended to a file since `cursor`.
+
+    If the file was rolled over since, the rest of the old file (now a
+    backup) comes first. If it was truncated, or the cursor is unknown,
+    reading restarts from the tail.
+
+    Returns:
+        (lines, cursor, reset): the new lines, the cursor to poll with
+        next, and whether the client should drop what it has shown
+    """
+    if not os.path.exists(path):
+        return [], None, True
+
+    parsed = parse_cursor(cursor)
+    stat = os.stat(path)
+    if parsed is None:
+        lines, cursor = tail_lines(path, max_lines)
+        return lines, cursor, True
+
+    inode, offset = parsed
+    lines = []
+    if inode != stat.st_ino:
+        rotated = _find_rotated(path, inode)
+        if rotated is None:
+            lines, cursor = tail_lines(path, max_lines)
+            return lines, cursor, True
+        # Finish the rolled over file, then every newer backup and the
+        # current file from their start
+        lines, _ = _read_from(f"{path}.{rotated}", offset, max_lines)
+        for index in range(rotated - 1, 0, -1):
+            more, _ = _read_from(f"{path}.{index}", 0, max_lines - len(lines))
+            lines.extend(more)
+        offset = 0
+    elif offset > stat.st_size:
+        # Truncated, e.g. by clear-logs
+        lines, cursor = tail_lines(path, max_lines)
+        return lines, cursor, True
+
+    more, offset = _read_from(path, offset, max(0, max_lines - len(lines)))
+    lines.extend(more)
+    return lines, f"{stat.st_ino}:{offset}", False
+
+
+def get_log_files(path):
+    """Returns the file and its existing backups, newest first"""
+    files = [path] if os.path.exists(path) else []
+    for index in range(1, BACKUP_COUNT + 1):
+        backup = f"{path}.{index}"
+        if not os.path.exists(backup):
+            break
+        files.append(backup)
+    return files
+
+
+def search_logs(path, term, max_results=1000):
+    """
+    Finds lines containing `term` (case-insensitive) in a log file and its
+    rotated backups, streaming each file instead of loading it.
+
+    Returns:
+        an array of {'file', 'line'} dicts, newest file first and in file
+        order within a file, at most `max_results` of the newest matches
+    """
+    needle = term.lower().encode('utf-8')
+    results = []
+    for file_path in get_log_files(path):
+        matches = []
+        with open(file_path, 'rb') as f:
+            for line in f:
+                if needle in line.lower():
+                    matches.append(line)
+                    if len(matches) > max_results:
+                        # Keep the newest matches of the file
+                        matches = matches[-max_results:]
+        name = os.path.basename(file_path)
+        results.extend({'file': name, 'line': _decode(line)} for line in matches[-(max_results - len(results)):])
+        if len(results) >= max_results:
+            break
+    return results
+
+
+def get_line_level(line):
+    """Returns the level name of a log line, or None for continuation lines"""
+    match = _LEVEL_PATTERN.search(line)
+    return (match.group(1) or match.group(2)) if match else None
+
+
+class LineFilter:
+    """
+    Keeps the log lines at one of `levels` and containing `contains`
+    (case-insensitive). Lines without a level, like traceback lines, take
+    the level of the record they continue.
+    """
+
+    def __init__(self, levels=None, contains=None):
+        self.levels = set(levels) if levels else None
+        self.contains = contains.lower() if contains else None
+        self._level = None
+
+    def __call__(self, line):
+        level = get_line_level(line)
+        if level is not None:
+            self._level = level
+        if self.levels is not None and self._level not in self.levels:
+            return False
+        return self.contains is None or self.contains in line.lower()
+
+
+def follow_log(path, cursor=None, line_filter=None, poll_interval=0.5,
+               timeout=None, max_lines=500, keepalive=15):
+    """
+    Yields server-sent events with the lines appended to a log file, like
+    `tail -f`. The file is polled with stat(), so an idle stream costs one
+    system call per interval. Each event carries the cursor to resume from
+    as its id, which EventSource sends back as Last-Event-ID on reconnect.
+
+    Args:
+        path: the log file
+        cursor: resume after this cursor, or start at the end of the file
+        line_filter: callable keeping the lines to send, e.g. a LineFilter
+        poll_interval: seconds between checks of the file
+        timeout: seconds after which the stream ends, or None. The last
+            event sets the cursor, so a reconnecting client resumes there
+        max_lines: most lines read per event
+        keepalive: seconds of silence after which a comment line is sent
+    """
+    if cursor is None or parse_cursor(cursor) is None:
+        cursor = make_cursor(path) if os.path.exists(path) else None
+    started = last_sent = time.time()
+    while True:
+        lines = []
+        reset = False
+        state = parse_cursor(cursor)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stat = None
+        if stat is not None and (state is None or state != (stat.st_ino, stat.st_size)):
+            if state is None:
+                # The file was created since the stream started
+                cursor = make_cursor(path, 0)
+            lines, cursor, reset = read_since(path, cursor, max_lines)
+        if line_filter is not None:
+            lines = [line for line in lines if line_filter(line)]
+
+        if lines or reset:
+            last_sent = time.time()
+            data = {'lines': lines, 'reset': reset, 'cursor': cursor}
+            yield f"id: {cursor}\ndata: {json.dumps(data)}\n\n"
+        elif time.time() - last_sent > keepalive:
+            # Comment line keeping proxies from closing an idle stream
+            last_sent = time.time()
+            yield ": keepalive\n\n"
+        if timeout is not None and time.time() - started > timeout:
+            if cursor is not None:
+                # An event without data only updates Last-Event-ID
+                yield f"id: {cursor}\n\n"
+            return
+        if state == parse_cursor(cursor):
+            time.sleep(poll_interval)
@@ -0,0 +1,457 @@
+"""
+The line item setup pipeline run by the setup jobs of the web app.
+
+Kept apart from app.py so it can be imported (e.g. by benchmark_pipeline.py)
+without starting the app's logging, job store and log index.
+"""
+
+import logging
+
+from Openwrap_DFP_Setup.dfp.associate_line_items_and_creatives import create_line_items_and_licas
+from Openwrap_DFP_Setup.dfp.client import get_client_cache_stats, use_network
+from Openwrap_DFP_Setup.dfp.create_creatives import create_duplicate_creative_configs, resolve_creatives
+from Openwrap_DFP_Setup.dfp.create_line_items import create_line_item_config
+from Openwrap_DFP_Setup.dfp.create_orders import assign_order_shards, get_or_create_orders
+from Openwrap_DFP_Setup.dfp.exceptions import DFPBatchException
+from Openwrap_DFP_Setup.dfp.get_advertisers import create_advertiser
+from Openwrap_DFP_Setup.dfp.get_advertisers import get_advertiser_id_by_name
+from Openwrap_DFP_Setup.dfp.get_placements import get_placement_ids_by_name
+from Openwrap_DFP_Setup.dfp.get_root_ad_unit_id import get_root_ad_unit_id
+from Openwrap_DFP_Setup.dfp.reconcile_line_items import reconcile_line_items
+from Openwrap_DFP_Setup.tasks.add_new_openwrap_partner import OpenWrapTargetingKeyGen
+from Openwrap_DFP_Setup.tasks.price_buckets import expand_price_ranges
+
+logger = logging.getLogger('lineitem_app')
+
+def get_exchange_rate(from_currency, to_currency):
+    """
+    Get exchange rate between currencies.
+    This is a simplified implementation - in production, you'd want to use a real exchange rate API.
+    """
+    # Simplified exchange rates (you should replace this with a real API)
+    exchange_rates = {
+        'USD': {
+            'INR': 83.0,   # 1 USD = 83 INR (approximate)
+            'EUR': 0.92,   # 1 USD = 0.92 EUR
+            'GBP': 0.79,   # 1 USD = 0.79 GBP
+            'JPY': 150.0,  # 1 USD = 150 JPY (approximate)
+        },
+        'INR': {
+            'USD': 0.012,  # 1 INR = 0.012 USD
+            'EUR': 0.011,  # 1 INR = 0.011 EUR
+            'GBP': 0.0095, # 1 INR = 0.0095 GBP
+            'JPY': 1.81,   # 1 INR = 1.81 JPY
+        },
+        'EUR': {
+            'USD': 1.09,   # 1 EUR = 1.09 USD
+            'INR': 90.2,   # 1 EUR = 90.2 INR
+            'GBP': 0.86,   # 1 EUR = 0.86 GBP
+            'JPY': 163.0,  # 1 EUR = 163 JPY
+        },
+        'GBP': {
+            'USD': 1.27,   # 1 GBP = 1.27 USD
+            'INR': 105.1,  # 1 GBP = 105.1 INR
+            'EUR': 1.16,   # 1 GBP = 1.16 EUR
+            'JPY': 190.0,  # 1 GBP = 190 JPY
+        },
+        'JPY': {
+            'USD': 0.0067, # 1 JPY = 0.0067 USD
+            'INR': 0.55,   # 1 JPY = 0.55 INR
+            'EUR': 0.0061, # 1 JPY = 0.0061 EUR
+            'GBP': 0.0053, # 1 JPY = 0.0053 GBP
+        }
+    }
+    
+    if from_currency == to_currency:
+        return 1.0
+    
+    if from_currency in exchange_rates and to_currency in exchange_rates[from_currency]:
+        return exchange_rates[from_currency][to_currency]
+    
+    # If no direct rate found, try reverse conversion
+    if to_currency in exchange_rates and from_currency in exchange_rates[to_currency]:
+        return 1.0 / exchange_rates[to_currency][from_currency]
+    
+    # Default to 1.0 if no conversion rate found
+    logger.warning(f"No exchange rate found for {from_currency} to {to_currency}, using 1.0")
+    return 1.0
+
+def get_lineitem_name(price, lineitem_prefix):
+    """
+    Name of the line item of a price bucket, e.g. "<prefix>_HB $1.50".
+    """
+    price_str = price['start_range']
+    if price.get('granularity') == '-1':
+        name = f"HB ${price_str}+ (Catch-all {price['start_range']}-{price['end_range']})"
+    else:
+        name = f"HB ${price_str}"
+    if lineitem_prefix:
+        name = f"{lineitem_prefix}_{name}"
+    return name
+
+def run_lineitem_setup(form, progress=None, journal=None):
+    """
+    Run the whole setup for a submitted form: targeting, orders, creatives,
+    line items and LICAs. Runs as a background job; `progress` is called with
+    (stage, percent, message) as each stage starts. With a JobJournal, what
+    an earlier attempt of the job created is reused instead of created again.
+
+    The job works on the network of the form through a client of its own, so
+    concurrent jobs for different networks don't affect each other.
+    """
+    with use_network(form.get('network_code') or None):
+        return _run_lineitem_setup(form, progress=progress, journal=journal)
+
+def _run_lineitem_setup(form, progress=None, journal=None):
+    if progress is None:
+        progress = lambda stage, percent, message=None: None
+
+    def run_stage(stage, func, *args):
+        # Stages completed by an earlier attempt of the job are not run again
+        if journal is None:
+            return func(*args)
+        return journal.run_stage(stage, func, *args)
+
+    logger.info("Processing form submission (after user confirmation)")
+
+    order_name = form['order_name']
+    user_email = form['user_email']
+    advertiser_name = form['advertiser_name']
+    network_code = form['network_code']
+    lineitem_prefix = form.get('lineitem_prefix', '')
+    lineitem_type = form['lineitem_type']
+    setup_type = form.get('openwrap_setup_type', 'WEB')
+    
+    logger.info(f"Form data - Order: {order_name}, Advertiser: {advertiser_name}, Network: {network_code}")
+    logger.info(f"Form data - Line Item Type: {lineitem_type}, Setup Type: {setup_type}, Prefix: {lineitem_prefix}")
+    
+    # Map setup_type to canonical pwtplt value
+    pwtplt_map = {
+        'WEB': 'DISPLAY',
+        'WEB_SAFEFRAME': 'DISPLAY',
+        'IN_APP': 'IN_APP',
+        'IN_APP_VIDEO': 'IN_APP',
+        'AMP': 'AMP',
+        'NATIVE': 'NATIVE',
+        'IN_APP_NATIVE': 'NATIVE',
+        'ADPOD': 'VIDEO',
+        'VIDEO': 'VIDEO',
+        'JWPLAYER': 'VIDEO',
+    }
+    canonical_pwtplt = pwtplt_map.get(setup_type, setup_type)
+    creative_sizes_str = form['creative_sizes']
+    currency_code = form.get('currency_code', 'USD')
+    num_creatives = int(form.get('num_creatives', '1') or '1')
+    
+    logger.info(f"Creative sizes: {creative_sizes_str}, Currency: {currency_code}, Num creatives: {num_creatives}")
+    
+    # Extract currency exchange settings
+    currency_exchange = form.get('currency_exchange') == 'on'  # Checkbox returns 'on' when checked
+    target_currency = form.get('target_currency', 'INR')  # New field for target currency, default to INR
+    
+    if currency_exchange:
+        logger.info(f"Currency exchange enabled: {currency_code} -> {target_currency}")
+
+    # Prepare price bucket ranges
+    expanded_prices = []
+    ranges_count = int(form.get('ranges_count', '0') or '0')
+    logger.debug(f"ranges_count: {ranges_count}")
+    
+    # If no ranges provided, create a default range
+    if ranges_count == 0:
+        logger.debug("No ranges provided, creating default range")
+        expanded_prices.append({
+            'start_range': '5.00',
+            'end_range': '7.00',
+            'granularity': '0.03',
+            'rate_id': '2',
+            'pwtecp_values': ['5.00', '5.01', '5.02']
+        })
+    else:
+        logger.info(f"Processing {ranges_count} price ranges")
+        price_ranges = []
+        for i in range(ranges_count):
+            start = float(form.get(f'start_range_{i}'))
+            end = float(form.get(f'end_range_{i}'))
+            gran = float(form.get(f'granularity_{i}'))
+            rate_id = form.get(f'rate_id_{i}')
+            
+            logger.debug(f"Range {i+1}: {start} to {end}, granularity: {gran}, rate_id: {rate_id}")
+            
+            # Apply currency conversion if enabled
+            if currency_exchange and target_currency != currency_code:
+                exchange_rate = get_exchange_rate(currency_code, target_currency)
+                original_start, original_end = start, end
+                start = start * exchange_rate
+                end = end * exchange_rate
+                if gran != -1:
+                    gran = gran * exchange_rate
+                logger.info(f"Applied exchange rate {exchange_rate}: {original_start}-{original_end} -> {start:.2f}-{end:.2f}")
+            
+            # Catch-all (-1): one line item for the whole range, pwtecp is all integer values in range
+            price_ranges.append((start, end, gran, rate_id))
+
+        expanded_prices = expand_price_ranges(price_ranges)
+        logger.debug(f"Created {len(expanded_prices)} buckets with {expanded_prices.num_pwtecp_values} pwtecp values")
+
+    # Get bidder name and code from form
+    bidder_name = form.get('bidder_name', '').strip() or None
+    bidder_code = form.get('bidder_code', '').strip() or None
+    
+    # Auto-generate names if both bidder name and code are provided
+    if bidder_name and bidder_code:
+        # Override form values with auto-generated ones
+        original_order_name = order_name
+        original_advertiser_name = advertiser_name
+        original_lineitem_prefix = lineitem_prefix
+        
+        order_name = f'Openwrap-{bidder_name}-display'
+        advertiser_name = f'Network OpenWrap {bidder_name}'
+        lineitem_prefix = f'OpenWrap-{bidder_name}-display'
+        
+        logger.info(f"Auto-generated names for bidder '{bidder_name}':")
+        logger.info(f"  Order Name: {original_order_name} -> {order_name}")
+        logger.info(f"  Advertiser Name: {original_advertiser_name} -> {advertiser_name}")
+        logger.info(f"  Line Item Prefix: {original_lineitem_prefix} -> {lineitem_prefix}")
+    
+    logger.info(f"Final configuration:")
+    logger.info(f"  Expanded price buckets: {len(expanded_prices)}")
+    logger.info(f"  Network code: {network_code}")
+    logger.info(f"  Bidder name: {bidder_name}")
+    logger.info(f"  Bidder code: {bidder_code}")
+    logger.info(f"  Canonical pwtplt: {canonical_pwtplt}")
+
+    progress('targeting_keys', 5, "Creating targeting keys")
+    logger.info("Creating OpenWrap targeting key generator")
+    try:
+        key_gen_obj = OpenWrapTargetingKeyGen(price_els=expanded_prices, creative_type=canonical_pwtplt, bidder_code=bidder_code)
+        logger.info("OpenWrap targeting key generator created successfully")
+    except Exception as e:
+        logger.error(f"Failed to create OpenWrap targeting key generator: {e}")
+        raise
+
+    price_configs = key_gen_obj.price_els
+    lineitem_names = [get_lineitem_name(price, lineitem_prefix) for price in price_configs]
+
+    # Ensure orders exist. Setups above the per-order line item limit
+    # are sharded across order_name-1, order_name-2, ..., counting the line
+    # items the orders of earlier setups already hold
+    progress('orders', 15, "Looking up orders")
+    # Line items of the existing orders, read while sharding and reused when
+    # reconciling. A resumed job skips the sharding and reads them again.
+    line_items_by_order = {}
+
+    def assign_shards(order_name, lineitem_names):
+        order_names, shard_of_price, fetched = assign_order_shards(order_name, lineitem_names)
+        line_items_by_order.update(fetched)
+        return order_names, shard_of_price
+
+    try:
+        order_names, shard_of_price = run_stage('order_shards', assign_shards, order_name, lineitem_names)
+        logger.info(f"Checking if orders {order_names} exist")
+        order_ids = run_stage('orders', get_or_create_orders, order_names, advertiser_name, user_email)
+        for shard_order_name, shard_order_id in zip(order_names, order_ids):
+            logger.info(f"Using order '{shard_order_name}' with ID: {shard_order_id}")
+    except Exception as e:
+        logger.error(f"Error with order creation/lookup: {e}")
+        raise
+
+    # Handle sizes
+    sizes = []
+    try:
+        for size_str in creative_sizes_str.split(','):
+            w, h = size_str.lower().split('x')
+            sizes.append({'width': int(w.strip()), 'height': int(h.strip())})
+        logger.info(f"Creative sizes: {sizes}")
+    except Exception as e:
+        logger.error(f"Error parsing creative sizes '{creative_sizes_str}': {e}")
+        raise
+
+    # Determine inventory targeting
+    progress('inventory', 20, "Resolving inventory targeting")
+    placement_ids = []
+    ad_unit_ids = []
+    placement_names_str = form.get('placement_names', '').strip()
+    if placement_names_str:
+        # User provided placement names (comma-separated)
+        placement_names = [p.strip() for p in placement_names_str.split(',') if p.strip()]
+        if placement_names:
+            logger.info(f"Looking up placements: {placement_names}")
+            try:
+                placement_ids = get_placement_ids_by_name(placement_names)
+                logger.info(f"Found placement IDs: {placement_ids}")
+            except Exception as e:
+                logger.error(f"Error looking up placements: {e}")
+                raise
+    if not placement_ids:
+        # Run of Network: target root ad unit
+        logger.info("No placements specified, using Run of Network targeting")
+        try:
+            ad_unit_ids = [get_root_ad_unit_id()]
+            logger.info(f"Root ad unit ID: {ad_unit_ids}")
+        except Exception as e:
+            logger.error(f"Error getting root ad unit ID: {e}")
+            raise
+
+    # Get all targeting sets (one per line item)
+    progress('targeting', 25, "Generating targeting for each price bucket")
+    logger.info("Generating DFP targeting")
+    try:
+        targeting_sets = key_gen_obj.get_dfp_targeting()
+        logger.info(f"Generated {len(targeting_sets)} targeting sets")
+    except Exception as e:
+        logger.error(f"Error generating DFP targeting: {e}")
+        raise
+
+    # Use target currency for line items if currency exchange is enabled
+    final_currency_code = target_currency if currency_exchange else currency_code
+
+    # Create line item configs for each price bucket
+    progress('line_item_configs', 45, "Building line item configurations")
+    logger.info("Creating line item configurations")
+    line_items_to_create = []
+    for idx, price in enumerate(price_configs):
+        # start_range is already 2 decimals
+        price_str = price['start_range']
+        name = lineitem_names[idx]
+        micro_amount = int(float(price['start_range']) * 1000000)
+        
+        logger.debug(f"Creating line item config {idx+1}/{len(price_configs)}: {name}")
+        logger.debug(f"  Price: ${price_str}, Micro amount: {micro_amount}, Currency: {final_currency_code}")
+        
+        try:
+            config = create_line_item_config(
+                name=name,
+                order_id=order_ids[shard_of_price[idx]],
+                placement_ids=placement_ids,
+                ad_unit_ids=ad_unit_ids,
+                cpm_micro_amount=micro_amount,
+                sizes=sizes,
+                key_gen_obj=None,  # We'll pass custom targeting directly
+                lineitem_type=lineitem_type,
+                currency_code=final_currency_code,
+                setup_type=setup_type,
+                custom_targeting=targeting_sets[idx]
+            )
+            line_items_to_create.append(config)
+            logger.debug(f"Line item config created successfully: {name}")
+        except Exception as e:
+            logger.error(f"Error creating line item config for {name}: {e}")
+            raise
+
+    # --- Create creatives, then line items associated with them ---
+    # Get advertiser ID (needed for creatives)
+    progress('creatives', 50, "Creating creatives")
+    advertiser_id = None
+    try:
+        # Try to get advertiser ID by name
+        logger.info(f"Looking up advertiser: {advertiser_name}")
+        advertiser_id = run_stage('advertiser', get_advertiser_id_by_name, advertiser_name)
+        logger.info(f"Found advertiser ID: {advertiser_id}")
+    except ImportError:
+        # Fallback: create advertiser if not found
+        logger.info(f"Creating new advertiser: {advertiser_name}")
+        try:
+            advertiser_result = create_advertiser(advertiser_name)
+            advertiser_id = advertiser_result['id']
+            logger.info(f"Advertiser created with ID: {advertiser_id}")
+        except Exception as e:
+            logger.error(f"Error creating advertiser: {e}")
+            raise
+    except Exception as e:
+        logger.error(f"Error looking up advertiser: {e}")
+        raise
+    
+    # Select creative snippet file based on platform
+    if setup_type in ["IN_APP", "IN_APP_VIDEO", "IN_APP_NATIVE"]:
+        creative_file = "creative_snippet_openwrap_in_app.html"
+    elif setup_type == "AMP":
+        creative_file = "creative_snippet_openwrap_amp.html"
+    elif setup_type in ["VIDEO", "JWPLAYER", "ADPOD"]:
+        # Use a video-specific snippet if available, else fallback
+        creative_file = "creative_snippet_openwrap_sf.html"  # fallback to .html if not present
+    else:
+        creative_file = "creative_snippet_openwrap.html"
+    
+    logger.info(f"Using creative file: {creative_file}")
+    
+    # Create creative configs
+    logger.info(f"Creating {num_creatives} creatives per line item")
+    try:
+        creative_configs = create_duplicate_creative_configs(
+            bidder_code=None,  # Not used for OpenWrap
+            order_name=order_name,
+            advertiser_id=advertiser_id,
+            sizes=sizes,
+            num_creatives=num_creatives,
+            prefix=lineitem_prefix,
+            creative_file=creative_file
+        )
+        logger.info(f"Creative configs created: {len(creative_configs)}")
+    except Exception as e:
+        logger.error(f"Error creating creative configs: {e}")
+        raise
+    
+    # Creatives left by a previous run for this advertiser are reused
+    logger.info("Resolving creatives")
+    try:
+        creative_ids = run_stage('creatives', resolve_creatives, creative_configs)
+        logger.info(f"Creatives ready: {creative_ids}")
+    except Exception as e:
+        logger.error(f"Error creating creatives: {e}")
+        raise
+    
+    # Line items already in the orders are kept, or updated if their rate or
+    # targeting changed, so re-running a setup only creates what is missing
+    progress('reconcile', 55, "Comparing with the line items already in the orders")
+    try:
+        result_ids, line_item_plan = reconcile_line_items(line_items_to_create, checkpoint=journal,
+                                                          line_items_by_order=line_items_by_order)
+    except Exception as e:
+        logger.error(f"Error reconciling existing line items: {e}")
+        raise
+    pending_line_items = [line_items_to_create[idx] for idx in line_item_plan['create']]
+    # Kept and updated line items get the creatives they are missing
+    existing_line_item_ids = [line_item_id for line_item_id in result_ids if line_item_id is not None]
+
+    # Create line items and associate creatives with them. LICA batches
+    # are sent as soon as each chunk of line items is created.
+    progress('line_items', 60, f"Creating {len(pending_line_items)} line items and associating creatives")
+    logger.info(f"Creating {len(pending_line_items)} line items and associating creatives")
+    # The form has no ad pod slots or durations: ADPOD creatives are
+    # associated like those of a video setup
+    lica_setup_type = 'VIDEO' if setup_type == 'ADPOD' else setup_type
+    try:
+        created_ids, lica_counts = create_line_items_and_licas(
+            pending_line_items, creative_ids, size_overrides=sizes, setup_type=lica_setup_type,
+            checkpoint=journal, existing_line_item_ids=existing_line_item_ids)
+        logger.info(f"Line items created successfully: {created_ids}")
+        for idx, line_item_id in zip(line_item_plan['create'], created_ids):
+            result_ids[idx] = line_item_id
+        logger.info(f"Creative association completed: {lica_counts}")
+    except DFPBatchException as e:
+        logger.error(f"Error creating line items or associating creatives: {e}")
+        logger.error(f"Line items created before the failure: {e.created_ids}")
+        if e.counts:
+            logger.error(f"Creative associations: {e.counts}")
+        raise
+    except Exception as e:
+        logger.error(f"Error creating line items or associating creatives: {e}")
+        raise
+
+    # Prepare summary info
+    currency_info = f" (Currency: {final_currency_code})" if currency_exchange else ""
+    orders_info = f"Order '{order_name}'" if len(order_names) == 1 else f"Orders {', '.join(order_names)}"
+    plan_counts = {action: len(items) for action, items in line_item_plan.items()}
+    summary_message = (f"✅ {orders_info} created. Line items: {len(result_ids)} "
+                       f"({plan_counts['create']} created, {plan_counts['update']} updated, "
+                       f"{plan_counts['skip']} unchanged). Creatives per line item: {num_creatives}.{currency_info}")
+    logger.info(f"Form processing completed successfully: {summary_message}")
+    logger.info(f"Ad Manager client cache stats: {get_client_cache_stats()}")
+    return {
+        'message': summary_message,
+        'order_names': order_names,
+        'line_item_ids': result_ids,
+        'line_item_plan': plan_counts,
+        'licas': lica_counts,
+    }
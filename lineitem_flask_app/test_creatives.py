@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Tests of creative configs and their snippet files.
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add the current and parent directories to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+for path in (current_dir, parent_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from Openwrap_DFP_Setup.dfp import create_creatives
+from Openwrap_DFP_Setup.dfp.create_creatives import create_creative_config, get_snippet
+
+
+@pytest.fixture
+def snippet_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(create_creatives, 'SNIPPET_DIR', str(tmp_path))
+    monkeypatch.setattr(create_creatives, '_snippets', {})
+    (tmp_path / 'creative_snippet.html').write_text('default')
+    (tmp_path / 'creative_snippet_openwrap.html').write_text('openwrap')
+    return tmp_path
+
+
+def test_snippets_are_loaded_once_and_shared(snippet_dir):
+    configs = [create_creative_config(f'c{i}', 1, creative_file='creative_snippet_openwrap.html')
+               for i in range(2)]
+
+    assert configs[0]['snippet'] == 'openwrap'
+    assert configs[0]['snippet'] is configs[1]['snippet']
+    assert sorted(create_creatives._snippets) == ['creative_snippet.html', 'creative_snippet_openwrap.html']
+    assert create_creative_config('c', 1)['snippet'] == 'default'
+
+
+def test_changed_snippets_are_read_again(snippet_dir):
+    path = snippet_dir / 'creative_snippet.html'
+    assert get_snippet('creative_snippet.html') == 'default'
+
+    path.write_text('changed')
+    mtime = os.path.getmtime(path) + 10
+    os.utime(path, (mtime, mtime))
+
+    assert get_snippet('creative_snippet.html') == 'changed'
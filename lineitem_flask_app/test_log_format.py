@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Tests of the log record context and the JSON-lines log format.
+"""
+
+import json
+import logging
+import os
+import sys
+
+# Add the current and parent directories to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+for path in (current_dir, parent_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from Openwrap_DFP_Setup.dfp.tracing import StageSpans, job_context
+from log_format import JsonFormatter, LogContextFilter
+
+
+def make_record(message, exc_info=None, **extra):
+    record = logging.LogRecord('setup', logging.ERROR, __file__, 10, message, None, exc_info)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_records_are_tagged_with_the_job_and_stage():
+    record = make_record('in a stage')
+    with job_context('job-1'):
+        stages = StageSpans()
+        stages.start('orders')
+        LogContextFilter().filter(record)
+        stages.finish()
+
+    assert (record.job_id, record.stage) == ('job-1', 'orders')
+    untagged = make_record('outside')
+    LogContextFilter().filter(untagged)
+    assert (untagged.job_id, untagged.stage) == (None, None)
+
+
+def test_records_are_formatted_as_one_json_line():
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        record = make_record('failed\nbadly', exc_info=sys.exc_info(), job_id='job-1', duration=1.234567)
+
+    line = JsonFormatter().format(record)
+
+    assert '\n' not in line
+    entry = json.loads(line)
+    assert (entry['level'], entry['logger'], entry['message']) == ('ERROR', 'setup', 'failed\nbadly')
+    assert (entry['job_id'], entry['duration']) == ('job-1', 1.2346)
+    assert 'stage' not in entry
+    assert entry['exception'].endswith('ValueError: boom')
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests of the full-text log index.
+"""
+
+import os
+import sys
+
+# Add the current directory to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from log_index import LogIndex, parse_time
+
+
+def write_lines(path, lines, mode='a'):
+    with open(path, mode) as f:
+        f.writelines(f"{line}\n" for line in lines)
+
+
+def record(second, level, logger_name, message):
+    return f"2026-01-01 10:00:{second:02d},000 - {logger_name} - {level} - run:1 - {message}"
+
+
+def test_records_are_indexed_and_searched(tmp_path):
+    path = str(tmp_path / 'all.log')
+    write_lines(path, [
+        record(1, 'INFO', 'app', 'Creating order alpha'),
+        record(2, 'ERROR', 'Openwrap_DFP_Setup.dfp.create_orders', 'Order alpha failed'),
+        'Traceback (most recent call last):',
+    ])
+    index = LogIndex(str(tmp_path / 'index.db'), path)
+
+    assert index.update() == 2
+    # Traceback lines written later still belong to their record
+    write_lines(path, ['ValueError: boom', record(3, 'INFO', 'app_other', 'Done')])
+    assert index.update() == 1
+
+    assert [r['message'] for r in index.search('alpha')] == [
+        'Order alpha failed\nTraceback (most recent call last):\nValueError: boom',
+        'Creating order alpha']
+    assert [r['level'] for r in index.search(levels=['ERROR'])] == ['ERROR']
+    assert [r['logger'] for r in index.search(logger_name='Openwrap_DFP_Setup')] == [
+        'Openwrap_DFP_Setup.dfp.create_orders']
+    assert [r['message'] for r in index.search(logger_name='app')] == ['Creating order alpha']
+    assert len(index.search(since=parse_time('2026-01-01T10:00:02'))) == 2
+    assert len(index.search('alpha', limit=1)) == 1
+
+
+def test_rollovers_are_not_indexed_again_and_cleared_logs_are_dropped(tmp_path):
+    path = str(tmp_path / 'all.log')
+    write_lines(path, [record(1, 'INFO', 'app', 'first')])
+    index = LogIndex(str(tmp_path / 'index.db'), path)
+    index.update()
+
+    os.rename(path, path + '.1')
+    write_lines(path, [record(2, 'INFO', 'app', 'second')])
+    assert index.update() == 1
+    assert index.get_stats() == {'records': 2, 'files': 2}
+
+    write_lines(path, [record(3, 'INFO', 'app', 'third')], mode='w')
+    os.remove(path + '.1')
+    assert index.update() == 1
+    assert [r['message'] for r in index.search()] == ['third']
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Tests of reading log files by cursor.
+"""
+
+import os
+import sys
+
+# Add the current directory to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from log_reader import LineFilter, follow_log, read_since, search_logs, tail_lines
+
+
+def write_lines(path, lines, mode='a'):
+    with open(path, mode) as f:
+        f.writelines(f"{line}\n" for line in lines)
+
+
+def test_tail_reads_the_last_lines_across_blocks(tmp_path):
+    path = str(tmp_path / 'all.log')
+    write_lines(path, [f"line {i}" for i in range(100)])
+
+    lines, cursor = tail_lines(path, 3, block_size=16)
+
+    assert lines == ['line 97\n', 'line 98\n', 'line 99\n']
+    assert cursor.endswith(f":{os.path.getsize(path)}")
+
+
+def test_cursor_reads_only_appended_lines(tmp_path):
+    path = str(tmp_path / 'all.log')
+    write_lines(path, ['one', 'two'])
+    _, cursor = tail_lines(path, 10)
+
+    assert read_since(path, cursor) == ([], cursor, False)
+
+    write_lines(path, ['three'])
+    with open(path, 'a') as f:
+        f.write('partial')
+    lines, cursor, reset = read_since(path, cursor)
+    assert (lines, reset) == (['three\n'], False)
+
+    with open(path, 'a') as f:
+        f.write(' line\n')
+    lines, cursor, reset = read_since(path, cursor)
+    assert (lines, reset) == (['partial line\n'], False)
+
+
+def test_cursor_follows_a_rollover(tmp_path):
+    path = str(tmp_path / 'all.log')
+    write_lines(path, ['one'])
+    _, cursor = tail_lines(path, 10)
+    write_lines(path, ['two'])
+    os.rename(path, path + '.1')
+    write_lines(path, ['three'])
+
+    lines, cursor, reset = read_since(path, cursor)
+
+    assert (lines, reset) == (['two\n', 'three\n'], False)
+    assert read_since(path, cursor)[0] == []
+
+
+def test_cursor_resets_on_truncation_or_garbage(tmp_path):
+    path = str(tmp_path / 'all.log')
+    write_lines(path, ['one', 'two'])
+    _, cursor = tail_lines(path, 10)
+    write_lines(path, ['new'], mode='w')
+
+    assert read_since(path, cursor) == (['new\n'], tail_lines(path, 1)[1], True)
+    assert read_since(path, 'garbage')[2] is True
+
+
+def test_search_returns_the_newest_matches_of_every_file(tmp_path):
+    path = str(tmp_path / 'all.log')
+    write_lines(path + '.2', ['ERROR old', 'INFO old'])
+    write_lines(path + '.1', ['error older', 'ERROR newer'])
+    write_lines(path, ['INFO now', 'Error now'])
+
+    assert [(r['file'], r['line']) for r in search_logs(path, 'error')] == [
+        ('all.log', 'Error now\n'),
+        ('all.log.1', 'error older\n'),
+        ('all.log.1', 'ERROR newer\n'),
+        ('all.log.2', 'ERROR old\n'),
+    ]
+    assert [r['line'] for r in search_logs(path, 'error', max_results=2)] == [
+        'Error now\n', 'ERROR newer\n']
+
+
+def test_follow_ends_at_the_timeout_with_its_cursor(tmp_path):
+    path = str(tmp_path / 'all.log')
+    write_lines(path, ['old'])
+    _, cursor = tail_lines(path, 1)
+    write_lines(path, ['x - INFO - kept', 'x - DEBUG - dropped'])
+
+    events = list(follow_log(path, cursor, LineFilter(['INFO']),
+                             poll_interval=0.01, timeout=0.05))
+
+    assert len(events) == 2
+    assert '"lines": ["x - INFO - kept\\n"]' in events[0]
+    # The stream closes on an event that only moves Last-Event-ID
+    assert events[-1] == f"id: {tail_lines(path, 1)[1]}\n\n"
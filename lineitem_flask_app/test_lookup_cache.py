@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Tests of the DFP lookup cache.
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add the current and parent directories to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+for path in (current_dir, parent_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from Openwrap_DFP_Setup.dfp import lookup_cache
+from Openwrap_DFP_Setup.dfp.exceptions import DFPObjectNotFound
+from Openwrap_DFP_Setup.dfp.lookup_cache import LookupCache, cached_lookup, remember_lookup
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(lookup_cache, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = LookupCache(str(tmp_path / 'lookups.db'), ttls={'order': 60},
+                        negative_ttl=10, max_entries=3)
+    monkeypatch.setattr(lookup_cache, 'get_lookup_cache', lambda: cache)
+    monkeypatch.setattr(lookup_cache, '_get_network_code', lambda: 'net')
+    return cache
+
+
+def test_entries_expire_after_their_ttl(cache, clock):
+    cache.set('net', 'order', 'found', 1)
+    cache.set('net', 'order', 'missing', None, found=False)
+
+    clock.now += 30
+    assert cache.get('net', 'order', 'found') == (True, True, 1)
+    assert cache.get('net', 'order', 'missing') == (False, False, None)
+
+    clock.now += 31
+    assert cache.get('net', 'order', 'found') == (False, False, None)
+    assert cache.get_stats()['expired'] == 2
+
+
+def test_least_recently_used_entries_are_evicted(cache, clock):
+    for i, key in enumerate(['a', 'b', 'c']):
+        clock.now += 1
+        cache.set('net', 'order', key, i)
+    clock.now += 1
+    cache.get('net', 'order', 'a')
+
+    clock.now += 1
+    cache.set('net', 'order', 'd', 3)
+
+    assert cache.get('net', 'order', 'b')[0] is False
+    assert [cache.get('net', 'order', key)[2] for key in 'acd'] == [0, 2, 3]
+    assert cache.get_stats()['evicted'] == 1
+
+
+def test_lookups_are_cached_however_the_arguments_are_passed(cache):
+    calls = []
+
+    @cached_lookup('order')
+    def get_order_id(name, order_type='ADVERTISER'):
+        calls.append(name)
+        return len(calls)
+
+    assert get_order_id('o') == 1
+    assert get_order_id(name='o') == 1
+    assert get_order_id('o', 'ADVERTISER') == 1
+    assert get_order_id('o', order_type='ADVERTISER') == 1
+    assert get_order_id('o', order_type='AGENCY') == 2
+    assert calls == ['o', 'o']
+
+    remember_lookup('order', ('p', 'ADVERTISER'), 10)
+    assert get_order_id(name='p') == 10
+    assert len(calls) == 2
+
+
+def test_not_found_lookups_are_cached(cache):
+    calls = []
+
+    @cached_lookup('order')
+    def get_order_id(name):
+        calls.append(name)
+        raise DFPObjectNotFound('No order named {0}'.format(name))
+
+    for _ in range(2):
+        with pytest.raises(DFPObjectNotFound, match='No order named o'):
+            get_order_id(name='o')
+    assert calls == ['o']
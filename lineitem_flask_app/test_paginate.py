@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Tests of the statement paginator against the fake DFP backend.
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add the current and parent directories to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+for path in (current_dir, parent_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from Openwrap_DFP_Setup.dfp.fake_client import FakeAdManagerClient
+from Openwrap_DFP_Setup.dfp.paginate import paginate
+
+FETCH_METHOD = 'CreativeService.getCreativesByStatement'
+
+
+@pytest.fixture
+def fake():
+    client = FakeAdManagerClient(latency_scale=0)
+    for i in range(1234):
+        client.add('Creatives', name=f'creative-{i % 2}-{i}', advertiserId=1)
+    return client
+
+
+def get_fetch(fake):
+    return fake.GetService('CreativeService').getCreativesByStatement
+
+
+def count_calls(fake):
+    return fake.get_stats()['methods'][FETCH_METHOD]['calls']
+
+
+@pytest.mark.parametrize('prefetch', [False, True])
+def test_reads_every_page(fake, prefetch):
+    paginator = paginate(get_fetch(fake), page_size=100, prefetch=prefetch)
+
+    names = [creative['name'] for creative in paginator]
+
+    assert names == [creative['name'] for creative in fake.objects['Creatives'].values()]
+    assert (paginator.pages, paginator.items, paginator.total) == (13, 1234, 1234)
+    assert count_calls(fake) == 13
+
+
+@pytest.mark.parametrize('prefetch', [False, True])
+def test_reads_the_pages_of_a_filter(fake, prefetch):
+    paginator = paginate(get_fetch(fake), 'WHERE name LIKE :name',
+                         [{'key': 'name', 'value': {'xsi_type': 'TextValue',
+                                                    'value': 'creative-1-%'}}],
+                         page_size=100, prefetch=prefetch)
+
+    pages = list(paginator.iter_pages())
+
+    assert [len(page) for page in pages] == [100] * 6 + [17]
+    assert all(creative['name'].startswith('creative-1-')
+               for page in pages for creative in page)
+    assert count_calls(fake) == 7
+
+
+def test_stops_when_nothing_matches(fake):
+    paginator = paginate(get_fetch(fake), 'WHERE name = :name',
+                         [{'key': 'name', 'value': {'xsi_type': 'TextValue',
+                                                    'value': 'missing'}}],
+                         prefetch=True)
+
+    assert list(paginator) == []
+    assert (paginator.pages, paginator.total) == (0, 0)
+    assert count_calls(fake) == 1
+
+
+def test_first_and_count_read_a_single_result(fake):
+    paginator = paginate(get_fetch(fake), page_size=100)
+
+    assert paginator.first()['name'] == 'creative-0-0'
+    assert paginator.count() == 1234
+    assert count_calls(fake) == 2
+    # The page size is restored for reading the pages
+    assert len(next(paginator.iter_pages())) == 100
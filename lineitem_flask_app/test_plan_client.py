@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Tests of the dry-run planning client.
+"""
+
+import os
+import sys
+
+# Add the current and parent directories to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+for path in (current_dir, parent_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from Openwrap_DFP_Setup.dfp.client import use_client
+from Openwrap_DFP_Setup.dfp.plan_client import PlanningAdManagerClient, estimate_call_seconds
+from setup_pipeline import run_lineitem_setup
+from test_setup_pipeline import build_form
+
+
+def test_plan_counts_the_objects_of_a_setup():
+    planner = PlanningAdManagerClient()
+    with use_client(planner):
+        result = run_lineitem_setup(build_form(20, creatives=2))
+
+    report = planner.get_report()
+
+    assert result['order_names'] == ['test-order']
+    counts = report['counts']
+    assert (counts['orders'], counts['line_items'], counts['creatives'], counts['licas']) == (1, 20, 2, 40)
+    # Advertisers are looked up, never created
+    assert counts['advertisers'] == 0
+    # Nothing is read from the network, so existing targeting values count too
+    assert counts['targeting_values'] >= 20
+    assert report['counts_are_upper_bounds'] is True
+    assert report['api_calls'] == len(planner.calls)
+    assert report['payload_bytes'] == sum(call['payload_bytes'] for call in planner.calls)
+
+
+def test_concurrent_calls_are_spread_over_the_workers():
+    planner = PlanningAdManagerClient()
+    service = planner.GetService('LineItemService')
+    service.createLineItems([{'name': 'li'}] * 10)
+    for _ in range(4):
+        planner.calls.append(dict(planner.calls[0], concurrent=True))
+
+    report = planner.get_report(max_workers=2)
+
+    seconds = estimate_call_seconds('createLineItems', 10)
+    assert report['methods']['LineItemService.createLineItems']['calls'] == 5
+    assert report['counts']['line_items'] == 50
+    assert report['projected_seconds'] == round(seconds + 4 * seconds / 2, 2)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Tests of the price bucket expansion against the float loop it replaced.
+"""
+
+import math
+import os
+import sys
+
+import pytest
+
+# Add the current and parent directories to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+for path in (current_dir, parent_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from Openwrap_DFP_Setup.tasks import price_buckets
+from Openwrap_DFP_Setup.tasks.price_buckets import expand_price_ranges
+from Openwrap_DFP_Setup.tasks.price_utils import num_to_str
+
+
+def expand_with_float_loop(ranges):
+    """The bucket expansion index() used to do inline"""
+    expanded_prices = []
+    for start, end, gran, rate_id in ranges:
+        if gran == -1:
+            pwtecp_values = [f"{int(x)}." for x in range(int(math.ceil(start)), int(math.floor(end)) + 1)]
+            expanded_prices.append({
+                'start_range': num_to_str(start, 2),
+                'end_range': num_to_str(end, 2),
+                'granularity': '-1',
+                'rate_id': rate_id,
+                'pwtecp_values': pwtecp_values,
+                'is_catch_all': True
+            })
+        else:
+            current = start
+            while current <= end + 1e-8:
+                bucket_start = current
+                bucket_end = min(current + gran, end)
+                pwtecp_values = []
+                x = bucket_start
+                while x < bucket_end:
+                    pwtecp_values.append(f"{x:.2f}")
+                    x = round(x + 0.01, 2)
+                expanded_prices.append({
+                    'start_range': num_to_str(current, 2),
+                    'granularity': num_to_str(gran, 2),
+                    'rate_id': rate_id,
+                    'pwtecp_values': pwtecp_values
+                })
+                current = round(current + gran, 8)
+    return expanded_prices
+
+
+def drop_shared_cents(expanded_prices):
+    """
+    Drops the float loop's drift: a bucket whose end rounds a hair past the
+    next bucket's start also targets that bucket's first cent.
+    """
+    expanded_prices = [dict(bucket) for bucket in expanded_prices]
+    for bucket, next_bucket in zip(expanded_prices, expanded_prices[1:]):
+        if (bucket['pwtecp_values'] and next_bucket['pwtecp_values']
+                and not bucket.get('is_catch_all')
+                and bucket['pwtecp_values'][-1] == next_bucket['pwtecp_values'][0]):
+            bucket['pwtecp_values'] = bucket['pwtecp_values'][:-1]
+    return expanded_prices
+
+
+@pytest.fixture(params=['numpy', 'pure python'])
+def numpy_or_not(request, monkeypatch):
+    if request.param == 'numpy':
+        if price_buckets.np is None:
+            pytest.skip('numpy is not installed')
+    else:
+        monkeypatch.setattr(price_buckets, 'np', None)
+
+
+@pytest.mark.parametrize('ranges', [
+    # 0.01 granularity, each bucket is a single cent
+    [(0.01, 5.00, 0.01, '1')],
+    # Granularities that don't divide the range, so the last bucket is short
+    [(1.00, 3.00, 0.03, '2'), (0.10, 0.95, 0.25, '3')],
+    # Catch-alls, with and without integer bounds
+    [(5.00, 20.00, -1, '4'), (20.50, 25.50, -1, '5')],
+    # Up to the cap of the precomputed price strings, and past it
+    [(499.00, 500.00, 0.01, '6'), (499.50, 502.00, 0.10, '7'), (500.00, 510.00, -1, '8')],
+])
+def test_expansion_matches_the_float_loop(numpy_or_not, ranges):
+    expected = drop_shared_cents(expand_with_float_loop(ranges))
+
+    assert expand_price_ranges(ranges).to_dicts() == expected
+
+
+def test_each_cent_is_in_one_bucket(numpy_or_not):
+    ranges = [(0.01, 20.00, 0.01, '1'), (20.00, 50.00, 0.03, '2')]
+    float_values = [value for bucket in expand_with_float_loop(ranges)
+                    for value in bucket['pwtecp_values']]
+    values = [value for bucket in expand_price_ranges(ranges)
+              for value in bucket['pwtecp_values']]
+
+    assert len(float_values) > len(set(float_values))
+    assert len(values) == len(set(values)) == 4999
+
+
+def test_wide_fine_grained_range_has_no_float_drift(numpy_or_not):
+    buckets = expand_price_ranges([(0.01, 500.00, 0.01, '1')])
+
+    assert len(buckets) == 50000
+    assert buckets.num_pwtecp_values == 49999
+    assert buckets[-2]['start_range'] == '499.99'
+    assert list(buckets[-2]['pwtecp_values']) == ['499.99']
+    # The bucket at the end of the range is empty, as with the old loop
+    assert buckets[-1]['start_range'] == '500.00'
+    assert list(buckets[-1]['pwtecp_values']) == []
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Tests of the line item setup pipeline against the fake DFP backend.
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add the current and parent directories to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+for path in (current_dir, parent_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from Openwrap_DFP_Setup import constant
+from Openwrap_DFP_Setup.dfp import create_line_items
+from Openwrap_DFP_Setup.dfp.associate_line_items_and_creatives import create_line_items_and_licas
+from Openwrap_DFP_Setup.dfp.client import use_client
+from Openwrap_DFP_Setup.dfp.create_creatives import create_creative_config, resolve_creatives
+from Openwrap_DFP_Setup.dfp.create_orders import assign_order_shards
+from Openwrap_DFP_Setup.dfp.exceptions import DFPBatchException, FakeServiceError
+from Openwrap_DFP_Setup.dfp.fake_client import FakeAdManagerClient
+from Openwrap_DFP_Setup.dfp.journal import SetupJournal, get_lica_key
+from jobs import FAILED, QUEUED, JobStore
+from setup_pipeline import run_lineitem_setup
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(constant, 'BATCH_RETRY_BACKOFF_SECONDS', 0)
+
+
+@pytest.fixture
+def fake():
+    client = FakeAdManagerClient(latency_scale=0)
+    with use_client(client):
+        yield client
+
+
+def build_form(buckets, creatives=1, sizes='300x250'):
+    """A setup form of `buckets` line items at 0.01 granularity"""
+    return {
+        'order_name': 'test-order',
+        'user_email': 'test@example.com',
+        'advertiser_name': 'Test Advertiser',
+        'network_code': 'fake',
+        'lineitem_type': 'PRICE_PRIORITY',
+        'openwrap_setup_type': 'WEB',
+        'creative_sizes': sizes,
+        'num_creatives': str(creatives),
+        'ranges_count': '1',
+        'start_range_0': '0.01',
+        'end_range_0': '%.2f' % (buckets * 0.01),
+        'granularity_0': '0.01',
+        'rate_id_0': '2',
+    }
+
+
+def add_order(fake, name):
+    return fake.add('Orders', name=name, advertiserId=1, traffickerId=1)
+
+
+def line_item_configs(order_id, count, prefix='li'):
+    return [{
+        'orderId': order_id,
+        'name': f'{prefix}{i}',
+        'lineItemType': 'PRICE_PRIORITY',
+        'costPerUnit': {'currencyCode': 'USD', 'microAmount': 10000 * (i + 1)},
+    } for i in range(count)]
+
+
+def fail_calls(fake, monkeypatch, method_name, reason, times=None):
+    """Makes calls of `method_name` fail with `reason`, all or the first `times`"""
+    call = fake.call
+    failures = []
+
+    def failing_call(service_name, method, args):
+        if method == method_name and (times is None or len(failures) < times):
+            failures.append(method)
+            raise FakeServiceError(reason, 'injected by the test')
+        return call(service_name, method, args)
+
+    monkeypatch.setattr(fake, 'call', failing_call)
+    return failures
+
+
+def get_licas(fake):
+    return [get_lica_key(lica) for lica in
+            fake.objects.get('LineItemCreativeAssociations', {}).values()]
+
+
+def test_chunk_failure_keeps_created_line_items(fake, monkeypatch):
+    monkeypatch.setattr(constant, 'LINE_ITEMS_LIMIT', 5)
+    order = add_order(fake, 'o')
+
+    # Two chunks of 3 can't both fit in the order; the limit error is not
+    # retried and the other chunks go through
+    with pytest.raises(DFPBatchException) as error:
+        create_line_items.create_line_items(
+            line_item_configs(order['id'], 8), chunk_size=3, max_workers=1)
+
+    assert len(error.value.created_ids) == 5
+    assert len(error.value.errors) == 1
+    assert fake.get_stats()['methods']['LineItemService.createLineItems']['calls'] == 3
+    assert len(fake.objects['LineItems']) == 5
+
+
+def test_lost_create_response_is_looked_up_not_resent(fake, monkeypatch):
+    order = add_order(fake, 'o')
+    create_chunk = create_line_items._create_line_item_chunk
+    calls = []
+
+    def create_then_fail(chunk):
+        calls.append(chunk)
+        ids = create_chunk(chunk)
+        if len(calls) == 1:
+            raise FakeServiceError('ServerError.SERVER_ERROR', 'response lost')
+        return ids
+
+    monkeypatch.setattr(create_line_items, '_create_line_item_chunk', create_then_fail)
+    ids = create_line_items.create_line_items(line_item_configs(order['id'], 3))
+
+    assert len(calls) == 1
+    assert ids == list(fake.objects['LineItems'])
+
+
+def test_lica_failure_fails_the_batch(fake, monkeypatch):
+    order = add_order(fake, 'o')
+    creative = fake.add('Creatives', name='c', advertiserId=1)
+    fail_calls(fake, monkeypatch, 'createLineItemCreativeAssociations',
+               'CommonError.NOT_FOUND')
+
+    with pytest.raises(DFPBatchException) as error:
+        create_line_items_and_licas(line_item_configs(order['id'], 3), [creative['id']])
+
+    assert error.value.counts['failed'] == 3
+    assert error.value.counts['created'] == 0
+    assert error.value.created_ids == list(fake.objects['LineItems'])
+
+
+def test_orders_are_sharded_at_the_limit(fake, monkeypatch):
+    monkeypatch.setattr(constant, 'LINE_ITEMS_LIMIT', 4)
+
+    result = run_lineitem_setup(build_form(10))
+
+    assert result['order_names'] == ['test-order-1', 'test-order-2', 'test-order-3']
+    per_order = {}
+    for line_item in fake.objects['LineItems'].values():
+        per_order[line_item['orderId']] = per_order.get(line_item['orderId'], 0) + 1
+    assert sorted(per_order.values()) == [2, 4, 4]
+
+
+def test_shards_count_the_line_items_of_existing_orders(fake):
+    order = add_order(fake, 'o')
+    for line_item in line_item_configs(order['id'], 3, prefix='old'):
+        fake.add('LineItems', **line_item)
+    fake.add('LineItems', **line_item_configs(order['id'], 1, prefix='new')[0])
+
+    # new0 exists in 'o' and stays there; 'o' has room for one more, the
+    # other six are split evenly over new orders
+    order_names, shards, line_items_by_order = assign_order_shards(
+        'o', [f'new{i}' for i in range(8)], limit=5)
+
+    assert order_names == ['o', 'o-1', 'o-2']
+    assert shards == [0, 0, 1, 1, 1, 2, 2, 2]
+    assert list(line_items_by_order) == [order['id']]
+    assert len(line_items_by_order[order['id']]) == 4
+
+
+def test_resume_creates_only_what_is_missing(fake, monkeypatch, tmp_path):
+    journal = SetupJournal(str(tmp_path / 'journal.db')).for_job('job')
+    form = build_form(20, creatives=2)
+    failures = fail_calls(fake, monkeypatch, 'createLineItemCreativeAssociations',
+                          'CommonError.NOT_FOUND', times=1)
+    monkeypatch.setattr(constant, 'LICAS_PER_REQUEST', 10)
+
+    with pytest.raises(DFPBatchException):
+        run_lineitem_setup(form, journal=journal)
+    assert failures
+    assert len(get_licas(fake)) == 30
+
+    fake.reset_stats()
+    result = run_lineitem_setup(form, journal=journal)
+
+    stats = fake.get_stats()['methods']
+    assert 'LineItemService.createLineItems' not in stats
+    assert stats['LineItemCreativeAssociationService.createLineItemCreativeAssociations']['objects'] == 10
+    assert result['licas']['created'] == 10
+    licas = get_licas(fake)
+    assert len(licas) == len(set(licas)) == 40
+    assert len(fake.objects['LineItems']) == 20
+
+
+def test_resume_requeues_a_failed_job_once(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.db'))
+    job_id = store.create()
+    store.update(job_id, status=FAILED, error='boom')
+
+    assert store.requeue(job_id)
+    assert not store.requeue(job_id)
+    assert store.get(job_id)['status'] == QUEUED
+    assert store.get(job_id)['error'] is None
+
+
+def test_rerun_reconciles_and_backfills_creatives(fake):
+    run_lineitem_setup(build_form(20))
+    fake.reset_stats()
+
+    # More buckets and a second creative: only the new line items are
+    # created, and the new creative is attached to the existing ones too
+    result = run_lineitem_setup(build_form(25, creatives=2))
+
+    assert result['line_item_plan']['create'] == 5
+    assert result['line_item_plan']['skip'] == 20
+    assert result['licas']['created'] == 30
+    licas = get_licas(fake)
+    assert len(licas) == len(set(licas)) == 50
+    # The line items of the order are read once, for sharding and reconciling
+    assert fake.get_stats()['methods']['LineItemService.getLineItemsByStatement']['calls'] == 1
+
+    # Other sizes update every line item and make creatives of that size,
+    # which the updated line items get as well
+    result = run_lineitem_setup(build_form(25, creatives=2, sizes='728x90'))
+
+    assert result['line_item_plan']['update'] == 25
+    assert result['licas']['created'] == 50
+    assert len(fake.objects['LineItems']) == 25
+    licas = get_licas(fake)
+    assert len(licas) == len(set(licas)) == 100
+
+
+def test_creatives_are_reused_by_exact_name(fake, monkeypatch):
+    monkeypatch.setattr(constant, 'CREATIVE_NAMES_PER_STATEMENT', 2)
+    configs = [create_creative_config(name, 1, snippet='s') for name in ('a', 'b', 'c')]
+    existing = resolve_creatives(configs[:2])
+    # Names without a common prefix, and creatives that match none of them
+    for i in range(5):
+        fake.add('Creatives', **create_creative_config(f'other{i}', 1, snippet='s'))
+    fake.reset_stats()
+
+    creative_ids = resolve_creatives(configs + [configs[0]])
+
+    assert creative_ids[:2] == existing
+    assert creative_ids[2] not in existing
+    # Each existing creative is reused once
+    assert creative_ids[3] not in creative_ids[:3]
+    stats = fake.get_stats()['methods']
+    assert stats['CreativeService.getCreativesByStatement']['calls'] == 2
+    assert stats['CreativeService.createCreatives']['objects'] == 2
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Tests of custom targeting lookups and creation against the fake DFP backend.
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add the current and parent directories to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+for path in (current_dir, parent_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from Openwrap_DFP_Setup.dfp.client import use_client
+from Openwrap_DFP_Setup.dfp.create_custom_targeting import create_targeting_values
+from Openwrap_DFP_Setup.dfp.fake_client import FakeAdManagerClient
+from Openwrap_DFP_Setup.tasks.add_new_openwrap_partner import OpenWrapTargetingKeyGen
+from Openwrap_DFP_Setup.tasks.dfp_utils import DFPValueIdGetter
+
+
+@pytest.fixture
+def fake():
+    client = FakeAdManagerClient(latency_scale=0)
+    with use_client(client):
+        yield client
+
+
+def add_key(fake, name, values=()):
+    key = fake.add('CustomTargetingKeys', name=name, displayName=name, type='FREEFORM')
+    for value in values:
+        fake.add('CustomTargetingValues', customTargetingKeyId=key['id'], name=value,
+                 displayName=value, matchType='EXACT')
+    return key
+
+
+def get_value_ids(fake):
+    return {value['name']: value['id'] for value in
+            fake.objects.get('CustomTargetingValues', {}).values()}
+
+
+def test_getter_creates_only_the_missing_values_in_one_batch(fake):
+    key = add_key(fake, 'pwtecp', ['0.01', 'Web'])
+    getter = DFPValueIdGetter('pwtecp', key_id=key['id'])
+    fake.reset_stats()
+
+    ids = getter.get_value_ids(['WEB', '0.01', '0.02', '0.03', '0.02'])
+
+    values = get_value_ids(fake)
+    assert ids == [values['Web'], values['0.01'], values['0.02'], values['0.03'], values['0.02']]
+    create_stats = fake.get_stats()['methods']['CustomTargetingService.createCustomTargetingValues']
+    assert (create_stats['calls'], create_stats['objects']) == (1, 2)
+    assert getter.get_value_id('0.03') == values['0.03']
+    assert fake.get_stats()['api_calls'] == 1
+
+
+def test_values_another_setup_created_are_found(fake):
+    key = add_key(fake, 'pwtecp')
+    getter = DFPValueIdGetter('pwtecp', key_id=key['id'])
+    # Another setup creates a value after the values were downloaded
+    fake.add('CustomTargetingValues', customTargetingKeyId=key['id'], name='0.02',
+             displayName='0.02', matchType='EXACT')
+
+    ids = getter.get_value_ids(['0.01', '0.02'])
+
+    values = get_value_ids(fake)
+    assert ids == [values['0.01'], values['0.02']]
+    assert len(values) == 2
+
+
+def test_values_are_created_in_chunks(fake):
+    key = add_key(fake, 'pwtecp')
+
+    created = create_targeting_values([f"{i}." for i in range(5)], key['id'],
+                                      match_type='PREFIX', chunk_size=2)
+
+    assert created == get_value_ids(fake)
+    assert sorted(created) == ['0.', '1.', '2.', '3.', '4.']
+    assert {value['matchType'] for value in fake.objects['CustomTargetingValues'].values()} == {'PREFIX'}
+    assert fake.get_stats()['methods']['CustomTargetingService.createCustomTargetingValues']['calls'] == 3
+
+
+def test_key_gen_looks_the_keys_up_once_and_creates_the_missing_ones(fake):
+    pwtecp = add_key(fake, 'pwtecp', ['0.01'])
+    add_key(fake, 'pwtplt', ['display'])
+    fake.reset_stats()
+
+    key_gen = OpenWrapTargetingKeyGen(creative_type='WEB')
+
+    assert key_gen.pwtecp_key_id == pwtecp['id']
+    assert key_gen.pwtecp_value_getter.get_value_id('0.01') == get_value_ids(fake)['0.01']
+    keys = {key['name']: key['id'] for key in fake.objects['CustomTargetingKeys'].values()}
+    assert (key_gen.pwtbst_key_id, key_gen.pwtpid_key_id) == (keys['pwtbst'], keys['pwtpid'])
+    stats = fake.get_stats()['methods']
+    assert stats['CustomTargetingService.getCustomTargetingKeysByStatement']['calls'] == 1
+    assert stats['CustomTargetingService.createCustomTargetingKeys']['calls'] == 2
+    # The values of each key are downloaded once
+    assert stats['CustomTargetingService.getCustomTargetingValuesByStatement']['calls'] == 4
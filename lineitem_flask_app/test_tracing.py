@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Tests of the DFP call tracing.
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add the current and parent directories to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+for path in (current_dir, parent_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from Openwrap_DFP_Setup import constant
+from Openwrap_DFP_Setup.dfp import tracing
+from Openwrap_DFP_Setup.dfp.fake_client import FakeAdManagerClient
+from Openwrap_DFP_Setup.dfp.tracing import TracedClient, job_context
+
+
+@pytest.fixture
+def tracer(monkeypatch):
+    tracer = tracing.Tracer(max_jobs=2)
+    monkeypatch.setattr(tracing, 'tracer', tracer)
+    return tracer
+
+
+def test_calls_are_traced_per_job_with_estimated_payloads(tracer):
+    client = TracedClient(FakeAdManagerClient(latency_scale=0))
+    service = client.GetService('CreativeService')
+
+    with job_context('job'):
+        service.createCreatives([{'name': f'c{i}', 'advertiserId': 1} for i in range(3)])
+        service.getCreativesByStatement({'query': ''})
+
+    spans = tracer.get_metrics('job')
+    created = spans['dfp.CreativeService.createCreatives']
+    assert (created['count'], created['results']) == (1, 3)
+    assert created['payload_bytes'] == 3 * constant.TRACING_OBJECT_BYTES['createCreatives']
+    read = spans['dfp.CreativeService.getCreativesByStatement']
+    assert (read['results'], read['payload_bytes']) == (3, constant.TRACING_OBJECT_BYTES['default'])
+    assert tracer.get_metrics() == spans
+
+
+def test_only_the_most_recent_jobs_are_kept(tracer):
+    for job_id in ('a', 'b', 'c'):
+        with job_context(job_id), tracing.span('work'):
+            pass
+
+    assert tracer.get_job_ids() == ['b', 'c']
+    assert tracer.get_metrics()['work']['count'] == 3
+    assert 'lineitem_span_seconds_count{span="work"} 3' in tracing.format_prometheus()